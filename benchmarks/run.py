@@ -0,0 +1,318 @@
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS_DIR = os.path.join(REPO_ROOT, 'scripts')
+RESULTS_PATH = os.path.join(REPO_ROOT, 'benchmarks', 'results.jsonl')
+CONFIG_TEMPLATE_PATH = os.path.join(REPO_ROOT, 'config', 'cloud-server-policy.conf.template')
+ATTACK_CORPUS_PATH = os.path.join(REPO_ROOT, 'config', 'attack-corpus.jsonl')
+MB = 1024 * 1024
+
+# A metric counts as a regression once it is this much worse than the baseline run
+REGRESSION_THRESHOLD = 0.2
+SUITES = ('extract', 'aws', 'azure', 'oci', 'fortiweb')
+
+# Build zip per cloud: file name marker and disk image member
+BUILDS = {
+    'aws': ('AWS', 'boot.vmdk'),
+    'azure': ('AZURE', 'boot.vhd'),
+    'oci': ('OPC', 'boot.qcow2'),
+}
+BENCH_BUCKET = 'fwb-bench'
+# Placeholder settings for the stand-ins, nothing leaves the machine
+BENCH_ENV = {
+    'AZURE_STORAGE_ACCOUNT': 'benchaccount',
+    'AZURE_RESOURCE_GROUP': 'fwb-bench',
+    'AZURE_LOCATION': 'eastus',
+    'AZURE_SUBSCRIPTION_ID': '00000000-0000-0000-0000-000000000000',
+    'OCI_REGION': 'us-ashburn-1',
+    'OCI_COMPARTMENT_ID': 'ocid1.compartment.oc1..bench',
+    'OCI_BUCKET_NAME': BENCH_BUCKET,
+    'OCI_NAMESPACE': 'bench',
+}
+
+def make_build_zip(directory, cloud, size_mb):
+    """Write a build zip whose disk image is half random data and half zeros, like a sparse disk"""
+    marker, member = BUILDS[cloud]
+    zip_path = os.path.join(directory, f"FWB_{marker}-v7.6-build9001-FORTINET.zip")
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED, compresslevel=1) as zip_ref:
+        with zip_ref.open(f"image/{member}", 'w', force_zip64=True) as f:
+            for chunk in range(size_mb):
+                f.write(os.urandom(MB) if chunk % 2 == 0 else bytes(MB))
+    return zip_path, member
+
+def timed(function, *args, **kwargs):
+    started = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+def quiet(verbose):
+    """Swallow the scripts' progress output unless asked for it"""
+    return contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+
+def load_import_script(cloud):
+    return importlib.import_module(f"import-fwb-image-{cloud}")
+
+def bench_extract(builds, args, metrics):
+    """Cold extraction into an empty cache, then a cache hit"""
+    import fwb_cache
+    for cloud, (zip_path, member) in builds.items():
+        shutil.rmtree(fwb_cache.CACHE_DIR, ignore_errors=True)
+        with quiet(args.verbose):
+            (path, digest), seconds = timed(fwb_cache.extract_cached, zip_path, member)
+            _, cached_seconds = timed(fwb_cache.extract_cached, zip_path, member)
+        metrics[f"extract.{cloud}_mb_s"] = os.path.getsize(path) / MB / seconds
+        metrics[f"extract.{cloud}_cached_ms"] = cached_seconds * 1000
+
+def count_import_calls(cloud, module, stand_in, zip_path, args, metrics, **kwargs):
+    """Run a first import and an unchanged re-import, recording their duration and API calls"""
+    from fwb_common import Job, StageStatus
+    job = Job.from_zip(cloud, zip_path)
+    for run in ('import', 'reimport'):
+        stand_in.calls.clear()
+        with quiet(args.verbose):
+            _, seconds = timed(module.run_import, job, StageStatus(), **kwargs)
+        metrics[f"{cloud}.{run}_s"] = seconds
+        metrics[f"{cloud}.calls_per_{run}"] = sum(stand_in.calls.values())
+        if args.verbose:
+            print(f"[INFO] {cloud} {run} calls: {dict(stand_in.calls)}")
+
+def bench_aws(builds, args, metrics):
+    from benchmarks.stand_ins import AwsStandIn
+    import fwb_cache
+    zip_path, member = builds['aws']
+    module = load_import_script('aws')
+    stand_in = AwsStandIn(BENCH_BUCKET)
+    module.aws_client = stand_in.client
+    try:
+        with quiet(args.verbose):
+            (path, digest) = fwb_cache.extract_cached(zip_path, member)
+            _, seconds = timed(module.upload_to_s3, path, BENCH_BUCKET, 'bench/upload.vmdk', digest)
+            _, stream_seconds = timed(module.stream_zip_member_to_s3, zip_path, member, BENCH_BUCKET,
+                                      'bench/stream.vmdk', digest=digest)
+        metrics['aws.upload_mb_s'] = os.path.getsize(path) / MB / seconds
+        metrics['aws.stream_upload_mb_s'] = os.path.getsize(path) / MB / stream_seconds
+        count_import_calls('aws', module, stand_in, zip_path, args, metrics, bucket=BENCH_BUCKET)
+    finally:
+        stand_in.stop()
+
+def bench_azure(builds, args, metrics):
+    from benchmarks.stand_ins import AzureStandIn
+    import fwb_cache
+    zip_path, member = builds['azure']
+    module = load_import_script('azure')
+    stand_in = AzureStandIn(BENCH_ENV['AZURE_STORAGE_ACCOUNT'])
+    module.azure_blob_service_client = stand_in.blob_service_client
+    module.azure_compute_client = stand_in.compute_client
+    try:
+        with quiet(args.verbose):
+            (path, digest) = fwb_cache.extract_cached(zip_path, member)
+            _, seconds = timed(module.upload_to_blob_storage, path, BENCH_BUCKET, 'bench/upload.vhd', digest=digest)
+        metrics['azure.upload_mb_s'] = os.path.getsize(path) / MB / seconds
+        count_import_calls('azure', module, stand_in, zip_path, args, metrics, container=BENCH_BUCKET)
+    finally:
+        stand_in.stop()
+
+def bench_oci(builds, args, metrics):
+    from benchmarks.stand_ins import OciStandIn
+    import fwb_cache
+    zip_path, member = builds['oci']
+    module = load_import_script('oci')
+    stand_in = OciStandIn()
+    module.oci_object_storage_client = module.oci_compute_client = module.oci_work_request_client = stand_in.client
+    module.JOURNAL_DIR = os.path.join(args.work_dir, 'oci-journal')
+    with quiet(args.verbose):
+        (path, digest) = fwb_cache.extract_cached(zip_path, member)
+        _, seconds = timed(module.upload_to_object_storage, path, BENCH_BUCKET, 'bench/upload.qcow2',
+                           object_storage_client=stand_in, digest=digest)
+    metrics['oci.upload_mb_s'] = os.path.getsize(path) / MB / seconds
+    count_import_calls('oci', module, stand_in, zip_path, args, metrics, bucket_name=BENCH_BUCKET)
+
+def bench_fortiweb(builds, args, metrics):
+    """Per-check latency of configure_fortiweb and run_tests_for_instance against a local FortiWeb stand-in"""
+    from benchmarks.stand_ins import FortiWebStandIn
+    stand_in = FortiWebStandIn()
+    # The helpers read the SSH port once, on import
+    os.environ['FORTIWEB_SSH_PORT'] = str(stand_in.ssh_port)
+    from tests.common import test_utils
+    from tests.common.load_test import LatencyHistogram
+    if not args.verbose:
+        test_utils.logger.setLevel(logging.WARNING)
+    test_utils.CONFIG_CACHE_PATH = os.path.join(args.work_dir, 'fwb_config_cache.json')
+    ip, username, password = '127.0.0.1', stand_in.username, stand_in.password
+    configs = [test_utils.process_template(CONFIG_TEMPLATE_PATH, pool_ips) for pool_ips in ('10.0.0.10', '10.0.0.11')]
+
+    def measure(name, function, *call_args, **call_kwargs):
+        """Time the first call on its own, then the percentiles of the following ones"""
+        _, seconds = timed(function, *call_args, **call_kwargs)
+        metrics[f"{name}.cold_ms"] = seconds * 1000
+        histogram = LatencyHistogram()
+        for _ in range(args.iterations):
+            _, seconds = timed(function, *call_args, **call_kwargs)
+            histogram.record(seconds)
+        metrics[f"{name}.p50_ms"] = histogram.percentile(50) * 1000
+        metrics[f"{name}.p95_ms"] = histogram.percentile(95) * 1000
+
+    def incremental_change():
+        # Every call moves the server pool, so exactly one block is pushed
+        configs.reverse()
+        test_utils.configure_fortiweb(ip, username, password, configs[0], incremental=True)
+
+    try:
+        measure('configure_fortiweb.full', test_utils.configure_fortiweb, ip, username, password, configs[0])
+        measure('configure_fortiweb.incremental_unchanged', test_utils.configure_fortiweb, ip, username, password,
+                configs[0], incremental=True)
+        measure('configure_fortiweb.incremental_changed', incremental_change)
+        stand_in.calls.clear()
+        incremental_change()
+        metrics['configure_fortiweb.incremental_changed.ssh_calls'] = stand_in.calls['ssh.exec']
+
+        https_ip = stand_in.https_address
+        measure('run_tests_for_instance', test_utils.run_tests_for_instance, 'bench', https_ip)
+        measure('test_http_healthcheck', test_utils.test_http_healthcheck, https_ip)
+        measure('test_blocked_user_agent', test_utils.test_blocked_user_agent, https_ip)
+        stand_in.calls.clear()
+        test_utils.run_tests_for_instance('bench', https_ip)
+        metrics['run_tests_for_instance.https_calls'] = stand_in.calls['https.GET']
+        check_attack_paths(stand_in, https_ip)
+    finally:
+        test_utils.close_ssh_sessions()
+        test_utils.close_http_sessions()
+        stand_in.stop()
+
+def check_attack_paths(stand_in, ip):
+    """Fail unless the path entries of the attack corpus reach the server exactly as written"""
+    import requests
+    from urllib.parse import quote
+    from tests.common.attack_replay import read_corpus, send_attack
+    with requests.Session() as session:
+        for entry in read_corpus(ATTACK_CORPUS_PATH):
+            if entry['location'] != 'path':
+                continue
+            status = send_attack(session, ip, entry)
+            target = stand_in.request_targets[-1]
+            if target != '/' + quote(entry['payload'].lstrip('/'), safe='/%?=&') or status != 403:
+                raise RuntimeError(f"Attack path {entry['payload']!r} arrived as {target!r} with status {status}")
+
+SUITE_RUNNERS = {
+    'extract': bench_extract,
+    'aws': bench_aws,
+    'azure': bench_azure,
+    'oci': bench_oci,
+    'fortiweb': bench_fortiweb,
+}
+
+def git_revision():
+    """Return (commit, dirty) of the working tree, or ('unknown', False) outside a git checkout"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        changes = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_ROOT,
+                                 capture_output=True, text=True, check=True).stdout.strip()
+        return commit, bool(changes)
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown', False
+
+def load_results(path):
+    try:
+        with open(path, 'r') as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except OSError:
+        return []
+
+def find_baseline(results, commit, size_mb):
+    """The latest run of an earlier commit, or the latest run at all if this commit is the only one"""
+    # Throughput depends on the image size, only runs with the same size compare
+    results = [result for result in results if result.get('size_mb') == size_mb]
+    for result in reversed(results):
+        if result['commit'] != commit:
+            return result
+    return results[-1] if results else None
+
+def higher_is_better(name):
+    return name.endswith('_mb_s')
+
+def compare(metrics, baseline, threshold=REGRESSION_THRESHOLD):
+    """Print every metric next to its baseline value and return the names of those that regressed"""
+    regressions = []
+    base = baseline['metrics'] if baseline else {}
+    print(f"\n{'metric':<52} {'value':>10} {'baseline':>10} {'change':>8}")
+    for name, value in sorted(metrics.items()):
+        previous = base.get(name)
+        if not previous:
+            print(f"{name:<52} {value:>10.2f} {'-':>10} {'-':>8}")
+            continue
+        change = (value - previous) / previous
+        worse = -change if higher_is_better(name) else change
+        flag = ""
+        if worse > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"{name:<52} {value:>10.2f} {previous:>10.2f} {change:>+8.0%}{flag}")
+    if baseline:
+        print(f"\n[INFO] Baseline: {baseline['commit']}{' (dirty)' if baseline.get('dirty') else ''} from {baseline['time']}")
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the image import scripts and test utilities offline, against local stand-ins.")
+    parser.add_argument("--only", action="append", choices=SUITES, help="Run only this suite (repeatable, default: all)")
+    parser.add_argument("--size-mb", type=int, default=64, help="Size of the generated disk images")
+    parser.add_argument("--iterations", type=int, default=20, help="Timed calls per latency check")
+    parser.add_argument("--poll-interval", type=float, default=0.1, help="Shortest status poll interval, so imports are not dominated by waiting")
+    parser.add_argument("--results", default=RESULTS_PATH, help="JSON lines file the results are appended to and compared against")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD, help="Relative change that counts as a regression")
+    parser.add_argument("--no-save", action="store_true", help="Compare against earlier results without recording this run")
+    parser.add_argument("--check", action="store_true", help="Exit with an error if any metric regressed")
+    parser.add_argument("--verbose", action="store_true", help="Show the output of the scripts under test")
+
+    args = parser.parse_args()
+    suites = args.only or SUITES
+
+    args.work_dir = tempfile.mkdtemp(prefix='fwb-bench-')
+    # Keep the caches and journals of the benchmark away from real imports
+    os.environ.update(BENCH_ENV, FWB_EXTRACT_CACHE=os.path.join(args.work_dir, 'cache'),
+                      FWB_IMPORT_JOURNAL=os.path.join(args.work_dir, 'journal.db'))
+    sys.path.insert(0, SCRIPTS_DIR)
+    import fwb_poller
+    fwb_poller.MIN_POLL_INTERVAL = args.poll_interval
+    if not args.verbose:
+        # Request logs of the local endpoints
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        logging.getLogger('paramiko').setLevel(logging.WARNING)
+
+    metrics = {}
+    try:
+        builds = {}
+        if set(suites) - {'fortiweb'}:
+            print(f"[INFO] Generating {args.size_mb} MB build images in {args.work_dir}")
+            builds = {cloud: make_build_zip(args.work_dir, cloud, args.size_mb) for cloud in BUILDS}
+        for suite in suites:
+            print(f"[INFO] Running {suite} benchmarks...")
+            SUITE_RUNNERS[suite](builds, args, metrics)
+    finally:
+        shutil.rmtree(args.work_dir, ignore_errors=True)
+
+    commit, dirty = git_revision()
+    results = load_results(args.results)
+    regressions = compare(metrics, find_baseline(results, commit, args.size_mb), args.threshold)
+    if not args.no_save:
+        record = {'commit': commit, 'dirty': dirty, 'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                  'size_mb': args.size_mb, 'iterations': args.iterations, 'metrics': metrics}
+        with open(args.results, 'a') as f:
+            f.write(json.dumps(record) + "\n")
+        print(f"[INFO] Results of {commit}{' (dirty)' if dirty else ''} appended to {args.results}")
+    if regressions:
+        print(f"[WARNING] {len(regressions)} metric(s) regressed by more than {args.threshold:.0%}: {', '.join(regressions)}")
+        if args.check:
+            sys.exit(1)
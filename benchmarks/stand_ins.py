@@ -0,0 +1,449 @@
+import datetime
+import hashlib
+import itertools
+import os
+import paramiko
+import socket
+import ssl
+import tempfile
+import threading
+import types
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# Local stand-ins for the cloud APIs and FortiWeb endpoints, so the import scripts and test
+# utilities can be measured offline. Every stand-in counts the API calls made against it.
+
+BENCH_REGION = 'us-east-1'
+
+class CallCounter(Counter):
+    """API call counts by operation name, safe to update from many threads"""
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+
+    def add(self, name):
+        with self._lock:
+            self[name] += 1
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def _serve(server):
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+def _response(data=None, headers=None):
+    """Mimic the response object returned by the OCI SDK"""
+    return types.SimpleNamespace(data=data, headers=headers or {}, has_next_page=False, next_page=None)
+
+class AwsStandIn:
+    """Local S3 and EC2 endpoint (moto server) plus an emulated EC2 image import API
+
+    moto does not implement ImportSnapshot, so import tasks are emulated on top of it: each
+    task creates a real snapshot on the endpoint and completes on its first status call.
+    """
+
+    def __init__(self, bucket):
+        from moto.server import ThreadedMotoServer
+        self.calls = CallCounter()
+        self.bucket = bucket
+        self.port = free_port()
+        self.server = ThreadedMotoServer(ip_address='127.0.0.1', port=self.port, verbose=False)
+        self.server.start()
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._tasks = {}
+        self._task_ids = itertools.count(1)
+        # Calls made to emulate the import API are not counted against the scripts
+        self._backend = self._create_client('ec2')
+        self._create_client('s3').create_bucket(Bucket=bucket)
+        # moto loads its AMI catalog on the first image call, keep that out of the measurements
+        self._backend.describe_images(Owners=['self'])
+
+    def _create_client(self, service):
+        import boto3
+        session = boto3.session.Session(aws_access_key_id='bench', aws_secret_access_key='bench', region_name=BENCH_REGION)
+        return session.client(service, endpoint_url=f"http://127.0.0.1:{self.port}")
+
+    def client(self, service, region=None):
+        """Drop-in for fwb_clients.aws_client"""
+        with self._lock:
+            if service not in self._clients:
+                client = self._create_client(service)
+                client.meta.events.register('before-call', self._count)
+                if service == 'ec2':
+                    client = _ImportEmulation(client, self)
+                self._clients[service] = client
+            return self._clients[service]
+
+    def _count(self, model, **kwargs):
+        self.calls.add(f"{model.service_model.service_name}.{model.name}")
+
+    def import_snapshot(self, Description, DiskContainer, **kwargs):
+        self.calls.add('ec2.ImportSnapshot')
+        volume_id = self._backend.create_volume(Size=1, AvailabilityZone=f"{BENCH_REGION}a")['VolumeId']
+        snapshot_id = self._backend.create_snapshot(VolumeId=volume_id, Description=Description)['SnapshotId']
+        task_id = f"import-snap-{next(self._task_ids):017x}"
+        self._tasks[task_id] = snapshot_id
+        return {'ImportTaskId': task_id, 'Description': Description}
+
+    def describe_import_snapshot_tasks(self, ImportTaskIds, **kwargs):
+        self.calls.add('ec2.DescribeImportSnapshotTasks')
+        return {'ImportSnapshotTasks': [
+            {'ImportTaskId': task_id,
+             'SnapshotTaskDetail': {'Status': 'completed', 'Progress': '100', 'SnapshotId': self._tasks[task_id]}}
+            for task_id in ImportTaskIds if task_id in self._tasks
+        ]}
+
+    def stop(self):
+        self.server.stop()
+
+class _ImportEmulation:
+    """EC2 client whose import snapshot calls go to the emulation, everything else to the endpoint"""
+
+    def __init__(self, client, stand_in):
+        self._client = client
+        self._stand_in = stand_in
+
+    def import_snapshot(self, **kwargs):
+        return self._stand_in.import_snapshot(**kwargs)
+
+    def describe_import_snapshot_tasks(self, **kwargs):
+        return self._stand_in.describe_import_snapshot_tasks(**kwargs)
+
+    def create_tags(self, Resources, Tags):
+        # Import task IDs only exist in the emulation
+        if all(resource.startswith('import-snap-') for resource in Resources):
+            self._stand_in.calls.add('ec2.CreateTags')
+            return {}
+        return self._client.create_tags(Resources=Resources, Tags=Tags)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+class _BlobHandler(BaseHTTPRequestHandler):
+    """Just enough of the Blob service REST API for page blob uploads"""
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes, Nagle would hold the body back a delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, headers=None, body=b''):
+        self.send_response(status)
+        self.send_header('x-ms-request-id', '00000000-0000-0000-0000-000000000000')
+        self.send_header('x-ms-version', '2025-01-05')
+        self.send_header('Date', self.date_time_string())
+        self.send_header('Last-Modified', self.date_time_string())
+        self.send_header('ETag', '"0x8DC0000000000000"')
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_DELETE(self):
+        blobs = self.server.blobs
+        path = urlsplit(self.path).path
+        self.server.calls.add('blob.Delete')
+        if blobs.pop(path, None) is None:
+            body = (b'<?xml version="1.0" encoding="utf-8"?><Error><Code>BlobNotFound</Code>'
+                    b'<Message>The specified blob does not exist.</Message></Error>')
+            self._reply(404, {'x-ms-error-code': 'BlobNotFound', 'Content-Type': 'application/xml'}, body)
+        else:
+            self._reply(202)
+
+    def do_PUT(self):
+        url = urlsplit(self.path)
+        comp = parse_qs(url.query).get('comp', [''])[0]
+        length = int(self.headers.get('Content-Length') or 0)
+        remaining = length
+        while remaining:
+            chunk = self.rfile.read(min(remaining, 1024 * 1024))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+        if comp == 'page':
+            self.server.calls.add('blob.PutPage')
+            self._reply(201, {'x-ms-blob-sequence-number': '0', 'x-ms-request-server-encrypted': 'true'})
+        elif comp == 'metadata':
+            self.server.calls.add('blob.SetMetadata')
+            self._reply(200)
+        else:
+            self.server.calls.add('blob.PutBlob')
+            self.server.blobs[url.path] = int(self.headers.get('x-ms-blob-content-length') or 0)
+            self._reply(201)
+
+class AzureStandIn:
+    """Local Blob service endpoint for page blobs and an in-memory managed image API"""
+
+    def __init__(self, account='benchaccount'):
+        self.calls = CallCounter()
+        server = ThreadingHTTPServer(('127.0.0.1', 0), _BlobHandler)
+        server.daemon_threads = True
+        server.blobs = {}
+        server.calls = self.calls
+        self.server = _serve(server)
+        self.account_url = f"http://127.0.0.1:{server.server_address[1]}/{account}"
+        self.images = {}
+        self._blob_service_client = None
+
+    def blob_service_client(self, storage_account=None):
+        """Drop-in for fwb_clients.azure_blob_service_client"""
+        if self._blob_service_client is None:
+            from azure.storage.blob import BlobServiceClient
+            self._blob_service_client = BlobServiceClient(account_url=self.account_url)
+        return self._blob_service_client
+
+    def compute_client(self, subscription_id=None):
+        """Drop-in for fwb_clients.azure_compute_client"""
+        return types.SimpleNamespace(images=_AzureImages(self))
+
+    def stop(self):
+        self.server.shutdown()
+
+class _AzureImages:
+    def __init__(self, stand_in):
+        self._stand_in = stand_in
+
+    def get(self, resource_group_name, image_name):
+        from azure.core.exceptions import ResourceNotFoundError
+        self._stand_in.calls.add('compute.images.get')
+        if image_name not in self._stand_in.images:
+            raise ResourceNotFoundError(f"The Resource 'Microsoft.Compute/images/{image_name}' was not found.")
+        return self._stand_in.images[image_name]
+
+    def begin_delete(self, resource_group_name, image_name):
+        self._stand_in.calls.add('compute.images.begin_delete')
+        self._stand_in.images.pop(image_name, None)
+        return types.SimpleNamespace(result=lambda: None)
+
+    def begin_create_or_update(self, resource_group_name, image_name, parameters):
+        self._stand_in.calls.add('compute.images.begin_create_or_update')
+        image = types.SimpleNamespace(name=image_name, provisioning_state='Succeeded', tags=parameters.get('tags'))
+        self._stand_in.images[image_name] = image
+        return types.SimpleNamespace(result=lambda: image)
+
+class OciStandIn:
+    """In-memory Object Storage, Compute and Work Requests APIs"""
+
+    def __init__(self):
+        self.calls = CallCounter()
+        self.uploads = {}
+        self.objects = {}
+        self.images = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _new_id(self, kind):
+        with self._lock:
+            return f"ocid1.{kind}.oc1..bench{next(self._ids):08d}"
+
+    def _count(self, name):
+        self.calls.add(name)
+
+    # Object Storage
+    def create_multipart_upload(self, namespace, bucket_name, create_multipart_upload_details):
+        self._count('object_storage.create_multipart_upload')
+        upload_id = self._new_id('upload')
+        self.uploads[upload_id] = {}
+        return _response(types.SimpleNamespace(upload_id=upload_id))
+
+    def upload_part(self, namespace, bucket_name, object_name, upload_id, upload_part_num, upload_part_body):
+        self._count('object_storage.upload_part')
+        # The service checksums every part, so does the stand-in
+        etag = hashlib.md5(upload_part_body).hexdigest()
+        self.uploads[upload_id][upload_part_num] = (etag, len(upload_part_body))
+        return _response(headers={'etag': etag})
+
+    def list_multipart_upload_parts(self, namespace, bucket_name, object_name, upload_id, **kwargs):
+        self._count('object_storage.list_multipart_upload_parts')
+        return _response([types.SimpleNamespace(part_number=number, etag=etag)
+                          for number, (etag, size) in sorted(self.uploads[upload_id].items())])
+
+    def commit_multipart_upload(self, namespace, bucket_name, object_name, upload_id, commit_multipart_upload_details):
+        self._count('object_storage.commit_multipart_upload')
+        parts = self.uploads.pop(upload_id)
+        self.objects[(bucket_name, object_name)] = sum(size for etag, size in parts.values())
+        return _response()
+
+    # Compute
+    def list_images(self, compartment_id, display_name=None, lifecycle_state=None, **kwargs):
+        self._count('compute.list_images')
+        return _response([image for image in self.images.values()
+                          if display_name in (None, image.display_name)
+                          and lifecycle_state in (None, image.lifecycle_state)])
+
+    def delete_image(self, image_id):
+        self._count('compute.delete_image')
+        self.images.pop(image_id, None)
+        return _response()
+
+    def create_image(self, create_image_details):
+        self._count('compute.create_image')
+        image = types.SimpleNamespace(id=self._new_id('image'), display_name=create_image_details.display_name,
+                                      lifecycle_state='AVAILABLE', freeform_tags={})
+        self.images[image.id] = image
+        return _response(image, {'opc-work-request-id': self._new_id('workrequest')})
+
+    def get_image(self, image_id):
+        self._count('compute.get_image')
+        return _response(self.images[image_id])
+
+    def update_image(self, image_id, update_image_details):
+        self._count('compute.update_image')
+        self.images[image_id].freeform_tags = update_image_details.freeform_tags
+        return _response(self.images[image_id])
+
+    # Work Requests
+    def get_work_request(self, work_request_id):
+        self._count('work_requests.get_work_request')
+        return _response(types.SimpleNamespace(status='SUCCEEDED', percent_complete=100.0))
+
+    def client(self):
+        """Drop-in for the fwb_clients OCI client factories, one object serves every API"""
+        return self
+
+def _self_signed_certificate(directory):
+    """Write a self-signed certificate and key for 127.0.0.1, returning (cert path, key path)"""
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from cryptography.x509.oid import NameOID
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'fortiweb-bench')])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    certificate = (x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key())
+                   .serial_number(x509.random_serial_number())
+                   .not_valid_before(now - datetime.timedelta(days=1)).not_valid_after(now + datetime.timedelta(days=1))
+                   .sign(key, hashes.SHA256()))
+    cert_path = os.path.join(directory, 'bench.crt')
+    key_path = os.path.join(directory, 'bench.key')
+    with open(cert_path, 'wb') as f:
+        f.write(certificate.public_bytes(serialization.Encoding.PEM))
+    with open(key_path, 'wb') as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.TraditionalOpenSSL,
+                                  serialization.NoEncryption()))
+    return cert_path, key_path
+
+class _PolicyHandler(BaseHTTPRequestHandler):
+    """A server policy that blocks the ApacheBench User-Agent and path traversal like the pushed config does"""
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes, Nagle would hold the body back a delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.server.calls.add('https.GET')
+        # The request-target exactly as it came over the wire
+        self.server.request_targets.append(self.path)
+        blocked = 'ApacheBench' in self.headers.get('User-Agent', '') or '/../' in self.path
+        body = b'Request blocked\n' if blocked else b'<html><body>fwbqa</body></html>\n'
+        self.send_response(403 if blocked else 200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class FortiWebStandIn:
+    """Local HTTPS server policy and paramiko SSH CLI, standing in for a FortiWeb instance
+
+    The CLI keeps the config blocks it is sent and echoes them back on show, which is
+    what configure_fortiweb() relies on for incremental pushes.
+    """
+
+    def __init__(self, username='admin', password='bench'):
+        self.calls = CallCounter()
+        self.username = username
+        self.password = password
+        self.config = {}
+        self._directory = tempfile.mkdtemp(prefix='fwb-bench-')
+        cert_path, key_path = _self_signed_certificate(self._directory)
+
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert_path, key_path)
+        https = ThreadingHTTPServer(('127.0.0.1', 0), _PolicyHandler)
+        https.daemon_threads = True
+        https.calls = self.calls
+        https.request_targets = self.request_targets = deque(maxlen=100)
+        https.socket = context.wrap_socket(https.socket, server_side=True)
+        self.https = _serve(https)
+        # The test helpers build https://{ip}/ URLs, so the port travels with the address
+        self.https_address = f"127.0.0.1:{https.server_address[1]}"
+
+        self.host_key = paramiko.RSAKey.from_private_key_file(key_path)
+        self.ssh_socket = socket.socket()
+        self.ssh_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.ssh_socket.bind(('127.0.0.1', 0))
+        self.ssh_socket.listen(16)
+        self.ssh_port = self.ssh_socket.getsockname()[1]
+        self._transports = []
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                sock, _ = self.ssh_socket.accept()
+            except OSError:
+                return
+            self.calls.add('ssh.connect')
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            transport = paramiko.Transport(sock)
+            transport.add_server_key(self.host_key)
+            transport.start_server(server=_FortiWebCli(self))
+            self._transports.append(transport)
+
+    def execute(self, command):
+        """Apply config blocks and answer show commands the way the FortiWeb CLI does"""
+        from tests.common.test_utils import split_config_blocks
+        self.calls.add('ssh.exec')
+        output = []
+        for line in command.splitlines():
+            if line.startswith('show '):
+                output.append(self.config.get('config ' + ' '.join(line[len('show '):].split()), ''))
+        self.config.update(split_config_blocks(command))
+        return ''.join(output)
+
+    def stop(self):
+        self.https.shutdown()
+        self.ssh_socket.close()
+        for transport in self._transports:
+            transport.close()
+
+class _FortiWebCli(paramiko.ServerInterface):
+    """SSH server side of the stand-in CLI: password auth and exec requests only"""
+
+    def __init__(self, stand_in):
+        self.stand_in = stand_in
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_auth_password(self, username, password):
+        if (username, password) == (self.stand_in.username, self.stand_in.password):
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_channel_request(self, kind, chanid):
+        if kind == 'session':
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel, command):
+        threading.Thread(target=self._run, args=(channel, command.decode()), daemon=True).start()
+        return True
+
+    def _run(self, channel, command):
+        channel.sendall(self.stand_in.execute(command).encode())
+        channel.send_exit_status(0)
+        # Only EOF: a close could overtake the reply to the exec request, the client closes once done reading
+        channel.shutdown_write()
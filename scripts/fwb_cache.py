@@ -0,0 +1,258 @@
+import argparse
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from fwb_common import find_zip_member, extract_with_digest
+
+CACHE_DIR = os.environ.get('FWB_EXTRACT_CACHE', os.path.join(tempfile.gettempdir(), 'fwb_import', 'cache'))
+MAX_CACHE_SIZE = int(float(os.environ.get('FWB_EXTRACT_CACHE_MAX_GB', '50')) * 1024 ** 3)
+# Extractions left half done by a crashed run are removed once their directory is this old
+STALE_EXTRACT_AGE = 3600
+EXTRACT_PREFIX = '.extract-'
+META_FILE = 'meta.json'
+# Held with a shared flock by every run using an entry, evict() needs it exclusively
+LOCK_FILE = '.lock'
+DIGEST_INDEX_FILE = 'digests.json'
+
+_index_lock = threading.Lock()
+# Entry directories this process holds: [lock file, number of holds]
+_held = {}
+_held_lock = threading.Lock()
+
+def _write_json(path, data):
+    """Write JSON atomically so concurrent readers never see a partial file"""
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(temp_path, path)
+
+def _read_json(path, default):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+def _cache_key(info):
+    """Key of a zip member by its central directory entry, which identifies it without reading the zip
+
+    The CRC-32 and sizes change with the member's content, so a rebuilt image gets a new key.
+    """
+    identity = f"{info.filename}:{info.CRC:08x}:{info.file_size}:{info.compress_size}:{info.date_time}"
+    return hashlib.sha256(identity.encode()).hexdigest()[:32]
+
+def _touch(entry_dir, meta):
+    meta['last_used'] = time.time()
+    _write_json(os.path.join(entry_dir, META_FILE), meta)
+
+def _hold_dir(directory):
+    """Take a shared lock on a cache directory, or count one more hold of it, False if the directory is gone"""
+    directory = os.path.abspath(directory)
+    with _held_lock:
+        if directory in _held:
+            _held[directory][1] += 1
+            return True
+        try:
+            lock_file = open(os.path.join(directory, LOCK_FILE), 'a')
+        except FileNotFoundError:
+            return False
+        # Waits for an eviction of the directory, after which the caller finds it gone
+        fcntl.flock(lock_file, fcntl.LOCK_SH)
+        _held[directory] = [lock_file, 1]
+        return True
+
+def _release_dir(directory):
+    directory = os.path.abspath(directory)
+    with _held_lock:
+        if directory not in _held:
+            return
+        _held[directory][1] -= 1
+        if not _held[directory][1]:
+            _held.pop(directory)[0].close()
+
+def _entry_dir(path):
+    """The cache entry directory a cached image lies in, found by its metadata file, or None"""
+    directory = os.path.dirname(os.path.abspath(path))
+    while not os.path.exists(os.path.join(directory, META_FILE)):
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return None
+        directory = parent
+    return directory
+
+def hold(path):
+    """Keep evict() away from the cached extraction holding path until release(), returning whether path exists
+
+    extract_cached() already holds what it returns. The hold ends with the process if it is never released.
+    """
+    entry_dir = _entry_dir(path)
+    if entry_dir is not None and not _hold_dir(entry_dir):
+        return False
+    if os.path.exists(path):
+        return True
+    if entry_dir is not None:
+        _release_dir(entry_dir)
+    return False
+
+def release(path):
+    """End a hold on the cached extraction holding path, once the import is done with it"""
+    path = os.path.abspath(path)
+    with _held_lock:
+        held = [directory for directory in _held if path.startswith(directory + os.sep)]
+    for directory in held:
+        _release_dir(directory)
+
+def extract_cached(zip_path, suffix, cache_dir=CACHE_DIR, max_size=MAX_CACHE_SIZE):
+    """Extract the member ending with suffix into the cache, or reuse an earlier extraction, returning (path, sha256)
+
+    The extraction is held for the caller, who calls release() with the path once done with it.
+    """
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        info = find_zip_member(zip_ref, suffix)
+        entry_dir = os.path.join(cache_dir, _cache_key(info))
+        meta = _read_json(os.path.join(entry_dir, META_FILE), None)
+        if meta and _hold_dir(entry_dir):
+            if os.path.exists(os.path.join(entry_dir, meta['path'])):
+                print(f"[INFO] Reusing cached extraction of {info.filename} from {zip_path}")
+                _touch(entry_dir, meta)
+                return os.path.join(entry_dir, meta['path']), meta['digest']
+            _release_dir(entry_dir)
+
+        # Room is made before extracting, so the cache stays within max_size with the new image in it
+        evict(cache_dir, max_size, room=info.file_size)
+        # Extract into a private directory and move it into place in one rename,
+        # so concurrent imports of the same build never see a partial image
+        os.makedirs(cache_dir, exist_ok=True)
+        temp_dir = tempfile.mkdtemp(prefix=EXTRACT_PREFIX, dir=cache_dir)
+        _hold_dir(temp_dir)
+        try:
+            target_path, digest = extract_with_digest(zip_ref, info, temp_dir)
+            meta = {'path': os.path.relpath(target_path, temp_dir), 'digest': digest, 'size': info.file_size,
+                    'zip': os.path.abspath(zip_path), 'member': info.filename}
+            _touch(temp_dir, meta)
+            try:
+                os.rename(temp_dir, entry_dir)
+            except OSError:
+                # Another import finished the same extraction first, use theirs
+                _release_dir(temp_dir)
+                shutil.rmtree(temp_dir, ignore_errors=True)
+                meta = _read_json(os.path.join(entry_dir, META_FILE), meta)
+                _hold_dir(entry_dir)
+            else:
+                # The lock file moved along with the directory, and so does the hold
+                with _held_lock:
+                    _held[os.path.abspath(entry_dir)] = _held.pop(os.path.abspath(temp_dir))
+        except BaseException:
+            _release_dir(temp_dir)
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            raise
+    return os.path.join(entry_dir, meta['path']), meta['digest']
+
+def known_member_digest(zip_path, suffix, cache_dir=CACHE_DIR):
+    """SHA-256 of a zip member from an earlier extraction or upload of it, or None, without decompressing anything"""
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        info = find_zip_member(zip_ref, suffix)
+        key = _cache_key(info)
+    meta = _read_json(os.path.join(cache_dir, key, META_FILE), None)
+    if meta:
+        return meta['digest']
+    return _read_json(os.path.join(cache_dir, DIGEST_INDEX_FILE), {}).get(key)
+
+def remember_member_digest(zip_path, suffix, digest, cache_dir=CACHE_DIR):
+    """Keep the SHA-256 of a zip member hashed while it was streamed, for known_member_digest"""
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        info = find_zip_member(zip_ref, suffix)
+        key = _cache_key(info)
+    index_path = os.path.join(cache_dir, DIGEST_INDEX_FILE)
+    with _index_lock:
+        os.makedirs(cache_dir, exist_ok=True)
+        index = _read_json(index_path, {})
+        index[key] = digest
+        _write_json(index_path, index)
+
+def list_entries(cache_dir=CACHE_DIR):
+    """Return the metadata of every cache entry with its directory, least recently used first"""
+    entries = []
+    if not os.path.isdir(cache_dir):
+        return entries
+    for name in os.listdir(cache_dir):
+        if name.startswith(EXTRACT_PREFIX):
+            continue
+        entry_dir = os.path.join(cache_dir, name)
+        meta = _read_json(os.path.join(entry_dir, META_FILE), None)
+        if meta is not None:
+            entries.append(dict(meta, dir=entry_dir))
+    return sorted(entries, key=lambda entry: entry['last_used'])
+
+def _remove_unused(directory):
+    """Remove a cache directory unless a run holds it, locked exclusively so no run can take it meanwhile"""
+    try:
+        lock_file = open(os.path.join(directory, LOCK_FILE), 'a')
+    except FileNotFoundError:
+        return False
+    with lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        shutil.rmtree(directory, ignore_errors=True)
+    return True
+
+def _sweep_stale_extracts(cache_dir):
+    now = time.time()
+    for name in os.listdir(cache_dir):
+        directory = os.path.join(cache_dir, name)
+        try:
+            stale = name.startswith(EXTRACT_PREFIX) and now - os.path.getmtime(directory) > STALE_EXTRACT_AGE
+        except OSError:
+            continue
+        if stale and _remove_unused(directory):
+            print(f"[INFO] Removed {name}, left behind by an interrupted extraction")
+
+def evict(cache_dir=CACHE_DIR, max_size=MAX_CACHE_SIZE, room=0):
+    """Remove least recently used extractions until the cache fits in max_size less room, passing over those in use
+
+    Half done extractions of crashed runs are removed as well.
+    """
+    if not os.path.isdir(cache_dir):
+        return 0
+    _sweep_stale_extracts(cache_dir)
+    entries = list_entries(cache_dir)
+    total = sum(entry['size'] for entry in entries)
+    for entry in entries:
+        if total + room <= max_size:
+            break
+        if not _remove_unused(entry['dir']):
+            continue
+        total -= entry['size']
+        print(f"[INFO] Evicted cached {entry['member']} of {entry['zip']} ({entry['size'] // (1024 * 1024)} MB)")
+    if total + room > max_size and total:
+        to_come = f" and {room // (1024 ** 2)} MB to come" if room else ""
+        print(f"[WARNING] Extraction cache holds {total // (1024 ** 2)} MB{to_come}, over its {max_size // (1024 ** 2)} MB cap, "
+              f"but the remaining entries are in use")
+    return total
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect and prune the build image extraction cache.")
+    parser.add_argument("--cache-dir", default=CACHE_DIR, help="Cache directory")
+    parser.add_argument("--max-size-gb", type=float, default=MAX_CACHE_SIZE / 1024 ** 3, help="Evict down to this size")
+    parser.add_argument("--prune", action="store_true", help="Evict least recently used entries over the size cap")
+    parser.add_argument("--clear", action="store_true", help="Remove every cached extraction that no import is using")
+
+    args = parser.parse_args()
+
+    if args.clear:
+        evict(args.cache_dir, 0)
+        print(f"[INFO] Cleared {args.cache_dir}")
+    elif args.prune:
+        evict(args.cache_dir, int(args.max_size_gb * 1024 ** 3))
+    for entry in list_entries(args.cache_dir):
+        size = f"{entry['size'] // (1024 * 1024)} MB"
+        last_used = time.strftime('%Y-%m-%d %H:%M', time.localtime(entry['last_used']))
+        print(f"{last_used}  {size:>12}  {entry['member']}  ({entry['zip']})")
@@ -0,0 +1,81 @@
+import os
+import sys
+import threading
+
+# SDKs are imported on first use so that importing this module, or running --help, stays fast.
+# Clients and credentials are created once per process and shared by every thread; the
+# credential objects cache their tokens, so each cloud authenticates once per process.
+_clients = {}
+_clients_lock = threading.RLock()
+
+def _cached(key, factory):
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = factory()
+        return _clients[key]
+
+def aws_session():
+    """Shared boto3 session, clients are created from it because the default session is not thread-safe"""
+    def create():
+        import boto3
+        return boto3.session.Session()
+    return _cached(('aws', 'session'), create)
+
+def aws_client(service, region=None):
+    """Shared boto3 client for a service and region (default: the configured region)"""
+    return _cached(('aws', service, region), lambda: aws_session().client(service, region_name=region))
+
+def azure_credential():
+    """Shared DefaultAzureCredential, its access tokens are cached and refreshed for the process lifetime"""
+    def create():
+        from azure.identity import DefaultAzureCredential
+        return DefaultAzureCredential()
+    return _cached(('azure', 'credential'), create)
+
+def azure_compute_client(subscription_id=None):
+    """Shared ComputeManagementClient for a subscription (default: AZURE_SUBSCRIPTION_ID)"""
+    subscription_id = subscription_id or os.environ['AZURE_SUBSCRIPTION_ID']
+    def create():
+        from azure.mgmt.compute import ComputeManagementClient
+        return ComputeManagementClient(azure_credential(), subscription_id)
+    return _cached(('azure', 'compute', subscription_id), create)
+
+def azure_blob_service_client(storage_account=None):
+    """Shared BlobServiceClient for a storage account (default: AZURE_STORAGE_ACCOUNT)"""
+    storage_account = storage_account or os.environ['AZURE_STORAGE_ACCOUNT']
+    def create():
+        from azure.storage.blob import BlobServiceClient
+        return BlobServiceClient(
+            account_url=f"https://{storage_account}.blob.core.windows.net",
+            credential=azure_credential()
+        )
+    return _cached(('azure', 'blob', storage_account), create)
+
+def oci_config():
+    """OCI config from ~/.oci/config, read once"""
+    def create():
+        import oci
+        return oci.config.from_file()
+    return _cached(('oci', 'config'), create)
+
+def oci_compute_client():
+    def create():
+        from oci.core import ComputeClient
+        return ComputeClient(oci_config())
+    return _cached(('oci', 'compute'), create)
+
+def oci_object_storage_client():
+    def create():
+        from oci.object_storage import ObjectStorageClient
+        return ObjectStorageClient(oci_config())
+    return _cached(('oci', 'object_storage'), create)
+
+def oci_work_request_client():
+    def create():
+        from oci.work_requests import WorkRequestClient
+        return WorkRequestClient(oci_config())
+    return _cached(('oci', 'work_requests'), create)
+
+# Scripts import this module as fwb_clients and tests as scripts.fwb_clients, both names must share one client cache
+sys.modules.setdefault('fwb_clients', sys.modules[__name__])
+sys.modules.setdefault('scripts.fwb_clients', sys.modules[__name__])
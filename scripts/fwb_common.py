@@ -0,0 +1,183 @@
+import hashlib
+import importlib
+import os
+import re
+import sys
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from fwb_trace import span
+
+# Read size used when streaming a disk image out of a build zip
+COPY_BUFFER_SIZE = 8 * 1024 * 1024
+# Tag/metadata key holding the SHA-256 of the uncompressed disk image
+DIGEST_KEY = 'sha256'
+
+# Markers in the build artifact name that identify the target cloud
+CLOUD_MARKERS = {
+    'aws': ('AWS',),
+    'azure': ('AZURE',),
+    'oci': ('OCI', 'OPC'),
+}
+
+# Image and snapshot names (Job.name) and uploaded object keys ({license_type}/{version}/{build}.ext)
+IMAGE_NAME_PATTERN = re.compile(r'^fwb-(byol|payg)-(v\d+)-(\d+)$')
+OBJECT_NAME_PATTERN = re.compile(r'(?:^|/)(byol|payg)/(v\d+)/(\d+)\.\w+$')
+
+# Per-cloud import scripts, loaded by the pipeline and the inventory
+CLOUD_SCRIPTS = {
+    'aws': 'import-fwb-image-aws',
+    'azure': 'import-fwb-image-azure',
+    'oci': 'import-fwb-image-oci',
+}
+
+# Stages in the order they start, cleanup runs alongside upload
+STAGES = ('extract', 'lookup', 'cleanup', 'upload', 'import', 'register')
+
+def check_environment(required_vars):
+    """Exit with an error if any of the required environment variables is not set"""
+    missing_vars = [var for var in required_vars if not os.getenv(var)]
+    if missing_vars:
+        print(f"[ERROR] Missing required environment variables: {', '.join(missing_vars)}")
+        print("Please set these in the .env file or environment variables")
+        sys.exit(1)
+
+def load_cloud_script(cloud):
+    """Import one of the per-cloud import scripts and check its environment"""
+    module = importlib.import_module(CLOUD_SCRIPTS[cloud])
+    check_environment(getattr(module, 'REQUIRED_VARS', []))
+    return module
+
+def parse_filename(filename):
+    """Parse a build zip filename into (license_type, version, build)"""
+    # Determine license type
+    license_type = 'payg' if 'ONDEMAND' in filename.upper() else 'byol'
+    
+    # Extract version
+    version_match = re.search(r'-v(\d+)(?:\.|-)', filename)
+    version = f'v{version_match.group(1)}' if version_match else 'v7'
+    
+    # Extract build number
+    build_match = re.search(r'-build(\d+)-', filename)
+    build = build_match.group(1) if build_match else '0000'
+    
+    return license_type, version, build
+
+def parse_resource_name(name):
+    """Return (license_type, version, build) of an image name or object key made by an import, or None"""
+    match = IMAGE_NAME_PATTERN.match(name) or OBJECT_NAME_PATTERN.search(name)
+    return match.groups() if match else None
+
+def detect_cloud(filename):
+    """Return the cloud a build zip targets from its name, or None if it cannot be told"""
+    name = os.path.basename(filename).upper()
+    matches = [cloud for cloud, markers in CLOUD_MARKERS.items()
+               if any(re.search(rf'(?<![A-Z]){marker}(?![A-Z])', name) for marker in markers)]
+    return matches[0] if len(matches) == 1 else None
+
+def find_zip_member(zip_ref, suffix):
+    """Return the ZipInfo of the first member ending with suffix"""
+    for info in zip_ref.infolist():
+        if info.filename.endswith(suffix):
+            return info
+    raise Exception(f"{suffix} not found in zip file")
+
+def extract_with_digest(zip_ref, info, dest_dir):
+    """Extract a zip member under dest_dir while hashing it, returning (path, sha256)"""
+    target_path = os.path.join(dest_dir, info.filename)
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    digest = hashlib.sha256()
+    with zip_ref.open(info) as src, open(target_path, 'wb') as dst:
+        while True:
+            chunk = src.read(COPY_BUFFER_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            dst.write(chunk)
+    return target_path, digest.hexdigest()
+
+class Job(namedtuple('Job', ['cloud', 'zip_path', 'license_type', 'version', 'build'])):
+    """One build zip to import into one cloud"""
+
+    @classmethod
+    def from_zip(cls, cloud, zip_path):
+        return cls(cloud, zip_path, *parse_filename(os.path.basename(zip_path)))
+
+    @property
+    def name(self):
+        """Image, snapshot and AMI name shared by every cloud"""
+        return f"fwb-{self.license_type}-{self.version}-{self.build}"
+
+    @property
+    def label(self):
+        return f"{self.cloud}/{self.license_type}-{self.version}-{self.build}"
+
+class StageStatus:
+    """Thread-safe record of the state and duration of every (job, stage)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = {}
+
+    def _set(self, label, stage, state, detail=""):
+        now = time.monotonic()
+        with self._lock:
+            entry = self.stages.setdefault((label, stage), {'started': now, 'ended': None})
+            entry['state'] = state
+            if state == 'running':
+                # Time spent queued for a slot does not count towards the stage
+                entry['started'] = now
+            else:
+                entry['ended'] = now
+            suffix = f" ({now - entry['started']:.1f}s)" if state in ('done', 'failed') else ""
+            # Printed under the lock so lines from concurrent builds don't interleave
+            print(f"[{label}] {stage}: {state}{suffix}{' - ' + detail if detail else ''}")
+
+    @contextmanager
+    def stage(self, label, stage, slot=None):
+        """Mark a stage running for the duration of the block, then done or failed
+
+        With a slot (semaphore), the stage waits for it as 'queued' before it runs.
+        """
+        if slot is not None and not slot.acquire(blocking=False):
+            self._set(label, stage, 'queued')
+            with span(f"{stage} (queued)", label=label):
+                slot.acquire()
+        self._set(label, stage, 'running')
+        try:
+            with span(stage, label=label):
+                yield
+        except BaseException as e:
+            self._set(label, stage, 'failed', str(e))
+            raise
+        finally:
+            if slot is not None:
+                slot.release()
+        self._set(label, stage, 'done')
+
+    def run(self, label, stage, func, *args, **kwargs):
+        """Run func as a stage, for use with executor.submit"""
+        with self.stage(label, stage):
+            return func(*args, **kwargs)
+
+    def skip(self, label, stages, detail, state='skipped'):
+        for stage in stages:
+            self._set(label, stage, state, detail)
+
+    def summary(self, labels):
+        """Return a table with one row per job and one column per stage"""
+        width = max([len('build')] + [len(label) for label in labels]) + 2
+        lines = [f"{'build':<{width}}" + "".join(f"{stage:>18}" for stage in STAGES)]
+        for label in labels:
+            cells = []
+            for stage in STAGES:
+                entry = self.stages.get((label, stage))
+                if entry is None:
+                    cells.append("-")
+                elif entry['state'] == 'done':
+                    cells.append(f"done {entry['ended'] - entry['started']:.0f}s")
+                else:
+                    cells.append(entry['state'])
+            lines.append(f"{label:<{width}}" + "".join(f"{cell:>18}" for cell in cells))
+        return "\n".join(lines)
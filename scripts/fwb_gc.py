@@ -0,0 +1,161 @@
+import argparse
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
+from fwb_common import CLOUD_SCRIPTS, load_cloud_script
+from fwb_inventory import KINDS, Inventory, build_sort_key, refresh
+from fwb_trace import span
+
+# Builds kept per cloud, license type and version when no --keep is given
+DEFAULT_KEEP = 3
+# Deletions running at once per cloud
+DEFAULT_WORKERS = 4
+
+class Collector:
+    """Delete cloud resources on background threads, one pool per cloud, so imports never wait for it"""
+
+    def __init__(self, workers=DEFAULT_WORKERS):
+        self.workers = workers
+        self.deleted = Counter()
+        self.failed = Counter()
+        self._executors = {}
+        self._futures = []
+        self._lock = threading.Lock()
+
+    def submit(self, cloud, resources, delete, inventory=None):
+        """Queue the deletion of resources of one cloud with delete(resource)
+
+        The resources of one submission are deleted in order, images first, since an
+        AMI's snapshot cannot be deleted while the AMI is registered. Deleted resources
+        are dropped from inventory if one is given.
+        """
+        if not resources:
+            return None
+        with self._lock:
+            if cloud not in self._executors:
+                self._executors[cloud] = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"fwb-gc-{cloud}")
+            future = self._executors[cloud].submit(self._delete, cloud, resources, delete, inventory)
+            self._futures.append(future)
+        return future
+
+    def _delete(self, cloud, resources, delete, inventory):
+        for resource in sorted(resources, key=lambda resource: KINDS.index(resource.kind)):
+            try:
+                with span(f"delete {resource.kind}", cloud=cloud, id=resource.id):
+                    delete(resource)
+            except Exception as e:
+                print(f"[WARNING] Failed to delete {cloud} {resource.kind} {resource.id}: {e}")
+                with self._lock:
+                    self.failed[cloud] += 1
+                continue
+            print(f"[INFO] Deleted {cloud} {resource.kind} {resource.id} ({'-'.join(resource.key)})")
+            with self._lock:
+                self.deleted[cloud] += 1
+            if inventory is not None:
+                inventory.remove(cloud, resource.kind, resource.id)
+
+    def wait(self):
+        """Wait for every queued deletion and print how many succeeded per cloud"""
+        with self._lock:
+            futures = list(self._futures)
+        if not futures:
+            return
+        pending = [future for future in futures if not future.done()]
+        if pending:
+            print(f"[INFO] Waiting for {len(pending)} background deletion(s)...")
+            wait_futures(pending)
+        for cloud in sorted(set(self.deleted) | set(self.failed)):
+            failed = f", {self.failed[cloud]} failed" if self.failed[cloud] else ""
+            print(f"[INFO] Deleted {self.deleted[cloud]} {cloud} resource(s){failed}")
+
+_collector = None
+_collector_lock = threading.Lock()
+
+def get_collector():
+    """Return the process-wide collector shared by every script and pipeline stage"""
+    global _collector
+    with _collector_lock:
+        if _collector is None:
+            _collector = Collector()
+        return _collector
+
+def _superseded(resources):
+    """Resources of a kept build that nothing uses: older images of the build and snapshots no current image uses"""
+    images = sorted((resource for resource in resources if resource.kind == 'image'),
+                    key=lambda resource: resource.created or '', reverse=True)
+    if not images:
+        # A build without an image may be importing, its snapshot is about to be registered
+        return []
+    superseded = {image.id for image in images[1:]}
+    return [resource for resource in resources if resource.id in superseded or
+            (resource.kind == 'snapshot' and (resource.source is None or resource.source in superseded))]
+
+def plan(inventory, cloud, keep, license_type=None, version=None):
+    """Return {(license_type, version, build): resources to delete} in one cloud under the retention policy
+
+    Per license type and version, the newest keep builds that have an image are kept, and so
+    is any newer build, which may still be importing. Everything of an older build goes.
+    """
+    builds = {}
+    for _, resource in inventory.find(cloud=cloud, license_type=license_type, version=version):
+        builds.setdefault(resource.key, []).append(resource)
+    series = {}
+    for key in builds:
+        series.setdefault(key[:2], []).append(key)
+
+    garbage = {}
+    for keys in series.values():
+        keys.sort(key=build_sort_key, reverse=True)
+        with_image = [key for key in keys if any(resource.kind == 'image' for resource in builds[key])]
+        oldest_kept = with_image[keep - 1] if len(with_image) > keep else None
+        for key in keys:
+            if oldest_kept is not None and build_sort_key(key) < build_sort_key(oldest_kept):
+                garbage[key] = builds[key]
+            else:
+                superseded = _superseded(builds[key])
+                if superseded:
+                    garbage[key] = superseded
+    return garbage
+
+def collect(inventory, clouds, keep=DEFAULT_KEEP, delete=True, locations=None, license_type=None, version=None):
+    """List the clouds afresh and delete, in the background, what the retention policy does not keep
+
+    Returns the deletion futures; with delete=False the plan is only printed.
+    """
+    # Deleting must never act on a stale index, a cloud that cannot be listed is left alone
+    listed = refresh(inventory, clouds, locations, max_age=0)
+    futures = []
+    for cloud in listed:
+        garbage = plan(inventory, cloud, keep, license_type, version)
+        for key in sorted(garbage, key=build_sort_key):
+            kinds = Counter(resource.kind for resource in garbage[key])
+            print(f"[INFO] {'Deleting' if delete else 'Would delete'} {cloud}/{'-'.join(key)}: "
+                  f"{', '.join(f'{count} {kind}(s)' for kind, count in kinds.items())}")
+        if not garbage:
+            print(f"[INFO] Nothing to delete in {cloud}, keeping the last {keep} build(s) per version and license type")
+        if delete:
+            module = load_cloud_script(cloud)
+            # One task per build, so builds are deleted in parallel and each in dependency order
+            futures.extend(get_collector().submit(cloud, resources, module.delete_resource, inventory)
+                           for resources in garbage.values())
+    return futures
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Delete FortiWeb images and uploads that the retention policy no longer keeps.")
+    parser.add_argument("--keep", type=int, default=DEFAULT_KEEP, help="Builds kept per cloud, version and license type")
+    parser.add_argument("--cloud", action="append", choices=sorted(CLOUD_SCRIPTS), help="Cloud to clean up (repeatable, default: all)")
+    parser.add_argument("--license-type", choices=["byol", "payg"], help="Only this license type")
+    parser.add_argument("--version", help="Only this version, e.g. v7")
+    parser.add_argument("--delete", action="store_true", help="Delete for real, without it the plan is only printed")
+    parser.add_argument("--aws-bucket", help="S3 bucket holding the uploaded vmdk files")
+    parser.add_argument("--azure-container", help="Storage container holding the uploaded VHD files")
+    parser.add_argument("--oci-bucket", help="Object Storage bucket holding the uploaded qcow2 files")
+
+    args = parser.parse_args()
+    if args.keep < 1:
+        parser.error("--keep must be at least 1")
+
+    locations = {'aws': args.aws_bucket, 'azure': args.azure_container, 'oci': args.oci_bucket}
+    collect(Inventory(), args.cloud or sorted(CLOUD_SCRIPTS), args.keep, args.delete, locations,
+            args.license_type, args.version)
+    get_collector().wait()
@@ -0,0 +1,201 @@
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from fwb_common import CLOUD_SCRIPTS, load_cloud_script
+
+INVENTORY_PATH = os.environ.get('FWB_INVENTORY', os.path.join(tempfile.gettempdir(), 'fwb_import', 'inventory.db'))
+# A cloud listed longer ago than this is listed again before answering a query
+DEFAULT_MAX_AGE = 15 * 60
+# What an import leaves behind: the image, the snapshot it was registered from (AWS) and the uploaded disk image
+KINDS = ('image', 'snapshot', 'object')
+KIND_LABELS = {'image': 'img', 'snapshot': 'snap', 'object': 'obj'}
+
+class Resource(namedtuple('Resource', ['kind', 'id', 'name', 'license_type', 'version', 'build',
+                                       'digest', 'created', 'size', 'source'], defaults=(None,) * 4)):
+    """One fwbqa image, snapshot or uploaded disk image in a cloud
+
+    source is what the resource was made from, where the cloud tells: the snapshot
+    behind an AMI, the blob behind an Azure managed image.
+    """
+
+    @property
+    def key(self):
+        return self.license_type, self.version, self.build
+
+def timestamp(value):
+    """Creation time as a sortable UTC ISO 8601 string, from a datetime or a cloud's own ISO 8601 string"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value.isoformat(timespec='seconds')
+    return value
+
+def build_sort_key(key):
+    """Order (license_type, version, build) keys numerically by version and build"""
+    license_type, version, build = key
+    return license_type, int(version.lstrip('v') or 0), int(build)
+
+class Inventory:
+    """SQLite index of the images, snapshots and objects imports left in each cloud, by (cloud, version, build, license_type)"""
+
+    def __init__(self, path=INVENTORY_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS resources ("
+            "cloud TEXT NOT NULL, kind TEXT NOT NULL, id TEXT NOT NULL, name TEXT, "
+            "license_type TEXT NOT NULL, version TEXT NOT NULL, build TEXT NOT NULL, "
+            "digest TEXT, created TEXT, size INTEGER, source TEXT, PRIMARY KEY (cloud, kind, id));"
+            "CREATE INDEX IF NOT EXISTS resources_build ON resources (cloud, version, build, license_type);"
+            "CREATE TABLE IF NOT EXISTS refreshes (cloud TEXT PRIMARY KEY, refreshed REAL NOT NULL);"
+        )
+
+    def age(self, cloud):
+        """Seconds since the cloud was last listed, or None if it never was"""
+        with self._lock:
+            row = self._conn.execute("SELECT refreshed FROM refreshes WHERE cloud = ?", (cloud,)).fetchone()
+        return time.time() - row[0] if row else None
+
+    def replace(self, cloud, resources):
+        """Make the index of a cloud match a full listing of it, returning (added, removed) counts"""
+        rows = {(resource.kind, resource.id): resource for resource in resources}
+        with self._lock:
+            known = {(kind, id) for kind, id in self._conn.execute(
+                "SELECT kind, id FROM resources WHERE cloud = ?", (cloud,)
+            )}
+            gone = known - rows.keys()
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "DELETE FROM resources WHERE cloud = ? AND kind = ? AND id = ?",
+                    [(cloud, kind, id) for kind, id in gone]
+                )
+                self._conn.executemany(
+                    f"INSERT OR REPLACE INTO resources (cloud, {', '.join(Resource._fields)}) "
+                    f"VALUES (?{', ?' * len(Resource._fields)})",
+                    [(cloud, *resource) for resource in rows.values()]
+                )
+                self._conn.execute("INSERT OR REPLACE INTO refreshes (cloud, refreshed) VALUES (?, ?)", (cloud, time.time()))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return len(rows.keys() - known), len(gone)
+
+    def remove(self, cloud, kind, resource_id):
+        """Drop one resource, for callers that deleted it and should not wait for the next listing"""
+        with self._lock:
+            self._conn.execute("DELETE FROM resources WHERE cloud = ? AND kind = ? AND id = ?", (cloud, kind, resource_id))
+
+    def find(self, cloud=None, kind=None, license_type=None, version=None, build=None):
+        """Return (cloud, Resource) for every indexed resource matching the given fields, newest first"""
+        filters = {'cloud': cloud, 'kind': kind, 'license_type': license_type, 'version': version, 'build': build}
+        filters = {field: value for field, value in filters.items() if value is not None}
+        where = ' AND '.join(f"{field} = ?" for field in filters) or '1'
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT cloud, {', '.join(Resource._fields)} FROM resources WHERE {where} ORDER BY created DESC",
+                tuple(filters.values())
+            ).fetchall()
+        return [(row[0], Resource(*row[1:])) for row in rows]
+
+    def builds(self, clouds=None, **filters):
+        """Return {(license_type, version, build): {cloud: set of kinds}}, which builds exist where"""
+        builds = {}
+        for cloud, resource in self.find(**filters):
+            if clouds is None or cloud in clouds:
+                builds.setdefault(resource.key, {}).setdefault(cloud, set()).add(resource.kind)
+        return builds
+
+def list_cloud(module, location=None):
+    """Full listing of one cloud through its import script"""
+    return module.list_inventory(location) if location else module.list_inventory()
+
+def refresh(inventory, clouds, locations=None, max_age=DEFAULT_MAX_AGE):
+    """List every cloud whose index is older than max_age, all of them in parallel, returning those listed
+
+    Each listing is a full one, as the cloud APIs cannot list by creation time and deletions
+    only show as absences. A cloud that fails to list keeps its previous index, so a query
+    still answers from it.
+    """
+    locations = locations or {}
+    ages = {cloud: inventory.age(cloud) for cloud in clouds}
+    stale = [cloud for cloud in clouds if ages[cloud] is None or ages[cloud] > max_age]
+    if not stale:
+        return []
+    # Loading a script checks its environment and may exit, which must happen on this thread
+    modules = {cloud: load_cloud_script(cloud) for cloud in stale}
+    started = time.monotonic()
+    listed = []
+    with ThreadPoolExecutor(max_workers=len(stale)) as executor:
+        futures = {cloud: executor.submit(list_cloud, modules[cloud], locations.get(cloud)) for cloud in stale}
+        for cloud, future in futures.items():
+            try:
+                resources = future.result()
+            except Exception as e:
+                print(f"[WARNING] Failed to list {cloud}, keeping its previous inventory: {e}")
+                continue
+            added, removed = inventory.replace(cloud, resources)
+            listed.append(cloud)
+            print(f"[INFO] Listed {cloud}: {len(resources)} resources, {added} new, {removed} gone")
+    print(f"[INFO] Refreshed the inventory of {', '.join(stale)} in {time.monotonic() - started:.1f}s")
+    return listed
+
+def format_builds(builds, clouds):
+    """Table of builds against clouds, each cell naming the kinds of resources found"""
+    lines = [f"{'BUILD':<24}" + ''.join(f"{cloud.upper():<16}" for cloud in clouds)]
+    for key in sorted(builds, key=build_sort_key):
+        cells = ['+'.join(KIND_LABELS[kind] for kind in KINDS if kind in builds[key].get(cloud, ())) or '-'
+                 for cloud in clouds]
+        lines.append(f"{'-'.join(key):<24}" + ''.join(f"{cell:<16}" for cell in cells))
+    return '\n'.join(lines)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show which FortiWeb builds exist in which cloud, from a local index.")
+    parser.add_argument("--cloud", action="append", choices=sorted(CLOUD_SCRIPTS), help="Cloud to include (repeatable, default: all)")
+    parser.add_argument("--license-type", choices=["byol", "payg"], help="Only this license type")
+    parser.add_argument("--version", help="Only this version, e.g. v7")
+    parser.add_argument("--build", help="Only this build number")
+    parser.add_argument("--missing", action="store_true", help="Only builds that lack an image in one of the clouds")
+    parser.add_argument("--details", action="store_true", help="List every image, snapshot and object instead of the table")
+    parser.add_argument("--max-age", type=int, default=DEFAULT_MAX_AGE, help="List a cloud again if its index is older than this many seconds")
+    parser.add_argument("--refresh", action="store_true", help="List every cloud again now")
+    parser.add_argument("--offline", action="store_true", help="Answer from the index without listing any cloud")
+    parser.add_argument("--aws-bucket", help="S3 bucket holding the uploaded vmdk files")
+    parser.add_argument("--azure-container", help="Storage container holding the uploaded VHD files")
+    parser.add_argument("--oci-bucket", help="Object Storage bucket holding the uploaded qcow2 files")
+
+    args = parser.parse_args()
+    clouds = args.cloud or sorted(CLOUD_SCRIPTS)
+
+    inventory = Inventory()
+    if not args.offline:
+        locations = {'aws': args.aws_bucket, 'azure': args.azure_container, 'oci': args.oci_bucket}
+        refresh(inventory, clouds, locations, max_age=0 if args.refresh else args.max_age)
+
+    filters = {'license_type': args.license_type, 'version': args.version, 'build': args.build}
+    builds = inventory.builds(clouds, **filters)
+    if args.missing:
+        builds = {key: where for key, where in builds.items()
+                  if any('image' not in where.get(cloud, ()) for cloud in clouds)}
+    if args.details:
+        for cloud, resource in inventory.find(**filters):
+            if cloud in clouds and resource.key in builds:
+                size = f"{resource.size // (1024 * 1024)} MB" if resource.size else ""
+                print(f"{cloud:<6} {resource.kind:<9} {'-'.join(resource.key):<18} {resource.created or '':<20} "
+                      f"{size:>9}  {resource.id}")
+    else:
+        print(format_builds(builds, clouds))
+    for cloud in clouds:
+        age = inventory.age(cloud)
+        print(f"[INFO] {cloud} index: {'never listed' if age is None else f'listed {age / 60:.0f} min ago'}")
@@ -0,0 +1,85 @@
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+JOURNAL_PATH = os.environ.get('FWB_IMPORT_JOURNAL', os.path.join(tempfile.gettempdir(), 'fwb_import', 'journal.db'))
+# Checkpoints of an import in the order they are reached, a cloud without a step records the next one
+STEPS = ('extracted', 'uploaded', 'import_started', 'imported', 'registered', 'tagged')
+
+class ImportJournal:
+    """SQLite journal of how far each (cloud, build) import got, shared by concurrent imports"""
+
+    def __init__(self, path=JOURNAL_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS imports ("
+            "cloud TEXT NOT NULL, build TEXT NOT NULL, step TEXT, data TEXT NOT NULL, updated REAL NOT NULL, "
+            "PRIMARY KEY (cloud, build))"
+        )
+
+    def get(self, cloud, build):
+        """Return (step, data) of an import, or (None, {}) if it is not in the journal"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT step, data FROM imports WHERE cloud = ? AND build = ?", (cloud, build)
+            ).fetchone()
+        return (row[0], json.loads(row[1])) if row else (None, {})
+
+    def record(self, cloud, build, step, data):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO imports (cloud, build, step, data, updated) VALUES (?, ?, ?, ?, ?)",
+                (cloud, build, step, json.dumps(data), time.time())
+            )
+
+    def remove(self, cloud, build):
+        with self._lock:
+            self._conn.execute("DELETE FROM imports WHERE cloud = ? AND build = ?", (cloud, build))
+
+    def checkpoint(self, cloud, build, zip_path, restart=False):
+        """Return the checkpoint of one import, starting over if asked to or if the zip changed since"""
+        stat = os.stat(zip_path)
+        source = {'zip_path': os.path.abspath(zip_path), 'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+        step, data = self.get(cloud, build)
+        if step is not None and (restart or data.get('source') != source):
+            if not restart:
+                print(f"[INFO] {zip_path} changed since the interrupted import of {build}, starting over")
+            self.remove(cloud, build)
+            step, data = None, {}
+        data['source'] = source
+        return Checkpoint(self, cloud, build, step, data)
+
+class Checkpoint:
+    """Progress of one import: the last step reached and the IDs needed to resume after it"""
+
+    def __init__(self, journal, cloud, build, step, data):
+        self.journal = journal
+        self.cloud = cloud
+        self.build = build
+        self.step = step
+        self.data = data
+
+    def reached(self, step):
+        return self.step is not None and STEPS.index(self.step) >= STEPS.index(step)
+
+    def record(self, step, **data):
+        """Persist that step was reached, along with what later steps need from it"""
+        self.data.update(data)
+        self.step = step
+        self.journal.record(self.cloud, self.build, step, self.data)
+
+    def rollback(self, step):
+        """Go back to an earlier step, so the next run redoes everything after it"""
+        if self.reached(step):
+            self.step = step
+            self.journal.record(self.cloud, self.build, step, self.data)
+
+    def finish(self):
+        """Drop the journal entry once the import is complete"""
+        self.journal.remove(self.cloud, self.build)
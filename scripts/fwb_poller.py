@@ -0,0 +1,147 @@
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+
+# Bounds on the delay between two status calls for the same operation
+MIN_POLL_INTERVAL = 2
+MAX_POLL_INTERVAL = 60
+# Once progress is reported, poll again after this fraction of the estimated remaining time
+ETA_POLL_FRACTION = 0.25
+# Consecutive failed status calls before the operations behind them are given up
+MAX_FETCH_ERRORS = 5
+
+# What a fetch function reports per operation: state is 'running', 'done' or 'failed',
+# progress a percentage or None, result the value the operation's future resolves to
+PollStatus = namedtuple('PollStatus', ['state', 'progress', 'result', 'detail'])
+PollStatus.__new__.__defaults__ = (None, None, "")
+
+class OperationFailed(Exception):
+    """Raised from an operation's future when the cloud reports it failed"""
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes}m{seconds:02d}s" if minutes else f"{seconds}s"
+
+class _Operation:
+    def __init__(self, operation_id, fetch, label):
+        self.id = operation_id
+        self.fetch = fetch
+        self.label = label
+        self.future = Future()
+        self.started = time.monotonic()
+        self.next_poll = self.started + MIN_POLL_INTERVAL
+        self.interval = MIN_POLL_INTERVAL
+        self.first_progress = None
+        self.progress = None
+        self.eta = None
+
+    def reschedule(self, now, progress):
+        """Pick the next poll time: exponential backoff, or a fraction of the ETA once progress moves"""
+        if progress is not None and self.first_progress is None:
+            self.first_progress = (now, progress)
+        self.progress = progress
+        self.eta = None
+        if self.first_progress and progress is not None:
+            first_time, first_progress = self.first_progress
+            if progress > first_progress and now > first_time:
+                rate = (progress - first_progress) / (now - first_time)
+                self.eta = (100 - progress) / rate
+        if self.eta is not None:
+            # Slow polls through the long middle, fast ones as completion nears
+            self.interval = min(max(self.eta * ETA_POLL_FRACTION, MIN_POLL_INTERVAL), MAX_POLL_INTERVAL)
+        else:
+            self.interval = min(self.interval * 2, MAX_POLL_INTERVAL)
+        self.next_poll = now + self.interval
+
+class StatusPoller:
+    """Track many long-running cloud operations from one background thread
+
+    Operations sharing a fetch function are polled with a single call, so a fetch
+    function should accept a list of IDs and return {id: PollStatus}.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._operations = {}
+        self._thread = None
+
+    def track(self, operation_id, fetch, label=None):
+        """Start tracking an operation and return a Future of its result"""
+        operation = _Operation(operation_id, fetch, label or operation_id)
+        with self._condition:
+            self._operations[(fetch, operation_id)] = operation
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="fwb-poller", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return operation.future
+
+    def _due_batches(self):
+        """Wait for the next due operation, then return every batch with at least one due operation"""
+        while True:
+            now = time.monotonic()
+            next_poll = min((operation.next_poll for operation in self._operations.values()), default=None)
+            if next_poll is not None and next_poll <= now:
+                break
+            self._condition.wait(None if next_poll is None else next_poll - now)
+        due = {operation.fetch for operation in self._operations.values() if operation.next_poll <= now}
+        # The call is made anyway, so every operation behind the same fetch gets refreshed with it
+        batches = {}
+        for operation in self._operations.values():
+            if operation.fetch in due:
+                batches.setdefault(operation.fetch, []).append(operation)
+        return batches
+
+    def _run(self):
+        errors = {}
+        while True:
+            with self._condition:
+                batches = self._due_batches()
+            for fetch, operations in batches.items():
+                try:
+                    statuses = fetch([operation.id for operation in operations])
+                    errors.pop(fetch, None)
+                except Exception as e:
+                    errors[fetch] = errors.get(fetch, 0) + 1
+                    print(f"[WARNING] Status call failed ({errors[fetch]}/{MAX_FETCH_ERRORS}): {e}")
+                    if errors[fetch] >= MAX_FETCH_ERRORS:
+                        errors.pop(fetch)
+                        statuses = {operation.id: PollStatus('failed', detail=str(e)) for operation in operations}
+                    else:
+                        statuses = {}
+                self._update(operations, statuses)
+
+    def _update(self, operations, statuses):
+        now = time.monotonic()
+        with self._condition:
+            for operation in operations:
+                status = statuses.get(operation.id)
+                if status is None:
+                    operation.reschedule(now, operation.progress)
+                    continue
+                if status.state == 'running':
+                    operation.reschedule(now, status.progress)
+                    eta = f" | ETA {format_duration(operation.eta)}" if operation.eta is not None else ""
+                    progress = f" | Progress: {status.progress:.0f}%" if status.progress is not None else ""
+                    print(f"    → {operation.label}: {status.detail or 'running'}{progress}{eta}")
+                    continue
+                del self._operations[(operation.fetch, operation.id)]
+                elapsed = format_duration(now - operation.started)
+                if status.state == 'done':
+                    print(f"    → {operation.label}: completed after {elapsed}")
+                    operation.future.set_result(status.result)
+                else:
+                    print(f"    → {operation.label}: failed after {elapsed}")
+                    operation.future.set_exception(OperationFailed(status.detail or f"{operation.label} failed"))
+
+_poller = None
+_poller_lock = threading.Lock()
+
+def get_poller():
+    """Return the process-wide poller shared by every script and pipeline stage"""
+    global _poller
+    with _poller_lock:
+        if _poller is None:
+            _poller = StatusPoller()
+        return _poller
@@ -0,0 +1,98 @@
+import atexit
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Setting this to a file path traces any entry point, scripts also take --trace
+TRACE_ENV = 'FWB_TRACE'
+
+# Spans are only recorded once tracing is started, until then span() and @traced cost a flag check
+_enabled = False
+_events = []
+_thread_names = {}
+_lock = threading.Lock()
+_local = threading.local()
+_origin = time.perf_counter()
+
+def start_trace(path):
+    """Record spans from now on and write them as a Chrome trace to path when the process exits"""
+    global _enabled
+    with _lock:
+        if _enabled:
+            return
+        _enabled = True
+    atexit.register(write_trace, path)
+
+def _record(name, category, started, ended, args):
+    thread = threading.current_thread()
+    event = {
+        'name': name,
+        'cat': category,
+        'ph': 'X',
+        # Chrome trace timestamps and durations are in microseconds
+        'ts': round((started - _origin) * 1e6, 1),
+        'dur': round((ended - started) * 1e6, 1),
+        'pid': os.getpid(),
+        'tid': thread.ident,
+        'args': args,
+    }
+    with _lock:
+        _events.append(event)
+        _thread_names[thread.ident] = thread.name
+
+@contextmanager
+def span(name, category='fwb', **args):
+    """Time the enclosed block as a span, nested under the span open on the same thread"""
+    if not _enabled:
+        yield
+        return
+    stack = _local.__dict__.setdefault('stack', [])
+    if stack:
+        args['parent'] = stack[-1]
+    stack.append(name)
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        args['error'] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        stack.pop()
+        _record(name, category, started, time.perf_counter(), args)
+
+def traced(func):
+    """Decorator recording every call of func as a span named after it"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _enabled:
+            return func(*args, **kwargs)
+        with span(func.__name__, category=func.__module__):
+            return func(*args, **kwargs)
+    return wrapper
+
+def write_trace(path):
+    """Write the recorded spans in Chrome trace event format (chrome://tracing, Perfetto)"""
+    with _lock:
+        events = sorted(_events, key=lambda event: event['ts'])
+        thread_names = dict(_thread_names)
+    metadata = [
+        {'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': tid, 'args': {'name': name}}
+        for tid, name in thread_names.items()
+    ]
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump({'traceEvents': metadata + events, 'displayTimeUnit': 'ms'}, f)
+    print(f"[INFO] Wrote {len(events)} trace spans to {path}")
+
+# Scripts import this module as fwb_trace and tests as scripts.fwb_trace, both names must share one tracer
+sys.modules.setdefault('fwb_trace', sys.modules[__name__])
+sys.modules.setdefault('scripts.fwb_trace', sys.modules[__name__])
+
+if os.environ.get(TRACE_ENV):
+    start_trace(os.environ[TRACE_ENV])
@@ -0,0 +1,212 @@
+import os
+import threading
+import time
+
+# Bounds on parallel streams per upload, the controller moves between them on its own
+MIN_STREAMS = 1
+MAX_STREAMS = 16
+# One more stream is kept only if it raises throughput by at least this factor
+STREAM_GAIN = 1.05
+# The best throughput seen fades by this factor per window, so a link that got faster is probed again
+BEST_RATE_DECAY = 0.98
+# Adaptive part sizes aim for parts that take this long on one stream
+TARGET_PART_SECONDS = 4
+# Retries of a part after a throttle or transient network error, with exponential backoff
+MAX_RETRIES = 5
+RETRY_DELAY = 1
+# Share of the memory available when an upload starts that an upload with fixed parts may buffer
+MEMORY_SHARE = 0.25
+
+# Statuses and error codes the clouds answer with when they want a client to slow down
+THROTTLE_STATUSES = {429, 500, 502, 503, 504}
+THROTTLE_CODES = {
+    'SlowDown', 'Throttling', 'ThrottlingException', 'RequestTimeout', 'RequestLimitExceeded',
+    'ServiceUnavailable', 'InternalError', 'ServerBusy', 'OperationTimedOut', 'TooManyRequests',
+}
+
+def is_throttle(error):
+    """Tell throttling and transient network errors (worth a retry) from real failures, for all three SDKs"""
+    response = getattr(error, 'response', None)
+    if isinstance(response, dict):
+        # botocore ClientError
+        status = response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+        code = response.get('Error', {}).get('Code')
+    else:
+        # OCI ServiceError has status and code, Azure HttpResponseError status_code and error_code
+        status = getattr(error, 'status', None) or getattr(error, 'status_code', None)
+        code = getattr(error, 'code', None) or getattr(error, 'error_code', None)
+    if status in THROTTLE_STATUSES or code in THROTTLE_CODES:
+        return True
+    # Dropped connections and timeouts, whichever HTTP stack the SDK raised them from
+    return isinstance(error, (ConnectionError, TimeoutError)) or any(
+        'Connection' in cls.__name__ or 'Timeout' in cls.__name__ for cls in type(error).__mro__
+    )
+
+class TokenBucket:
+    """Process-wide bandwidth cap shared by every upload stream"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self._tokens = rate
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self, nbytes):
+        """Wait until nbytes may be sent; large parts borrow ahead and make the next sender wait longer"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= nbytes
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0
+        if delay:
+            time.sleep(delay)
+
+def available_memory():
+    """Bytes of memory available to new allocations right now, or None where the platform does not tell"""
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+def memory_budget():
+    """Bytes of parts an upload may keep in memory beyond its starting bound, MEMORY_SHARE of what is available"""
+    memory = available_memory()
+    return int(memory * MEMORY_SHARE) if memory else None
+
+_bandwidth = None
+
+def set_bandwidth_limit(mb_per_second):
+    """Cap the combined upload rate of the process in MB/s, None or 0 removes the cap"""
+    global _bandwidth
+    _bandwidth = TokenBucket(mb_per_second * 1024 * 1024) if mb_per_second else None
+
+class TransferController:
+    """AIMD control of the parallel streams of one upload
+
+    The submitting thread calls acquire() before reading a part and hands the part to
+    transfer() on a worker, which sends it and frees the stream. Once per window (as
+    many parts as there are streams) the achieved throughput decides: a new best adds
+    a stream, no gain after adding one takes it back. A throttle or transient error
+    halves the streams and the part is retried after a backoff.
+    """
+
+    def __init__(self, label, streams, max_streams=MAX_STREAMS, part_size=None, min_part_size=None, max_buffered=None):
+        # Every stream holds one part in memory, and one more is being read. The parts in memory
+        # stay within max_buffered, or what a fixed upload of streams + 1 parts of part_size would
+        # hold if that is more, so more streams are only opened as far as that leaves room for
+        # parts of min_part_size.
+        self.initial_part_size = part_size
+        self.max_buffered = max((streams + 1) * part_size, max_buffered or 0) if part_size else None
+        if part_size:
+            max_streams = min(max_streams, max(streams, self.max_buffered // (min_part_size or part_size) - 1))
+        self.label = label
+        self.max_streams = max(streams, max_streams)
+        self.streams = streams
+        self.peak_streams = streams
+        self.rate = None
+        self.throttles = 0
+        self._active = 0
+        self._condition = threading.Condition()
+        self._best_rate = 0
+        self._increased = False
+        self._started = time.monotonic()
+        self._bytes = 0
+        self._window_started = self._started
+        self._window_bytes = 0
+        self._window_parts = 0
+
+    def acquire(self):
+        """Wait for a free stream"""
+        with self._condition:
+            while self._active >= self.streams:
+                self._condition.wait()
+            self._active += 1
+
+    def release(self):
+        """Free an acquired stream that will not be used for a transfer"""
+        with self._condition:
+            self._active -= 1
+            self._condition.notify_all()
+
+    def transfer(self, nbytes, send):
+        """Send one part of nbytes with send() on an acquired stream, retrying throttled attempts"""
+        try:
+            for attempt in range(MAX_RETRIES + 1):
+                if _bandwidth is not None:
+                    _bandwidth.take(nbytes)
+                try:
+                    result = send()
+                except Exception as e:
+                    if attempt == MAX_RETRIES or not is_throttle(e):
+                        raise
+                    self._throttled(e)
+                    time.sleep(RETRY_DELAY * 2 ** attempt)
+                    continue
+                self._completed(nbytes)
+                return result
+        finally:
+            self.release()
+
+    def _completed(self, nbytes):
+        with self._condition:
+            now = time.monotonic()
+            self._bytes += nbytes
+            self._window_bytes += nbytes
+            self._window_parts += 1
+            if self._window_parts < self.streams or now <= self._window_started:
+                return
+            self.rate = self._window_bytes / (now - self._window_started)
+            if self.rate > self._best_rate * STREAM_GAIN:
+                # Additive increase while more streams keep paying off
+                self._best_rate = self.rate
+                self._increased = self.streams < self.max_streams
+                self.streams = min(self.streams + 1, self.max_streams)
+            elif self._increased:
+                # The last stream added nothing, the link is saturated
+                self.streams = max(self.streams - 1, MIN_STREAMS)
+                self._increased = False
+            self._best_rate *= BEST_RATE_DECAY
+            self.peak_streams = max(self.peak_streams, self.streams)
+            self._window_started = now
+            self._window_bytes = 0
+            self._window_parts = 0
+            self._condition.notify_all()
+
+    def _throttled(self, error):
+        with self._condition:
+            self.throttles += 1
+            # Multiplicative decrease, and a fresh window to measure the new stream count
+            self.streams = max(self.streams // 2, MIN_STREAMS)
+            self._increased = False
+            self._best_rate = 0
+            self._window_started = time.monotonic()
+            self._window_bytes = 0
+            self._window_parts = 0
+        print(f"[WARNING] {self.label}: throttled or dropped ({error}), retrying with {self.streams} stream(s)")
+
+    def part_size(self, minimum, maximum):
+        """Size for the next part: about TARGET_PART_SECONDS of one stream's throughput, within bounds
+
+        Until the first window is measured this is the part size the upload started with.
+        """
+        with self._condition:
+            if self.max_buffered:
+                maximum = min(maximum, self.max_buffered // (self.streams + 1))
+            maximum = max(minimum, maximum)
+            if not self.rate:
+                return min(max(self.initial_part_size or maximum, minimum), maximum)
+            return int(min(max(self.rate / self.streams * TARGET_PART_SECONDS, minimum), maximum))
+
+    def summary(self):
+        elapsed = time.monotonic() - self._started
+        rate = self._bytes / elapsed / (1024 * 1024) if elapsed > 0 else 0
+        throttles = f", throttled {self.throttles} time(s)" if self.throttles else ""
+        return f"{rate:.1f} MB/s, {self.streams} stream(s) at the end, {self.peak_streams} at most{throttles}"
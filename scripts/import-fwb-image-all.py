@@ -0,0 +1,176 @@
+import os
+import sys
+import glob
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from fwb_common import CLOUD_SCRIPTS, Job, StageStatus, detect_cloud, load_cloud_script
+from fwb_gc import collect, get_collector
+from fwb_inventory import Inventory
+from fwb_journal import ImportJournal
+from fwb_trace import span, start_trace
+from fwb_transfer import set_bandwidth_limit
+
+# Default batch limits, per cloud: builds in flight, concurrent uploads and concurrent import tasks.
+# AWS limits concurrent import snapshot tasks per region, imports beyond the quota are rejected.
+DEFAULT_BUILDS_PER_CLOUD = 4
+DEFAULT_UPLOAD_SLOTS = 2
+DEFAULT_IMPORT_SLOTS = 5
+
+def run_aws(module, job, args, status, slots, checkpoint):
+    """Hash, upload, import and register an AWS build, returning the AMI ID"""
+    return module.run_import(job, status, slots, checkpoint, bucket=args.aws_bucket or module.MY_SNAP_BUCKET,
+                             description=args.description or "FortiWeb VM snapshot", force=args.force,
+                             concurrency=args.upload_concurrency or module.DEFAULT_UPLOAD_CONCURRENCY)
+
+def run_azure(module, job, args, status, slots, checkpoint):
+    """Extract, upload and register an Azure build, returning the managed image name"""
+    return module.run_import(job, status, slots, checkpoint, container=args.azure_container or module.MY_STORAGE_CONTAINER,
+                             description=args.description or "FortiWeb VM image", force=args.force,
+                             concurrency=args.upload_concurrency or module.DEFAULT_UPLOAD_CONCURRENCY)
+
+def run_oci(module, job, args, status, slots, checkpoint):
+    """Extract, upload and import an OCI build, returning the custom image ID"""
+    return module.run_import(job, status, slots, checkpoint, bucket_name=args.oci_bucket,
+                             description=args.description or "FortiWeb VM image", force=args.force,
+                             concurrency=args.upload_concurrency or module.DEFAULT_UPLOAD_CONCURRENCY)
+
+CLOUD_RUNNERS = {
+    'aws': run_aws,
+    'azure': run_azure,
+    'oci': run_oci,
+}
+
+def collect_old_builds(cloud, futures, args):
+    """Once every build of a cloud is through, delete the builds the retention policy no longer keeps"""
+    wait(futures)
+    locations = {'aws': args.aws_bucket, 'azure': args.azure_container, 'oci': args.oci_bucket}
+    try:
+        collect(Inventory(), [cloud], args.keep_builds, locations=locations)
+    except Exception as e:
+        print(f"[WARNING] Cleaning up old builds in {cloud} failed: {e}")
+
+def run_pipeline(jobs, args):
+    """Import many builds, each cloud on its own bounded worker pool, returning {job: image ID or None}"""
+    status = StageStatus()
+    # Every build resumes after the last step it reached in an interrupted run
+    journal = ImportJournal()
+    clouds = sorted({job.cloud for job in jobs})
+    modules = {cloud: load_cloud_script(cloud) for cloud in clouds}
+    # Upload and import slots are shared by every build of a cloud
+    slots = {
+        cloud: {
+            'upload': threading.BoundedSemaphore(args.upload_slots),
+            'import': threading.BoundedSemaphore(args.import_slots),
+        }
+        for cloud in clouds
+    }
+
+    def run_job(job):
+        try:
+            checkpoint = journal.checkpoint(job.cloud, job.name, job.zip_path, restart=args.force)
+            with span(job.label, cloud=job.cloud, zip_path=job.zip_path):
+                return CLOUD_RUNNERS[job.cloud](modules[job.cloud], job, args, status, slots[job.cloud], checkpoint)
+        except (Exception, SystemExit) as e:
+            # The per-cloud functions exit on error, which must not take the other builds down
+            print(f"[ERROR] {job.label} import failed: {e}")
+            return None
+
+    started = time.monotonic()
+    executors = {cloud: ThreadPoolExecutor(max_workers=args.builds_per_cloud) for cloud in clouds}
+    cleanup_executor = ThreadPoolExecutor(max_workers=len(clouds))
+    try:
+        futures = {job: executors[job.cloud].submit(run_job, job) for job in jobs}
+        if args.keep_builds:
+            # Each cloud is cleaned up as soon as its own builds are through, while the others still import
+            for cloud in clouds:
+                cloud_futures = [future for job, future in futures.items() if job.cloud == cloud]
+                cleanup_executor.submit(collect_old_builds, cloud, cloud_futures, args)
+        results = {job: future.result() for job, future in futures.items()}
+    finally:
+        for executor in executors.values():
+            executor.shutdown()
+
+    print(f"\n[SUMMARY] Pipeline finished in {time.monotonic() - started:.0f}s")
+    print(status.summary([job.label for job in jobs]))
+    cleanup_executor.shutdown()
+    get_collector().wait()
+    return results
+
+def expand_inputs(inputs):
+    """Expand files, directories and glob patterns into a sorted list of zip files"""
+    zip_files = []
+    for path in inputs:
+        if os.path.isdir(path):
+            matches = glob.glob(os.path.join(path, '*.zip'))
+        elif glob.has_magic(path):
+            matches = glob.glob(path)
+        else:
+            matches = [path]
+        if not matches:
+            print(f"[WARNING] No build zip files match {path}")
+        zip_files.extend(sorted(matches))
+    return zip_files
+
+def collect_jobs(args):
+    """Build the job list from the auto-detected inputs and the per-cloud options"""
+    assigned = []
+    for zip_file in expand_inputs(args.zip_files):
+        cloud = detect_cloud(zip_file)
+        if cloud is None:
+            print(f"[ERROR] Cannot tell the target cloud of {zip_file}, pass it with --aws, --azure or --oci")
+            sys.exit(1)
+        assigned.append((cloud, zip_file))
+    for cloud in CLOUD_SCRIPTS:
+        assigned.extend((cloud, zip_file) for zip_file in expand_inputs(getattr(args, cloud) or []))
+
+    jobs = {}
+    for cloud, zip_file in assigned:
+        job = Job.from_zip(cloud, zip_file)
+        # Two zips of the same build would race for the same object and image names
+        if job.label in jobs and jobs[job.label].zip_path != zip_file:
+            print(f"[ERROR] {jobs[job.label].zip_path} and {zip_file} are both {job.label}")
+            sys.exit(1)
+        jobs[job.label] = job
+    return list(jobs.values())
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import FortiWeb builds into AWS, Azure and OCI concurrently.")
+    parser.add_argument("zip_files", nargs="*", help="Build zip files, directories or glob patterns, the cloud is detected from each name")
+    parser.add_argument("--aws", action="append", help="AWS build zip file, directory or glob pattern (repeatable)")
+    parser.add_argument("--azure", action="append", help="Azure build zip file, directory or glob pattern (repeatable)")
+    parser.add_argument("--oci", action="append", help="OCI build zip file, directory or glob pattern (repeatable)")
+    parser.add_argument("--aws-bucket", help="S3 bucket name")
+    parser.add_argument("--azure-container", help="Azure storage container name")
+    parser.add_argument("--oci-bucket", help="OCI Object Storage bucket name")
+    parser.add_argument("--description", help="Image description")
+    parser.add_argument("--upload-concurrency", type=int, help="Initial parallel upload streams per upload, adapted to the measured throughput (default: per-cloud default)")
+    parser.add_argument("--bandwidth-limit", type=float, help="Cap the combined upload rate of all imports at this many MB/s")
+    parser.add_argument("--builds-per-cloud", type=int, default=DEFAULT_BUILDS_PER_CLOUD, help="Builds processed at once per cloud")
+    parser.add_argument("--upload-slots", type=int, default=DEFAULT_UPLOAD_SLOTS, help="Uploads running at once per cloud")
+    parser.add_argument("--import-slots", type=int, default=DEFAULT_IMPORT_SLOTS, help="Import/image creation tasks running at once per cloud")
+    parser.add_argument("--force", action="store_true", help="Upload and import even if an image with the same digest exists")
+    parser.add_argument("--keep-builds", type=int, help="After importing, delete all but the last N builds per cloud, version and license type")
+    parser.add_argument("--trace", help="Write a Chrome trace of the run's timing spans to this JSON file")
+
+    args = parser.parse_args()
+    if args.trace:
+        start_trace(args.trace)
+    set_bandwidth_limit(args.bandwidth_limit)
+
+    if args.keep_builds is not None and args.keep_builds < 1:
+        parser.error("--keep-builds must be at least 1")
+
+    jobs = collect_jobs(args)
+    if not jobs:
+        parser.error("no build zip files given")
+    print(f"[INFO] Importing {len(jobs)} build(s):")
+    for job in jobs:
+        print(f"    → {job.label}: {job.zip_path}")
+
+    results = run_pipeline(jobs, args)
+    for job, image_id in results.items():
+        print(f"[FINAL] {job.label} image for Terraform: {image_id}")
+    if not all(results.values()):
+        sys.exit(1)
@@ -1,29 +1,127 @@
-import boto3
+import hashlib
 import os
-import time
 import sys
 import argparse
-import re
 import zipfile
-import tempfile
-from botocore.exceptions import ClientError
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from fwb_common import DIGEST_KEY, STAGES, Job, StageStatus, find_zip_member, parse_resource_name
+from fwb_cache import extract_cached, hold, known_member_digest, release, remember_member_digest
+from fwb_clients import aws_client
+from fwb_gc import get_collector
+from fwb_inventory import Resource, timestamp
+from fwb_journal import ImportJournal
+from fwb_poller import PollStatus, OperationFailed, get_poller
+from fwb_trace import start_trace, traced
+from fwb_transfer import TransferController, set_bandwidth_limit
 
 MY_SNAP_BUCKET = 'fwb-lzeyu'
 
-def upload_to_s3(file_path, bucket, key):
+# Multipart upload defaults for streaming, S3 allows 5 MB..5 GB per part and at most 10000 parts
+DEFAULT_PART_SIZE = 64 * 1024 * 1024
+DEFAULT_UPLOAD_CONCURRENCY = 4
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PARTS = 10000
+
+def multipart_upload(source, size, bucket, key, part_size=DEFAULT_PART_SIZE, concurrency=DEFAULT_UPLOAD_CONCURRENCY, digest=None):
+    """Upload a readable stream to S3 in parallel parts, with streams and part size tuned as it goes
+
+    Returns the SHA-256 of the stream, hashed as it is read unless digest already gives it.
+    """
+    from botocore.exceptions import ClientError
+    s3 = aws_client('s3')
+    # The part size may grow or shrink with the measured throughput, but never past the S3 part count limit
+    min_part_size = max(MIN_PART_SIZE, -(-size // MAX_PARTS))
+    part_size = max(part_size, min_part_size)
+    controller = TransferController(f"s3://{bucket}/{key}", concurrency, part_size=part_size, min_part_size=min_part_size)
+    metadata = {DIGEST_KEY: digest} if digest else {}
+    upload_id = s3.create_multipart_upload(Bucket=bucket, Key=key, Metadata=metadata)['UploadId']
+    failed = threading.Event()
+    # Parts are read in order on this thread, so hashing them here sees the stream as it is
+    sha256 = None if digest else hashlib.sha256()
+
+    def upload_part(part_number, data):
+        try:
+            response = controller.transfer(len(data), lambda: s3.upload_part(
+                Bucket=bucket, Key=key, UploadId=upload_id, PartNumber=part_number, Body=data
+            ))
+            return {'PartNumber': part_number, 'ETag': response['ETag']}
+        except Exception:
+            failed.set()
+            raise
+
+    try:
+        with ThreadPoolExecutor(max_workers=controller.max_streams) as executor:
+            futures = []
+            offset = 0
+            while not failed.is_set():
+                # A free stream is waited for before reading, which bounds memory use
+                controller.acquire()
+                parts_left = max(MAX_PARTS - len(futures), 1)
+                data = source.read(controller.part_size(max(min_part_size, -(-(size - offset) // parts_left)), part_size * 4))
+                if not data:
+                    controller.release()
+                    break
+                if sha256:
+                    sha256.update(data)
+                futures.append(executor.submit(upload_part, len(futures) + 1, data))
+                offset += len(data)
+            parts = [future.result() for future in futures]
+
+        s3.complete_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id, MultipartUpload={'Parts': parts})
+        print(f"[INFO] Uploaded s3://{bucket}/{key} in {len(parts)} parts: {controller.summary()}")
+        return sha256.hexdigest() if sha256 else digest
+    except Exception as e:
+        print(f"[ERROR] Failed to upload: {e}")
+        try:
+            s3.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+        except ClientError as abort_error:
+            print(f"[WARNING] Failed to abort multipart upload {upload_id}: {abort_error}")
+        sys.exit(1)
+
+@traced
+def upload_to_s3(file_path, bucket, key, digest=None, part_size=DEFAULT_PART_SIZE, concurrency=DEFAULT_UPLOAD_CONCURRENCY):
     """Upload file to S3 bucket"""
-    s3 = boto3.client('s3')
+    with open(file_path, 'rb') as f:
+        multipart_upload(f, os.path.getsize(file_path), bucket, key, part_size, concurrency, digest)
+    print(f"[INFO] Successfully uploaded {file_path} to s3://{bucket}/{key}")
+    return True
+
+@traced
+def stream_zip_member_to_s3(zip_path, member_suffix, bucket, key, part_size=DEFAULT_PART_SIZE, concurrency=DEFAULT_UPLOAD_CONCURRENCY, digest=None):
+    """Stream a zip member straight into a parallel S3 multipart upload without writing it to disk, returning its SHA-256"""
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        info = find_zip_member(zip_ref, member_suffix)
+        print(f"[INFO] Streaming {info.filename} ({info.file_size} bytes), starting with {part_size // (1024 * 1024)} MB parts, {concurrency} in parallel")
+        with zip_ref.open(info) as member:
+            digest = multipart_upload(member, info.file_size, bucket, key, part_size, concurrency, digest)
+    print(f"[INFO] Successfully streamed {info.filename} to s3://{bucket}/{key}")
+    return digest
+
+def find_ami_by_digest(name, digest):
+    """Return the ID of an available AMI with this name built from an image with this digest, if any"""
+    from botocore.exceptions import ClientError
+    ec2 = aws_client('ec2')
     try:
-        s3.upload_file(file_path, bucket, key)
-        print(f"[INFO] Successfully uploaded {file_path} to s3://{bucket}/{key}")
-        return True
+        response = ec2.describe_images(
+            Owners=['self'],
+            Filters=[
+                {'Name': 'name', 'Values': [name]},
+                {'Name': f'tag:{DIGEST_KEY}', 'Values': [digest]},
+                {'Name': 'state', 'Values': ['available']},
+            ]
+        )
+        if response['Images']:
+            return response['Images'][0]['ImageId']
     except ClientError as e:
-        print(f"[ERROR] Failed to upload file: {e}")
-        sys.exit(1)
+        print(f"[WARNING] Error looking up AMI by digest: {e}")
+    return None
 
+@traced
 def delete_existing_snapshot(name):
     """Delete snapshot if one with same name exists"""
-    ec2 = boto3.client('ec2')
+    from botocore.exceptions import ClientError
+    ec2 = aws_client('ec2')
     try:
         response = ec2.describe_snapshots(Filters=[{'Name': 'tag:Name', 'Values': [name]}])
         if len(response['Snapshots']) > 0:
@@ -34,11 +132,14 @@ def delete_existing_snapshot(name):
     except ClientError as e:
         print(f"[WARNING] Error checking/deleting existing snapshot: {e}")
 
-def import_snapshot(name, description, bucket, key, disk_format='VMDK'):
-    ec2 = boto3.client('ec2')
+@traced
+def import_snapshot(name, description, bucket, key, disk_format='VMDK', delete_existing=True):
+    from botocore.exceptions import ClientError
+    ec2 = aws_client('ec2')
     
-    # First delete any existing snapshot with same name
-    delete_existing_snapshot(name)
+    # First delete any existing snapshot with same name, unless the caller already cleaned up
+    if delete_existing:
+        delete_existing_snapshot(name)
     
     try:
         response = ec2.import_snapshot(
@@ -64,51 +165,64 @@ def import_snapshot(name, description, bucket, key, disk_format='VMDK'):
         print(f"[ERROR] Failed to start snapshot import: {e}")
         sys.exit(1)
 
-def wait_for_completion(task_id, poll_interval=30):
-    ec2 = boto3.client('ec2')
-    print(f"[INFO] Waiting for import task '{task_id}' to complete...")
-    while True:
-        try:
-            response = ec2.describe_import_snapshot_tasks(ImportTaskIds=[task_id])
-            task = response['ImportSnapshotTasks'][0]
-            status = task['SnapshotTaskDetail']['Status']
-            progress = task['SnapshotTaskDetail'].get('Progress', '0')
-
-            print(f"    → Status: {status} | Progress: {progress}%")
-
-            if status.lower() == 'completed':
-                snapshot_id = task['SnapshotTaskDetail']['SnapshotId']
-                print(f"[SUCCESS] Snapshot imported: {snapshot_id}")
-                return snapshot_id
-            elif status.lower() in ['cancelled', 'deleted', 'failed']:
-                print(f"[ERROR] Snapshot import failed with status: {status}")
-                sys.exit(1)
-
-            time.sleep(poll_interval)
+def import_task_statuses(task_ids):
+    """Get the status of many import snapshot tasks with one describe call"""
+    ec2 = aws_client('ec2')
+    response = ec2.describe_import_snapshot_tasks(ImportTaskIds=list(task_ids))
+    # Tasks expire some days after they end, an ID the API no longer knows will never complete
+    statuses = {task_id: PollStatus('failed', detail=f"Import task {task_id} not found") for task_id in task_ids}
+    for task in response['ImportSnapshotTasks']:
+        detail = task['SnapshotTaskDetail']
+        status = detail['Status']
+        progress = float(detail['Progress']) if detail.get('Progress') else None
+        if status.lower() == 'completed':
+            statuses[task['ImportTaskId']] = PollStatus('done', 100.0, detail['SnapshotId'])
+        elif status.lower() in ['cancelled', 'deleted', 'failed']:
+            statuses[task['ImportTaskId']] = PollStatus('failed', progress, None, detail.get('StatusMessage', status))
+        else:
+            statuses[task['ImportTaskId']] = PollStatus('running', progress, None, f"Status: {status}")
+    return statuses
 
-        except ClientError as e:
-            print(f"[ERROR] Failed to get task status: {e}")
-            sys.exit(1)
+@traced
+def wait_for_completion(task_id, poller=None):
+    """Wait for an import snapshot task on the shared status poller and return the snapshot ID"""
+    print(f"[INFO] Waiting for import task '{task_id}' to complete...")
+    try:
+        snapshot_id = (poller or get_poller()).track(task_id, import_task_statuses, f"Import task {task_id}").result()
+    except OperationFailed as e:
+        print(f"[ERROR] Snapshot import failed: {e}")
+        sys.exit(1)
+    print(f"[SUCCESS] Snapshot imported: {snapshot_id}")
+    return snapshot_id
 
+@traced
 def delete_existing_ami(name):
-    """Delete AMI if one with same name exists"""
-    ec2 = boto3.client('ec2')
+    """Delete AMI if one with same name exists, returning the IDs of the snapshots it was registered from"""
+    from botocore.exceptions import ClientError
+    ec2 = aws_client('ec2')
     try:
         response = ec2.describe_images(Filters=[{'Name': 'name', 'Values': [name]}])
         if len(response['Images']) > 0:
-            ami_id = response['Images'][0]['ImageId']
+            image = response['Images'][0]
+            ami_id = image['ImageId']
             print(f"[INFO] Found existing AMI {ami_id} with name {name}")
             ec2.deregister_image(ImageId=ami_id)
             print(f"[INFO] Deleted existing AMI {ami_id}")
+            return [mapping['Ebs']['SnapshotId'] for mapping in image.get('BlockDeviceMappings', [])
+                    if 'SnapshotId' in mapping.get('Ebs', {})]
     except ClientError as e:
         print(f"[WARNING] Error checking/deleting existing AMI: {e}")
+    return []
 
-def create_ami_from_snapshot(snapshot_id, name, description, version, build, license_type):
-    """Create AMI from snapshot and tag it"""
-    ec2 = boto3.client('ec2')
+@traced
+def create_ami_from_snapshot(snapshot_id, name, description, delete_existing=True):
+    """Register an AMI from snapshot"""
+    from botocore.exceptions import ClientError
+    ec2 = aws_client('ec2')
     
-    # First delete any existing AMI with same name
-    delete_existing_ami(name)
+    # First delete any existing AMI with same name, unless the caller already cleaned up
+    if delete_existing:
+        delete_existing_ami(name)
     
     try:
         response = ec2.register_image(
@@ -127,8 +241,18 @@ def create_ami_from_snapshot(snapshot_id, name, description, version, build, lic
             EnaSupport=True
         )
         ami_id = response['ImageId']
-        
-        # Tag the AMI with Owner, version, build and license_type
+        print(f"[SUCCESS] Created AMI {ami_id} from snapshot {snapshot_id}")
+        return ami_id
+    except ClientError as e:
+        print(f"[ERROR] Failed to create AMI: {e}")
+        sys.exit(1)
+
+@traced
+def tag_ami(ami_id, version, build, license_type, digest=None):
+    """Tag the AMI with Owner, version, build, license_type and image digest"""
+    from botocore.exceptions import ClientError
+    ec2 = aws_client('ec2')
+    try:
         ec2.create_tags(
             Resources=[ami_id],
             Tags=[
@@ -136,74 +260,209 @@ def create_ami_from_snapshot(snapshot_id, name, description, version, build, lic
                 {'Key': 'version', 'Value': version},
                 {'Key': 'build', 'Value': build},
                 {'Key': 'license_type', 'Value': license_type},
-            ]
+            ] + ([{'Key': DIGEST_KEY, 'Value': digest}] if digest else [])
         )
-        print(f"[SUCCESS] Created AMI {ami_id} from snapshot {snapshot_id}")
-        return ami_id
+        print(f"[INFO] Tagged AMI {ami_id}")
     except ClientError as e:
-        print(f"[ERROR] Failed to create AMI: {e}")
+        print(f"[ERROR] Failed to tag AMI: {e}")
         sys.exit(1)
 
-def parse_filename(filename):
-    """Parse zip filename to extract components for S3 key"""
-    # Determine license type
-    license_type = 'payg' if 'ONDEMAND' in filename.upper() else 'byol'
-    
-    # Extract version
-    version_match = re.search(r'-v(\d+)(?:\.|-)', filename)
-    version = f'v{version_match.group(1)}' if version_match else 'v7'
-    
-    # Extract build number
-    build_match = re.search(r'-build(\d+)-', filename)
-    build = build_match.group(1) if build_match else '0000'
-    
-    return license_type, version, build
+@traced
+def list_inventory(bucket=MY_SNAP_BUCKET):
+    """List the fwbqa AMIs, their snapshots and the uploaded vmdk objects, following every page"""
+    ec2 = aws_client('ec2')
+    resources = []
+    pages = ec2.get_paginator('describe_images').paginate(
+        Owners=['self'], Filters=[{'Name': 'tag:owner', 'Values': ['fwbqa']}]
+    )
+    for page in pages:
+        for image in page['Images']:
+            tags = {tag['Key']: tag['Value'] for tag in image.get('Tags', [])}
+            tagged = (tags.get('license_type'), tags.get('version'), tags.get('build'))
+            key = tagged if all(tagged) else parse_resource_name(image['Name'])
+            if not key:
+                continue
+            snapshots = [mapping['Ebs'] for mapping in image.get('BlockDeviceMappings', [])
+                         if 'SnapshotId' in mapping.get('Ebs', {})]
+            resources.append(Resource('image', image['ImageId'], image['Name'], *key, tags.get(DIGEST_KEY),
+                                      timestamp(image.get('CreationDate')), None,
+                                      ','.join(ebs['SnapshotId'] for ebs in snapshots) or None))
+            # The Name tag is given to the import task, not the snapshot it creates, so an
+            # AMI's snapshots are only known through its block device mappings
+            for ebs in snapshots:
+                size = ebs['VolumeSize'] * 1024 ** 3 if ebs.get('VolumeSize') else None
+                resources.append(Resource('snapshot', ebs['SnapshotId'], image['Name'], *key, tags.get(DIGEST_KEY),
+                                          None, size, image['ImageId']))
+
+    # Snapshots tagged by name, including those whose AMI is gone
+    known = {resource.id for resource in resources}
+    pages = ec2.get_paginator('describe_snapshots').paginate(
+        OwnerIds=['self'], Filters=[{'Name': 'tag:Name', 'Values': ['fwb-*']}]
+    )
+    for page in pages:
+        for snapshot in page['Snapshots']:
+            name = next((tag['Value'] for tag in snapshot.get('Tags', []) if tag['Key'] == 'Name'), '')
+            key = parse_resource_name(name)
+            if key and snapshot['SnapshotId'] not in known:
+                resources.append(Resource('snapshot', snapshot['SnapshotId'], name, *key, None,
+                                          timestamp(snapshot['StartTime']), snapshot['VolumeSize'] * 1024 ** 3))
+
+    for page in aws_client('s3').get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix='vmdk/'):
+        for obj in page.get('Contents', []):
+            key = parse_resource_name(obj['Key'])
+            if key:
+                resources.append(Resource('object', f"s3://{bucket}/{obj['Key']}", obj['Key'], *key, None,
+                                          timestamp(obj['LastModified']), obj['Size']))
+    return resources
+
+def delete_resource(resource):
+    """Delete an AMI, snapshot or uploaded vmdk object found by list_inventory"""
+    if resource.kind == 'image':
+        aws_client('ec2').deregister_image(ImageId=resource.id)
+    elif resource.kind == 'snapshot':
+        aws_client('ec2').delete_snapshot(SnapshotId=resource.id)
+    else:
+        bucket, key = resource.id[len('s3://'):].split('/', 1)
+        aws_client('s3').delete_object(Bucket=bucket, Key=key)
 
+@traced
 def extract_vmdk(zip_path):
-    """Extract boot.vmdk from zip file to system temp directory"""
-    temp_dir = os.path.join(tempfile.gettempdir(), 'fwb_import')
-    if not os.path.exists(temp_dir):
-        os.makedirs(temp_dir)
-    
-    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-        for file in zip_ref.namelist():
-            if file.endswith('boot.vmdk'):
-                zip_ref.extract(file, temp_dir)
-                return os.path.join(temp_dir, file)
-    raise Exception("boot.vmdk not found in zip file")
+    """Extract boot.vmdk from zip file into the extraction cache, returning (path, sha256)"""
+    return extract_cached(zip_path, 'boot.vmdk')
+
+def run_import(job, status, slots=None, checkpoint=None, bucket=MY_SNAP_BUCKET, description="FortiWeb VM snapshot",
+               force=False, extract=False, part_size=DEFAULT_PART_SIZE, concurrency=DEFAULT_UPLOAD_CONCURRENCY):
+    """Import one build into AWS and return the AMI ID, resuming after the last step in checkpoint"""
+    slots = slots or {}
+    label = job.label
+    s3_key = f"vmdk/{job.license_type}/{job.version}/{job.build}.vmdk"
+    ami_name = job.name
+    data = checkpoint.data if checkpoint else {}
+
+    def reached(step):
+        return checkpoint is not None and checkpoint.reached(step)
+
+    def record(step, **values):
+        data.update(values)
+        if checkpoint is not None:
+            checkpoint.record(step, **values)
+
+    if reached('uploaded'):
+        status.skip(label, STAGES[:4], "done in an earlier run", 'resumed')
+    else:
+        # With --extract the cached image stays held until it is uploaded, so no other import evicts it meanwhile
+        if reached('extracted') and (not extract or (data.get('path') and hold(data['path']))):
+            status.skip(label, ['extract'], "done in an earlier run", 'resumed')
+        elif extract:
+            with status.stage(label, 'extract'):
+                vmdk_path, digest = extract_vmdk(job.zip_path)
+            print(f"    → SHA-256: {digest}")
+            record('extracted', digest=digest, path=vmdk_path)
+        else:
+            # Without --extract boot.vmdk is hashed while it streams into S3, and its digest is
+            # only known up front if an earlier run of this zip extracted or streamed it
+            status.skip(label, ['extract'], "hashed during the upload")
+            digest = known_member_digest(job.zip_path, 'boot.vmdk')
+            if digest:
+                record('extracted', digest=digest, path=None)
+
+        def lookup():
+            with status.stage(label, 'lookup'):
+                existing_ami_id = find_ami_by_digest(ami_name, data['digest'])
+            if existing_ami_id:
+                if data.get('path'):
+                    release(data['path'])
+                status.skip(label, STAGES[2:], f"{existing_ami_id} already holds this image")
+                if checkpoint is not None:
+                    checkpoint.finish()
+            return existing_ami_id
+
+        # A digest first learned from the upload is only looked up after it
+        lookup_after_upload = not force and not data.get('digest')
+        if not force and data.get('digest'):
+            existing_ami_id = lookup()
+            if existing_ami_id:
+                return existing_ami_id
+
+        def cleanup():
+            # Only the AMI name has to be free before registering, its snapshots are deleted in the background
+            snapshots = [Resource('snapshot', snapshot_id, ami_name, job.license_type, job.version, job.build)
+                         for snapshot_id in delete_existing_ami(ami_name)]
+            get_collector().submit('aws', snapshots, delete_resource)
+
+        # Removing the previous AMI and snapshot runs alongside the upload, unless that AMI may turn out to hold this image
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            cleanup_future = None if lookup_after_upload else executor.submit(status.run, label, 'cleanup', cleanup)
+            with status.stage(label, 'upload', slots.get('upload')):
+                if extract:
+                    try:
+                        upload_to_s3(data['path'], bucket, s3_key, data['digest'], part_size, concurrency)
+                    finally:
+                        release(data['path'])
+                else:
+                    digest = stream_zip_member_to_s3(job.zip_path, 'boot.vmdk', bucket, s3_key, part_size, concurrency,
+                                                     data.get('digest'))
+            if cleanup_future is not None:
+                cleanup_future.result()
+        if not data.get('digest'):
+            print(f"    → SHA-256: {digest}")
+            remember_member_digest(job.zip_path, 'boot.vmdk', digest)
+            data['digest'] = digest
+        if lookup_after_upload:
+            existing_ami_id = lookup()
+            if existing_ami_id:
+                return existing_ami_id
+            status.run(label, 'cleanup', cleanup)
+        record('uploaded', digest=data['digest'])
+
+    if reached('imported'):
+        status.skip(label, ['import'], f"snapshot {data['snapshot_id']} imported in an earlier run", 'resumed')
+    else:
+        with status.stage(label, 'import', slots.get('import')):
+            if reached('import_started'):
+                # Reattach to the task started by the interrupted run
+                print(f"[INFO] Resuming import task {data['task_id']}")
+            else:
+                record('import_started', task_id=import_snapshot(ami_name, description, bucket, s3_key, delete_existing=False))
+            try:
+                record('imported', snapshot_id=wait_for_completion(data['task_id']))
+            except SystemExit:
+                # A failed or expired task cannot be reattached to, the next run starts a new one from the upload
+                if checkpoint is not None:
+                    checkpoint.rollback('uploaded')
+                raise
+
+    with status.stage(label, 'register'):
+        if not reached('registered'):
+            record('registered', ami_id=create_ami_from_snapshot(data['snapshot_id'], ami_name, description, delete_existing=False))
+        tag_ami(data['ami_id'], job.version, job.build, job.license_type, data['digest'])
+    if checkpoint is not None:
+        checkpoint.finish()
+    return data['ami_id']
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Upload VM image, import snapshot, and create AMI.")
     parser.add_argument("zip_file", help="Path to FortiWeb image zip file")
     parser.add_argument("--bucket", default=MY_SNAP_BUCKET, help="S3 bucket name")
     parser.add_argument("--description", default="FortiWeb VM snapshot", help="Snapshot description")
+    parser.add_argument("--extract", action="store_true", help="Extract boot.vmdk to disk before uploading instead of streaming it from the zip")
+    parser.add_argument("--part-size-mb", type=int, default=DEFAULT_PART_SIZE // (1024 * 1024), help="Initial multipart upload part size in MB, adapted to the measured throughput")
+    parser.add_argument("--upload-concurrency", type=int, default=DEFAULT_UPLOAD_CONCURRENCY, help="Initial number of parts uploaded in parallel, adapted to the measured throughput")
+    parser.add_argument("--bandwidth-limit", type=float, help="Cap the upload rate at this many MB/s")
+    parser.add_argument("--force", action="store_true", help="Start over and upload and import even if an AMI with the same image digest exists")
+    parser.add_argument("--trace", help="Write a Chrome trace of the run's timing spans to this JSON file")
 
     args = parser.parse_args()
+    if args.trace:
+        start_trace(args.trace)
+    set_bandwidth_limit(args.bandwidth_limit)
 
-    # Parse filename and construct S3 key
-    license_type, version, build = parse_filename(args.zip_file)
-    s3_key = f"vmdk/{license_type}/{version}/{build}.vmdk"
-    ami_name = f"fwb-{license_type}-{version}-{build}"
-    
-    # Extract and upload boot.vmdk
-    print(f"\n[STEP 1] Extracting boot.vmdk from {args.zip_file}")
-    vmdk_path = extract_vmdk(args.zip_file)
-    print(f"    → Extracted to: {vmdk_path}")
-
-    print(f"\n[STEP 2] Uploading to S3 bucket {args.bucket}")
-    print(f"    → S3 Key: {s3_key}")
-    upload_to_s3(vmdk_path, args.bucket, s3_key)
-    print(f"    → Upload complete: s3://{args.bucket}/{s3_key}")
-
-    # Import snapshot with name
-    snapshot_name = f"fwb-{license_type}-{version}-{build}"
-    print(f"\n[STEP 3] Importing snapshot from S3")
-    print(f"    → Snapshot Name: {snapshot_name}")
-    task_id = import_snapshot(snapshot_name, args.description, args.bucket, s3_key)
-    snapshot_id = wait_for_completion(task_id)
-
-    # Create AMI from snapshot
-    print(f"\n[STEP 4] Creating AMI from snapshot")
-    print(f"    → AMI Name: {ami_name}")
-    ami_id = create_ami_from_snapshot(snapshot_id, ami_name, args.description, version, build, license_type)
+    job = Job.from_zip('aws', args.zip_file)
+    # An interrupted import of the same zip resumes after its last completed step
+    checkpoint = ImportJournal().checkpoint('aws', job.name, args.zip_file, restart=args.force)
+    ami_id = run_import(job, StageStatus(), checkpoint=checkpoint, bucket=args.bucket, description=args.description,
+                        force=args.force, extract=args.extract, part_size=args.part_size_mb * 1024 * 1024,
+                        concurrency=args.upload_concurrency)
     print(f"\n[FINAL] AMI ID for Terraform: {ami_id}")
+    # The replaced AMI's snapshots may still be being deleted
+    get_collector().wait()
@@ -1,43 +1,63 @@
 import os
 import sys
+import threading
 import argparse
-import re
-import zipfile
-import tempfile
+import mmap
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from azure.storage.blob import BlobServiceClient
-from azure.mgmt.compute import ComputeManagementClient
-from azure.identity import DefaultAzureCredential
-from azure.core.exceptions import AzureError
+from fwb_common import DIGEST_KEY, STAGES, Job, StageStatus, check_environment, parse_resource_name
+from fwb_cache import extract_cached, hold, release
+from fwb_clients import azure_blob_service_client, azure_compute_client
+from fwb_inventory import Resource, timestamp
+from fwb_journal import ImportJournal
+from fwb_trace import start_trace, traced
+from fwb_transfer import TransferController, set_bandwidth_limit
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Verify required environment variables are set
-required_vars = [
+# Required environment variables, verified by check_environment() before anything runs
+REQUIRED_VARS = [
     'AZURE_STORAGE_ACCOUNT',
     'AZURE_RESOURCE_GROUP', 
     'AZURE_LOCATION',
     'AZURE_SUBSCRIPTION_ID'
 ]
 
-missing_vars = [var for var in required_vars if not os.getenv(var)]
-if missing_vars:
-    print(f"[ERROR] Missing required environment variables: {', '.join(missing_vars)}")
-    print("Please set these in the .env file or environment variables")
-    sys.exit(1)
-
 MY_STORAGE_CONTAINER = 'fwb-vhd'
 
-def upload_to_blob_storage(file_path, container_name, blob_name):
-    """Upload file to Azure Blob Storage as page blob"""
+# Page blob uploads: 512-byte pages, at most 4 MB per upload_page call
+PAGE_SIZE = 512
+MAX_PAGE_RANGE = 4 * 1024 * 1024
+# Granularity of the zero scan, all-zero blocks of this size are skipped
+SCAN_BLOCK_SIZE = 64 * 1024
+DEFAULT_UPLOAD_CONCURRENCY = 8
+
+def find_data_ranges(data, size, block_size=SCAN_BLOCK_SIZE, max_range=MAX_PAGE_RANGE):
+    """Yield (offset, length) ranges of data that are not all zeros, each at most max_range long"""
+    zero_block = bytes(block_size)
+    range_start = None
+    for offset in range(0, size, block_size):
+        end = min(offset + block_size, size)
+        if data[offset:end] == zero_block[:end - offset]:
+            if range_start is not None:
+                yield range_start, offset - range_start
+                range_start = None
+            continue
+        if range_start is None:
+            range_start = offset
+        elif end - range_start > max_range:
+            yield range_start, offset - range_start
+            range_start = offset
+    if range_start is not None:
+        yield range_start, size - range_start
+
+@traced
+def upload_to_blob_storage(file_path, container_name, blob_name, concurrency=DEFAULT_UPLOAD_CONCURRENCY, digest=None):
+    """Upload file to Azure Blob Storage as page blob, skipping all-zero ranges"""
+    from azure.core.exceptions import AzureError
     try:
-        credential = DefaultAzureCredential()
-        blob_service_client = BlobServiceClient(
-            account_url=f"https://{os.environ['AZURE_STORAGE_ACCOUNT']}.blob.core.windows.net",
-            credential=credential
-        )
-        blob_client = blob_service_client.get_blob_client(container=container_name, blob=blob_name)
+        blob_client = azure_blob_service_client().get_blob_client(container=container_name, blob=blob_name)
         
         # Delete any existing blob to avoid conflicts with blob type
         try:
@@ -52,44 +72,71 @@ def upload_to_blob_storage(file_path, container_name, blob_name):
         print(f"[INFO] VHD file size: {file_size} bytes")
         
         # Page blobs must be aligned to 512-byte boundaries
-        # If the file isn't properly aligned, we need to handle it differently
-        if file_size % 512 != 0:
-            print(f"[WARNING] File size {file_size} is not aligned to 512-byte boundary")
-            # For misaligned files, we'll create a page blob and upload pages manually
-            aligned_size = ((file_size + 511) // 512) * 512
-            print(f"[INFO] Creating page blob with aligned size: {aligned_size} bytes")
-            blob_client.create_page_blob(aligned_size)
-            
-            # Upload in chunks
-            chunk_size = 4 * 1024 * 1024  # 4MB chunks
-            with open(file_path, "rb") as data:
-                offset = 0
-                while offset < file_size:
-                    chunk = data.read(chunk_size)
-                    if not chunk:
+        aligned_size = ((file_size + PAGE_SIZE - 1) // PAGE_SIZE) * PAGE_SIZE
+        if aligned_size != file_size:
+            print(f"[WARNING] File size {file_size} is not aligned to 512-byte boundary, padding to {aligned_size} bytes")
+        blob_client.create_page_blob(aligned_size)
+
+        with open(file_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            # Ranges are uploaded as the scan finds them, on as many streams as the controller allows
+            controller = TransferController(f"blob {container_name}/{blob_name}", concurrency)
+            failed = threading.Event()
+
+            def upload_range(offset, length):
+                page = data[offset:offset + length]
+                # Only the final range can be short of a page boundary
+                page += bytes(-len(page) % PAGE_SIZE)
+                try:
+                    controller.transfer(len(page), lambda: blob_client.upload_page(page, offset, len(page)))
+                except Exception:
+                    failed.set()
+                    raise
+
+            futures = []
+            data_bytes = 0
+            with ThreadPoolExecutor(max_workers=controller.max_streams) as executor:
+                # A new page blob reads back as zeros, so only ranges holding data are uploaded
+                for offset, length in find_data_ranges(data, file_size):
+                    controller.acquire()
+                    if failed.is_set():
+                        controller.release()
                         break
-                    
-                    # Calculate the end offset for this chunk
-                    end_offset = min(offset + len(chunk) - 1, aligned_size - 1)
-                    
-                    # Upload this page range
-                    blob_client.upload_pages(chunk, offset, end_offset)
-                    offset += len(chunk)
-        else:
-            # File is properly aligned, use direct upload
-            with open(file_path, "rb") as data:
-                blob_client.upload_blob(
-                    data, 
-                    blob_type="PageBlob"
-                )
+                    futures.append(executor.submit(upload_range, offset, length))
+                    data_bytes += length
+                if failed.is_set():
+                    # The remaining ranges would only retry against the same failure
+                    for future in futures:
+                        future.cancel()
+                for future in futures:
+                    if not future.cancelled():
+                        future.result()
+            print(f"[INFO] Uploaded {data_bytes} bytes in {len(futures)} ranges, skipped {file_size - data_bytes} zero bytes: {controller.summary()}")
+
+        if digest:
+            blob_client.set_blob_metadata({DIGEST_KEY: digest})
+
         print(f"[INFO] Successfully uploaded {file_path} to blob {blob_name} as page blob")
         return True
     except AzureError as e:
         print(f"[ERROR] Failed to upload file: {e}")
         sys.exit(1)
 
+def image_has_digest(compute_client, image_name, digest):
+    """Check whether the managed image with this name was created from an image with this digest"""
+    from azure.core.exceptions import AzureError
+    try:
+        image = compute_client.images.get(
+            resource_group_name=os.environ['AZURE_RESOURCE_GROUP'],
+            image_name=image_name
+        )
+    except AzureError:
+        return False
+    return image.provisioning_state == "Succeeded" and (image.tags or {}).get(DIGEST_KEY) == digest
+
+@traced
 def delete_existing_image(compute_client, image_name):
     """Delete image if one with same name exists"""
+    from azure.core.exceptions import AzureError
     try:
         compute_client.images.get(
             resource_group_name=os.environ['AZURE_RESOURCE_GROUP'],
@@ -107,11 +154,14 @@ def delete_existing_image(compute_client, image_name):
         else:
             print(f"[WARNING] Error checking/deleting existing image: {e}")
 
-def create_image_from_blob(compute_client, blob_url, image_name, description, version, build, license_type):
+@traced
+def create_image_from_blob(compute_client, blob_url, image_name, description, version, build, license_type, digest=None, delete_existing=True):
     """Create managed image from blob storage"""
+    from azure.core.exceptions import AzureError
     try:
-        # First delete any existing image with same name
-        delete_existing_image(compute_client, image_name)
+        # First delete any existing image with same name, unless the caller already cleaned up
+        if delete_existing:
+            delete_existing_image(compute_client, image_name)
         
         # Create image definition
         image_def = {
@@ -125,8 +175,16 @@ def create_image_from_blob(compute_client, blob_url, image_name, description, ve
                     "caching": "None"
                 }
             },
-            "hyper_v_generation": "V1"
+            "hyper_v_generation": "V1",
+            "tags": {
+                "owner": "fwbqa",
+                "version": version,
+                "build": build,
+                "license_type": license_type
+            }
         }
+        if digest:
+            image_def["tags"][DIGEST_KEY] = digest
         
         compute_client.images.begin_create_or_update(
             resource_group_name=os.environ['AZURE_RESOURCE_GROUP'],
@@ -140,72 +198,130 @@ def create_image_from_blob(compute_client, blob_url, image_name, description, ve
         print(f"[ERROR] Failed to create image: {e}")
         sys.exit(1)
 
-def parse_filename(filename):
-    """Parse zip filename to extract components for blob name"""
-    license_type = 'payg' if 'ONDEMAND' in filename.upper() else 'byol'
-    
-    version_match = re.search(r'-v(\d+)\.', filename)
-    version = f'v{version_match.group(1)}' if version_match else 'v7'
-    
-    build_match = re.search(r'-build(\d+)-', filename)
-    build = build_match.group(1) if build_match else '0000'
-    
-    return license_type, version, build
+@traced
+def list_inventory(container=MY_STORAGE_CONTAINER):
+    """List the fwbqa managed images and the uploaded VHD blobs, following every page"""
+    resources = []
+    # The SDK pagers fetch further pages as they are iterated
+    for image in azure_compute_client().images.list_by_resource_group(os.environ['AZURE_RESOURCE_GROUP']):
+        tags = image.tags or {}
+        if tags.get('owner') != 'fwbqa':
+            continue
+        tagged = (tags.get('license_type'), tags.get('version'), tags.get('build'))
+        key = tagged if all(tagged) else parse_resource_name(image.name)
+        if key:
+            os_disk = image.storage_profile.os_disk if image.storage_profile else None
+            # Managed images carry no creation time of their own, only the ARM system metadata does
+            system_data = getattr(image, 'system_data', None)
+            resources.append(Resource('image', image.id, image.name, *key, tags.get(DIGEST_KEY),
+                                      timestamp(system_data.created_at if system_data else None), None,
+                                      os_disk.blob_uri if os_disk else None))
+
+    container_client = azure_blob_service_client().get_container_client(container)
+    for blob in container_client.list_blobs(include=['metadata']):
+        key = parse_resource_name(blob.name)
+        if key:
+            resources.append(Resource('object', f"{container}/{blob.name}", blob.name, *key,
+                                      (blob.metadata or {}).get(DIGEST_KEY), timestamp(blob.creation_time), blob.size))
+    return resources
 
+def delete_resource(resource):
+    """Delete a managed image or uploaded VHD blob found by list_inventory"""
+    if resource.kind == 'image':
+        azure_compute_client().images.begin_delete(
+            resource_group_name=os.environ['AZURE_RESOURCE_GROUP'],
+            image_name=resource.name
+        ).result()
+    else:
+        container, blob_name = resource.id.split('/', 1)
+        azure_blob_service_client().get_blob_client(container=container, blob=blob_name).delete_blob()
+
+@traced
 def extract_vhd(zip_path):
-    """Extract boot.vhd from zip file to system temp directory"""
-    temp_dir = os.path.join(tempfile.gettempdir(), 'fwb_import')
-    if not os.path.exists(temp_dir):
-        os.makedirs(temp_dir)
-    
-    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-        for file in zip_ref.namelist():
-            if file.endswith('boot.vhd'):
-                zip_ref.extract(file, temp_dir)
-                return os.path.join(temp_dir, file)
-    raise Exception("boot.vhd not found in zip file")
+    """Extract boot.vhd from zip file into the extraction cache, returning (path, sha256)"""
+    return extract_cached(zip_path, 'boot.vhd')
+
+def run_import(job, status, slots=None, checkpoint=None, container=MY_STORAGE_CONTAINER, description="FortiWeb VM image",
+               force=False, concurrency=DEFAULT_UPLOAD_CONCURRENCY):
+    """Import one build into Azure and return the managed image name, resuming after the last step in checkpoint"""
+    slots = slots or {}
+    label = job.label
+    blob_name = f"{job.license_type}/{job.version}/{job.build}.vhd"
+    image_name = job.name
+    data = checkpoint.data if checkpoint else {}
+
+    def reached(step):
+        return checkpoint is not None and checkpoint.reached(step)
+
+    def record(step, **values):
+        data.update(values)
+        if checkpoint is not None:
+            checkpoint.record(step, **values)
+
+    compute_client = azure_compute_client()
+    if reached('uploaded'):
+        status.skip(label, STAGES[:4], "done in an earlier run", 'resumed')
+    else:
+        # The cached image stays held until it is uploaded, so no other import evicts it meanwhile
+        if reached('extracted') and hold(data['path']):
+            status.skip(label, ['extract'], "done in an earlier run", 'resumed')
+        else:
+            with status.stage(label, 'extract'):
+                vhd_path, digest = extract_vhd(job.zip_path)
+            print(f"    → Extracted to: {vhd_path}")
+            print(f"    → SHA-256: {digest}")
+            record('extracted', digest=digest, path=vhd_path)
+
+        # A managed image built from a byte-identical VHD needs no upload or re-creation
+        if not force:
+            with status.stage(label, 'lookup'):
+                unchanged = image_has_digest(compute_client, image_name, data['digest'])
+            if unchanged:
+                release(data['path'])
+                status.skip(label, STAGES[2:], f"{image_name} already holds this image")
+                if checkpoint is not None:
+                    checkpoint.finish()
+                return image_name
+
+        # Deleting the old managed image blocks on a long-running operation, keep it off the upload path
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            cleanup_future = executor.submit(status.run, label, 'cleanup', delete_existing_image, compute_client, image_name)
+            with status.stage(label, 'upload', slots.get('upload')):
+                try:
+                    upload_to_blob_storage(data['path'], container, blob_name, concurrency, data['digest'])
+                finally:
+                    release(data['path'])
+            cleanup_future.result()
+        record('uploaded')
+
+    # The managed image is created with its tags, so registering also covers tagging
+    blob_url = f"https://{os.environ['AZURE_STORAGE_ACCOUNT']}.blob.core.windows.net/{container}/{blob_name}"
+    with status.stage(label, 'register', slots.get('import')):
+        create_image_from_blob(compute_client, blob_url, image_name, description, job.version, job.build,
+                               job.license_type, data['digest'], delete_existing=False)
+    if checkpoint is not None:
+        checkpoint.finish()
+    return image_name
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Upload VM image and create Azure managed image.")
     parser.add_argument("zip_file", help="Path to FortiWeb image zip file")
     parser.add_argument("--container", default=MY_STORAGE_CONTAINER, help="Storage container name")
     parser.add_argument("--description", default="FortiWeb VM image", help="Image description")
+    parser.add_argument("--upload-concurrency", type=int, default=DEFAULT_UPLOAD_CONCURRENCY, help="Initial number of page ranges uploaded in parallel, adapted to the measured throughput")
+    parser.add_argument("--bandwidth-limit", type=float, help="Cap the upload rate at this many MB/s")
+    parser.add_argument("--force", action="store_true", help="Start over and upload and create the image even if it already holds the same image digest")
+    parser.add_argument("--trace", help="Write a Chrome trace of the run's timing spans to this JSON file")
 
     args = parser.parse_args()
+    if args.trace:
+        start_trace(args.trace)
+    set_bandwidth_limit(args.bandwidth_limit)
+    check_environment(REQUIRED_VARS)
 
-    # Parse filename and construct blob name
-    license_type, version, build = parse_filename(args.zip_file)
-    blob_name = f"{license_type}/{version}/{build}.vhd"
-    image_name = f"fwb-{license_type}-{version}-{build}"
-    
-    # Extract and upload boot.vhd
-    print(f"\n[STEP 1] Extracting boot.vhd from {args.zip_file}")
-    vhd_path = extract_vhd(args.zip_file)
-    print(f"    → Extracted to: {vhd_path}")
-
-    print(f"\n[STEP 2] Uploading to Azure Blob Storage container {args.container}")
-    print(f"    → Blob Name: {blob_name}")
-    upload_to_blob_storage(vhd_path, args.container, blob_name)
-    
-    # Create managed image
-    blob_url = f"https://{os.environ['AZURE_STORAGE_ACCOUNT']}.blob.core.windows.net/{args.container}/{blob_name}"
-    print(f"\n[STEP 3] Creating managed image")
-    print(f"    → Image Name: {image_name}")
-    
-    credential = DefaultAzureCredential()
-    compute_client = ComputeManagementClient(
-        credential,
-        os.environ['AZURE_SUBSCRIPTION_ID']
-    )
-    
-    image_name_result = create_image_from_blob(
-        compute_client,
-        blob_url,
-        image_name,
-        args.description,
-        version,
-        build,
-        license_type
-    )
-    
-    print(f"\n[FINAL] Created managed image: {image_name_result}")
+    job = Job.from_zip('azure', args.zip_file)
+    # An interrupted import of the same zip resumes after its last completed step
+    checkpoint = ImportJournal().checkpoint('azure', job.name, args.zip_file, restart=args.force)
+    image_name = run_import(job, StageStatus(), checkpoint=checkpoint, container=args.container,
+                            description=args.description, force=args.force, concurrency=args.upload_concurrency)
+    print(f"\n[FINAL] Created managed image: {image_name}")
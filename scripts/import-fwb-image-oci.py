@@ -1,68 +1,193 @@
 import os
 import sys
 import argparse
-import re
-import zipfile
 import tempfile
-import oci
-from oci.core import ComputeClient, BlockstorageClient
-from oci.object_storage import ObjectStorageClient
-from oci.core.models import (
-    CreateImageDetails,
-    ImageSourceViaObjectStorageTupleDetails
-)
-from oci.exceptions import ServiceError
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from fwb_common import DIGEST_KEY, STAGES, Job, StageStatus, check_environment, parse_resource_name
+from fwb_cache import extract_cached, hold, release
+from fwb_clients import oci_compute_client, oci_object_storage_client, oci_work_request_client
+from fwb_inventory import Resource, timestamp
+from fwb_journal import ImportJournal
+from fwb_poller import PollStatus, OperationFailed, get_poller
+from fwb_trace import start_trace, traced
+from fwb_transfer import TransferController, memory_budget, set_bandwidth_limit
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Verify required environment variables are set
-required_vars = [
+# Required environment variables, verified by check_environment() before anything runs
+REQUIRED_VARS = [
     'OCI_REGION',
     'OCI_COMPARTMENT_ID',
     'OCI_BUCKET_NAME',
     'OCI_NAMESPACE'
 ]
 
-missing_vars = [var for var in required_vars if not os.getenv(var)]
-if missing_vars:
-    print(f"[ERROR] Missing required environment variables: {', '.join(missing_vars)}")
-    print("Please set these in the .env file or environment variables")
-    sys.exit(1)
+# Multipart upload defaults, Object Storage allows at most 10000 parts per upload
+DEFAULT_PART_SIZE = 128 * 1024 * 1024
+DEFAULT_UPLOAD_CONCURRENCY = 4
+MAX_PARTS = 10000
+JOURNAL_DIR = os.path.join(tempfile.gettempdir(), 'fwb_import', 'journal')
 
-def upload_to_object_storage(file_path, bucket_name, object_name):
-    """Upload file to OCI Object Storage"""
+def _journal_path(namespace, bucket_name, object_name):
+    """Local resume journal for one object, keyed by its full Object Storage location"""
+    safe_name = f"{namespace}_{bucket_name}_{object_name}".replace('/', '_')
+    return os.path.join(JOURNAL_DIR, f"{safe_name}.json")
+
+def _write_journal(path, journal):
+    """Atomically persist the resume journal"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(journal, f)
+    os.replace(temp_path, path)
+
+def _load_resumable_journal(client, namespace, bucket_name, object_name, path, file_stat, part_size, digest=None):
+    """Return the journal of an unfinished upload of the same file, refreshed from the server, or None"""
+    from oci.exceptions import ServiceError
+    try:
+        with open(path, 'r') as f:
+            journal = json.load(f)
+    except (OSError, ValueError):
+        return None
+    # Re-extracting the image changes its mtime but not its digest, so the digest wins when known
+    same_file = journal.get('digest') == digest if digest else journal.get('file_mtime') == file_stat.st_mtime_ns
+    if not same_file or journal.get('file_size') != file_stat.st_size or journal.get('part_size') != part_size:
+        print("[INFO] Resume journal belongs to a different file or part size, starting a new upload")
+        return None
+    try:
+        # The server's list of parts is authoritative, the journal may lag behind a crash
+        parts = []
+        page = None
+        while True:
+            kwargs = {'page': page} if page else {}
+            response = client.list_multipart_upload_parts(namespace, bucket_name, object_name, journal['upload_id'], **kwargs)
+            parts.extend(response.data)
+            if not response.has_next_page:
+                break
+            page = response.next_page
+    except ServiceError as e:
+        if e.status == 404:
+            print(f"[INFO] Upload {journal['upload_id']} no longer exists, starting a new upload")
+            return None
+        raise
+    journal['parts'] = {str(part.part_number): part.etag for part in parts}
+    return journal
+
+def multipart_upload(client, namespace, bucket_name, object_name, file_path,
+                     part_size=DEFAULT_PART_SIZE, concurrency=DEFAULT_UPLOAD_CONCURRENCY, digest=None):
+    """Upload a file in parallel parts, resuming an interrupted upload of the same file from its journal"""
+    from oci.object_storage.models import (
+        CreateMultipartUploadDetails,
+        CommitMultipartUploadDetails,
+        CommitMultipartUploadPartDetails
+    )
+    file_stat = os.stat(file_path)
+    # Grow the part size if needed to stay within the part count limit
+    part_size = max(part_size, -(-file_stat.st_size // MAX_PARTS))
+    part_count = max(1, -(-file_stat.st_size // part_size))
+    journal_path = _journal_path(namespace, bucket_name, object_name)
+
+    journal = _load_resumable_journal(client, namespace, bucket_name, object_name, journal_path, file_stat, part_size, digest)
+    if journal:
+        print(f"[INFO] Resuming upload {journal['upload_id']}: {len(journal['parts'])}/{part_count} parts already committed")
+    else:
+        upload_id = client.create_multipart_upload(
+            namespace, bucket_name,
+            CreateMultipartUploadDetails(
+                object=object_name,
+                metadata={f'opc-meta-{DIGEST_KEY}': digest} if digest else None
+            )
+        ).data.upload_id
+        journal = {
+            'upload_id': upload_id,
+            'object_name': object_name,
+            'file_size': file_stat.st_size,
+            'file_mtime': file_stat.st_mtime_ns,
+            'digest': digest,
+            'part_size': part_size,
+            'parts': {}
+        }
+        print(f"[INFO] Started multipart upload {upload_id} with {part_count} parts of {part_size // (1024 * 1024)} MB")
+    _write_journal(journal_path, journal)
+    journal_lock = threading.Lock()
+    # The part size is fixed by the journal so uploads stay resumable, only the stream count adapts.
+    # More streams cannot come from smaller parts, so they may use a share of the free memory instead.
+    controller = TransferController(f"oci://{namespace}@{bucket_name}/{object_name}", concurrency, part_size=part_size,
+                                    max_buffered=memory_budget())
+
+    failed = threading.Event()
+
+    def upload_part(part_number):
+        offset = (part_number - 1) * part_size
+
+        def send():
+            with open(file_path, 'rb') as f:
+                f.seek(offset)
+                data = f.read(part_size)
+            return client.upload_part(namespace, bucket_name, object_name, journal['upload_id'], part_number, data)
+
+        try:
+            response = controller.transfer(min(part_size, file_stat.st_size - offset), send)
+        except Exception:
+            failed.set()
+            raise
+        with journal_lock:
+            journal['parts'][str(part_number)] = response.headers['etag']
+            _write_journal(journal_path, journal)
+
+    pending = [n for n in range(1, part_count + 1) if str(n) not in journal['parts']]
+    with ThreadPoolExecutor(max_workers=controller.max_streams) as executor:
+        futures = []
+        for n in pending:
+            controller.acquire()
+            if failed.is_set():
+                controller.release()
+                break
+            futures.append(executor.submit(upload_part, n))
+        if failed.is_set():
+            # The remaining parts would only retry against the same failure. The upload is not
+            # aborted, its committed parts stay in the journal for the next run to resume from.
+            for future in futures:
+                future.cancel()
+        for future in futures:
+            if not future.cancelled():
+                future.result()
+    if pending:
+        print(f"[INFO] Uploaded {len(pending)} parts: {controller.summary()}")
+
+    client.commit_multipart_upload(
+        namespace, bucket_name, object_name, journal['upload_id'],
+        CommitMultipartUploadDetails(parts_to_commit=[
+            CommitMultipartUploadPartDetails(part_num=int(n), etag=etag)
+            for n, etag in sorted(journal['parts'].items(), key=lambda item: int(item[0]))
+        ])
+    )
+    os.remove(journal_path)
+    return part_count
+
+@traced
+def upload_to_object_storage(file_path, bucket_name, object_name, part_size=DEFAULT_PART_SIZE,
+                             concurrency=DEFAULT_UPLOAD_CONCURRENCY, object_storage_client=None, digest=None):
+    """Upload file to OCI Object Storage with a parallel, resumable multipart upload"""
+    from oci.exceptions import ServiceError
     try:
-        config = oci.config.from_file()
-        object_storage_client = ObjectStorageClient(config)
+        if object_storage_client is None:
+            object_storage_client = oci_object_storage_client()
         
         namespace = os.environ['OCI_NAMESPACE']
         
-        # Delete any existing object to avoid conflicts
-        try:
-            object_storage_client.delete_object(
-                namespace_name=namespace,
-                bucket_name=bucket_name,
-                object_name=object_name
-            )
-            print(f"[INFO] Deleted existing object {object_name}")
-        except ServiceError as e:
-            if e.status == 404:
-                print(f"[INFO] No existing object to delete: {object_name}")
-            else:
-                print(f"[WARNING] Error deleting existing object: {e}")
-        
-        # Upload the file
-        with open(file_path, "rb") as f:
-            object_storage_client.put_object(
-                namespace_name=namespace,
-                bucket_name=bucket_name,
-                object_name=object_name,
-                put_object_body=f
-            )
+        # Committing the multipart upload replaces any existing object, so nothing is deleted up front
+        # and an interrupted run can pick up where it stopped
+        part_count = multipart_upload(
+            object_storage_client, namespace, bucket_name, object_name, file_path,
+            part_size, concurrency, digest
+        )
             
-        print(f"[INFO] Successfully uploaded {file_path} to oci://{namespace}@{bucket_name}/{object_name}")
+        print(f"[INFO] Successfully uploaded {file_path} to oci://{namespace}@{bucket_name}/{object_name} in {part_count} parts")
         return True
     except ServiceError as e:
         print(f"[ERROR] Failed to upload file: {e}")
@@ -71,8 +196,27 @@ def upload_to_object_storage(file_path, bucket_name, object_name):
         print(f"[ERROR] Unexpected error during upload: {e}")
         sys.exit(1)
 
+def find_image_by_digest(compute_client, image_name, digest):
+    """Return the ID of an available custom image with this name created from an image with this digest, if any"""
+    from oci.exceptions import ServiceError
+    try:
+        images = compute_client.list_images(
+            compartment_id=os.environ['OCI_COMPARTMENT_ID'],
+            display_name=image_name,
+            lifecycle_state="AVAILABLE"
+        ).data
+    except ServiceError as e:
+        print(f"[WARNING] Error looking up image by digest: {e}")
+        return None
+    for image in images:
+        if (image.freeform_tags or {}).get(DIGEST_KEY) == digest:
+            return image.id
+    return None
+
+@traced
 def delete_existing_image(compute_client, image_name):
     """Delete image if one with same name exists"""
+    from oci.exceptions import ServiceError
     try:
         # List images with the same display name
         images = compute_client.list_images(
@@ -91,11 +235,65 @@ def delete_existing_image(compute_client, image_name):
         else:
             print(f"[WARNING] Error checking/deleting existing image: {e}")
 
-def create_image_from_object(compute_client, object_name, image_name, description, version, build, license_type):
-    """Create custom image from object storage"""
+# Work request and image states mapped onto the poller's running/done/failed
+WORK_REQUEST_STATES = {
+    "ACCEPTED": "running",
+    "IN_PROGRESS": "running",
+    "CANCELING": "running",
+    "SUCCEEDED": "done",
+    "FAILED": "failed",
+    "CANCELED": "failed",
+}
+IMAGE_STATES = {
+    "PROVISIONING": "running",
+    "IMPORTING": "running",
+    "AVAILABLE": "done",
+    "FAILED": "failed",
+}
+
+def image_import_statuses(compute_client, work_request_client=None):
+    """Build a poller fetch function for image imports
+
+    With a work request client, each image is tracked by the work request that
+    creates it, which also reports progress; otherwise by its lifecycle state.
+    OCI has no batch get, so each ID costs one call.
+    """
+    def status_of(operation_id):
+        if work_request_client is not None:
+            work_request = work_request_client.get_work_request(operation_id).data
+            return PollStatus(
+                WORK_REQUEST_STATES.get(work_request.status, "running"),
+                work_request.percent_complete, None, f"Status: {work_request.status}"
+            )
+        state = compute_client.get_image(image_id=operation_id).data.lifecycle_state
+        if state not in IMAGE_STATES:
+            # Nothing more will happen to an image in an unknown state, go ahead with tagging
+            print(f"[WARNING] Unexpected image state: {state}")
+        return PollStatus(IMAGE_STATES.get(state, "done"), None, None, f"Status: {state}")
+
+    def fetch(ids):
+        from oci.exceptions import ServiceError
+        statuses = {}
+        for operation_id in ids:
+            try:
+                statuses[operation_id] = status_of(operation_id)
+            except ServiceError as e:
+                if e.status != 404:
+                    raise
+                # Work requests expire after some days, an unknown ID will never complete
+                statuses[operation_id] = PollStatus('failed', detail=f"{operation_id} not found")
+        return statuses
+    return fetch
+
+@traced
+def create_image_from_object(compute_client, object_name, image_name, bucket_name=None, delete_existing=True):
+    """Start creating a custom image from object storage, returning (image ID, work request ID)"""
+    from oci.core.models import CreateImageDetails, ImageSourceViaObjectStorageTupleDetails
+    from oci.exceptions import ServiceError
     try:
-        # First delete any existing image with same name
-        delete_existing_image(compute_client, image_name)
+        # First delete any existing image with same name, unless the caller already cleaned up
+        if delete_existing:
+            delete_existing_image(compute_client, image_name)
         
         # Create image from object storage
         create_image_details = CreateImageDetails(
@@ -105,7 +303,7 @@ def create_image_from_object(compute_client, object_name, image_name, descriptio
             image_source_details=ImageSourceViaObjectStorageTupleDetails(
                 source_type="objectStorageTuple",
                 namespace_name=os.environ['OCI_NAMESPACE'],
-                bucket_name=os.environ['OCI_BUCKET_NAME'],
+                bucket_name=bucket_name or os.environ['OCI_BUCKET_NAME'],
                 object_name=object_name
             )
         )
@@ -113,111 +311,209 @@ def create_image_from_object(compute_client, object_name, image_name, descriptio
         response = compute_client.create_image(create_image_details=create_image_details)
         image_id = response.data.id
         print(f"[INFO] Image creation started: {image_id}")
-        
-        # Wait for image to reach AVAILABLE state before updating tags
-        print("[INFO] Waiting for image to reach AVAILABLE state...")
-        while True:
-            image = compute_client.get_image(image_id=image_id).data
-            if image.lifecycle_state == "AVAILABLE":
-                print("[INFO] Image is now AVAILABLE")
-                break
-            elif image.lifecycle_state == "FAILED":
-                print("[ERROR] Image creation failed")
-                sys.exit(1)
-            elif image.lifecycle_state not in ["PROVISIONING", "IMPORTING", "AVAILABLE"]:
-                print(f"[WARNING] Unexpected image state: {image.lifecycle_state}")
-                break
-            # Wait before checking again
-            import time
-            time.sleep(10)
-        
-        # Add tags to the image
-        freeform_tags = {
-            "owner": "fwbqa",
-            "version": version,
-            "build": build,
-            "license_type": license_type,
-            "description": description
-        }
-        
+        return image_id, response.headers.get('opc-work-request-id')
+    except ServiceError as e:
+        print(f"[ERROR] Failed to create image: {e}")
+        sys.exit(1)
+
+@traced
+def wait_for_image(compute_client, image_id, work_request_id, image_name):
+    """Wait on the shared status poller for an image to reach AVAILABLE state"""
+    print("[INFO] Waiting for image to reach AVAILABLE state...")
+    try:
+        if work_request_id:
+            fetch = image_import_statuses(compute_client, oci_work_request_client())
+            get_poller().track(work_request_id, fetch, f"Image {image_name}").result()
+        else:
+            get_poller().track(image_id, image_import_statuses(compute_client), f"Image {image_name}").result()
+    except OperationFailed as e:
+        print(f"[ERROR] Image creation failed: {e}")
+        sys.exit(1)
+    print("[INFO] Image is now AVAILABLE")
+
+@traced
+def tag_image(compute_client, image_id, description, version, build, license_type, digest=None):
+    """Add owner, version, build, license_type and image digest tags to the image"""
+    from oci.core.models import UpdateImageDetails
+    from oci.exceptions import ServiceError
+    freeform_tags = {
+        "owner": "fwbqa",
+        "version": version,
+        "build": build,
+        "license_type": license_type,
+        "description": description
+    }
+    if digest:
+        freeform_tags[DIGEST_KEY] = digest
+    try:
         compute_client.update_image(
             image_id=image_id,
-            update_image_details=oci.core.models.UpdateImageDetails(
+            update_image_details=UpdateImageDetails(
                 freeform_tags=freeform_tags
             )
         )
-        
-        print(f"[SUCCESS] Created custom image {image_name} ({image_id}) from object {object_name}")
-        return image_id
+        print(f"[INFO] Tagged image {image_id}")
     except ServiceError as e:
-        print(f"[ERROR] Failed to create image: {e}")
-        sys.exit(1)
-    except Exception as e:
-        print(f"[ERROR] Unexpected error during image creation: {e}")
+        print(f"[ERROR] Failed to tag image: {e}")
         sys.exit(1)
 
-def parse_filename(filename):
-    """Parse zip filename to extract components for object name"""
-    license_type = 'payg' if 'ONDEMAND' in filename.upper() else 'byol'
-    
-    version_match = re.search(r'-v(\d+)\.', filename)
-    version = f'v{version_match.group(1)}' if version_match else 'v7'
-    
-    build_match = re.search(r'-build(\d+)-', filename)
-    build = build_match.group(1) if build_match else '0000'
-    
-    return license_type, version, build
+@traced
+def list_inventory(bucket_name=None):
+    """List the fwbqa custom images and the uploaded qcow2 objects, following every page"""
+    compute_client = oci_compute_client()
+    resources = []
+    page = None
+    while True:
+        # Platform images are listed too, the owner tag tells ours apart
+        kwargs = {'page': page} if page else {}
+        response = compute_client.list_images(compartment_id=os.environ['OCI_COMPARTMENT_ID'], **kwargs)
+        for image in response.data:
+            tags = image.freeform_tags or {}
+            if tags.get('owner') != 'fwbqa' or image.lifecycle_state == 'DELETED':
+                continue
+            tagged = (tags.get('license_type'), tags.get('version'), tags.get('build'))
+            key = tagged if all(tagged) else parse_resource_name(image.display_name)
+            if key:
+                size = image.size_in_mbs * 1024 * 1024 if image.size_in_mbs else None
+                resources.append(Resource('image', image.id, image.display_name, *key, tags.get(DIGEST_KEY),
+                                          timestamp(image.time_created), size))
+        if not response.has_next_page:
+            break
+        page = response.next_page
 
+    client = oci_object_storage_client()
+    namespace = os.environ['OCI_NAMESPACE']
+    bucket_name = bucket_name or os.environ['OCI_BUCKET_NAME']
+    start = None
+    while True:
+        kwargs = {'start': start} if start else {}
+        listing = client.list_objects(namespace, bucket_name, fields='name,size,timeCreated', **kwargs).data
+        for obj in listing.objects:
+            key = parse_resource_name(obj.name)
+            if key:
+                resources.append(Resource('object', f"oci://{namespace}@{bucket_name}/{obj.name}", obj.name, *key,
+                                          None, timestamp(obj.time_created), obj.size))
+        if not listing.next_start_with:
+            break
+        start = listing.next_start_with
+    return resources
+
+def delete_resource(resource):
+    """Delete a custom image or uploaded qcow2 object found by list_inventory"""
+    if resource.kind == 'image':
+        oci_compute_client().delete_image(image_id=resource.id)
+    else:
+        location, object_name = resource.id[len('oci://'):].split('/', 1)
+        namespace, bucket_name = location.split('@', 1)
+        oci_object_storage_client().delete_object(namespace, bucket_name, object_name)
+
+@traced
 def extract_qcow2(zip_path):
-    """Extract .qcow2 file from zip file to system temp directory"""
-    temp_dir = os.path.join(tempfile.gettempdir(), 'fwb_import')
-    if not os.path.exists(temp_dir):
-        os.makedirs(temp_dir)
-    
-    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-        for file in zip_ref.namelist():
-            if file.endswith('.qcow2'):
-                zip_ref.extract(file, temp_dir)
-                return os.path.join(temp_dir, file)
-    raise Exception(".qcow2 file not found in zip file")
+    """Extract .qcow2 file from zip file into the extraction cache, returning (path, sha256)"""
+    return extract_cached(zip_path, '.qcow2')
+
+def run_import(job, status, slots=None, checkpoint=None, bucket_name=None, description="FortiWeb VM image",
+               force=False, part_size=DEFAULT_PART_SIZE, concurrency=DEFAULT_UPLOAD_CONCURRENCY):
+    """Import one build into OCI and return the custom image ID, resuming after the last step in checkpoint"""
+    slots = slots or {}
+    label = job.label
+    bucket_name = bucket_name or os.environ['OCI_BUCKET_NAME']
+    object_name = f"{job.license_type}/{job.version}/{job.build}.qcow2"
+    image_name = job.name
+    data = checkpoint.data if checkpoint else {}
+
+    def reached(step):
+        return checkpoint is not None and checkpoint.reached(step)
+
+    def record(step, **values):
+        data.update(values)
+        if checkpoint is not None:
+            checkpoint.record(step, **values)
+
+    compute_client = oci_compute_client()
+    if reached('uploaded'):
+        status.skip(label, STAGES[:4], "done in an earlier run", 'resumed')
+    else:
+        # The cached image stays held until it is uploaded, so no other import evicts it meanwhile
+        if reached('extracted') and hold(data['path']):
+            status.skip(label, ['extract'], "done in an earlier run", 'resumed')
+        else:
+            with status.stage(label, 'extract'):
+                qcow2_path, digest = extract_qcow2(job.zip_path)
+            print(f"    → Extracted to: {qcow2_path}")
+            print(f"    → SHA-256: {digest}")
+            record('extracted', digest=digest, path=qcow2_path)
+
+        # A custom image built from a byte-identical qcow2 needs no upload or re-creation
+        if not force:
+            with status.stage(label, 'lookup'):
+                existing_image_id = find_image_by_digest(compute_client, image_name, data['digest'])
+            if existing_image_id:
+                release(data['path'])
+                status.skip(label, STAGES[2:], f"{existing_image_id} already holds this image")
+                if checkpoint is not None:
+                    checkpoint.finish()
+                return existing_image_id
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            cleanup_future = executor.submit(status.run, label, 'cleanup', delete_existing_image, compute_client, image_name)
+            with status.stage(label, 'upload', slots.get('upload')):
+                # The multipart upload keeps its own journal, so an interrupted upload resumes part by part
+                try:
+                    upload_to_object_storage(data['path'], bucket_name, object_name, part_size, concurrency, digest=data['digest'])
+                finally:
+                    release(data['path'])
+            cleanup_future.result()
+        record('uploaded')
+
+    if reached('imported'):
+        status.skip(label, ['import'], f"image {data['image_id']} imported in an earlier run", 'resumed')
+    else:
+        with status.stage(label, 'import', slots.get('import')):
+            if reached('import_started'):
+                # Reattach to the image creation started by the interrupted run
+                print(f"[INFO] Resuming creation of image {data['image_id']}")
+            else:
+                image_id, work_request_id = create_image_from_object(compute_client, object_name, image_name,
+                                                                     bucket_name, delete_existing=False)
+                record('import_started', image_id=image_id, work_request_id=work_request_id)
+            try:
+                wait_for_image(compute_client, data['image_id'], data['work_request_id'], image_name)
+            except SystemExit:
+                # A failed or vanished image creation cannot be reattached to, the next run starts a new one
+                if checkpoint is not None:
+                    checkpoint.rollback('uploaded')
+                raise
+            record('imported')
+
+    with status.stage(label, 'register'):
+        tag_image(compute_client, data['image_id'], description, job.version, job.build, job.license_type, data['digest'])
+    print(f"[SUCCESS] Created custom image {image_name} ({data['image_id']}) from object {object_name}")
+    if checkpoint is not None:
+        checkpoint.finish()
+    return data['image_id']
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Upload VM image to OCI Object Storage and create custom image.")
     parser.add_argument("zip_file", help="Path to FortiWeb image zip file")
     parser.add_argument("--bucket", default=os.environ.get('OCI_BUCKET_NAME'), help="Object Storage bucket name")
     parser.add_argument("--description", default="FortiWeb VM image", help="Image description")
+    parser.add_argument("--part-size-mb", type=int, default=DEFAULT_PART_SIZE // (1024 * 1024), help="Multipart upload part size in MB")
+    parser.add_argument("--upload-concurrency", type=int, default=DEFAULT_UPLOAD_CONCURRENCY, help="Initial number of parts uploaded in parallel, adapted to the measured throughput")
+    parser.add_argument("--bandwidth-limit", type=float, help="Cap the upload rate at this many MB/s")
+    parser.add_argument("--force", action="store_true", help="Start over and upload and create the image even if one with the same image digest exists")
+    parser.add_argument("--trace", help="Write a Chrome trace of the run's timing spans to this JSON file")
 
     args = parser.parse_args()
+    if args.trace:
+        start_trace(args.trace)
+    set_bandwidth_limit(args.bandwidth_limit)
+    check_environment(REQUIRED_VARS)
 
-    # Parse filename and construct object name
-    license_type, version, build = parse_filename(args.zip_file)
-    object_name = f"{license_type}/{version}/{build}.qcow2"
-    image_name = f"fwb-{license_type}-{version}-{build}"
-    
-    # Extract and upload .qcow2 file
-    print(f"\n[STEP 1] Extracting .qcow2 file from {args.zip_file}")
-    qcow2_path = extract_qcow2(args.zip_file)
-    print(f"    → Extracted to: {qcow2_path}")
-
-    print(f"\n[STEP 2] Uploading to OCI Object Storage bucket {args.bucket}")
-    print(f"    → Object Name: {object_name}")
-    upload_to_object_storage(qcow2_path, args.bucket, object_name)
-    
-    # Create custom image
-    print(f"\n[STEP 3] Creating custom image")
-    print(f"    → Image Name: {image_name}")
-    
-    config = oci.config.from_file()
-    compute_client = ComputeClient(config)
-    
-    image_id = create_image_from_object(
-        compute_client,
-        object_name,
-        image_name,
-        args.description,
-        version,
-        build,
-        license_type
-    )
-    
+    job = Job.from_zip('oci', args.zip_file)
+    # An interrupted import of the same zip resumes after its last completed step
+    checkpoint = ImportJournal().checkpoint('oci', job.name, args.zip_file, restart=args.force)
+    image_id = run_import(job, StageStatus(), checkpoint=checkpoint, bucket_name=args.bucket,
+                          description=args.description, force=args.force,
+                          part_size=args.part_size_mb * 1024 * 1024, concurrency=args.upload_concurrency)
     print(f"\n[FINAL] Created custom image ID for Terraform: {image_id}")
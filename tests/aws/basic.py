@@ -1,4 +1,3 @@
-import time
 import urllib3
 import os
 from dotenv import load_dotenv
@@ -8,6 +7,8 @@ from tests.common.test_utils import (
     get_public_ip,
     process_template,
     configure_fortiweb,
+    wait_for_ssh,
+    wait_for_policy,
     ensure_instance_running,
     run_tests_for_instance,
     logger
@@ -58,11 +59,15 @@ if __name__ == "__main__":
         # Configure BYOL instance if available
         if byol_ip and byol_instance_id:
             logger.info(f"Connecting to FortiWeb BYOL at {byol_ip}")
+            if not wait_for_ssh(byol_ip):
+                logger.error("FortiWeb BYOL SSH is not reachable")
+                exit(1)
             configure_fortiweb(byol_ip, USERNAME, PASSWORD, config_content)
             
             # Wait for configuration to be applied before testing
             logger.info("Waiting for BYOL configuration to be applied...")
-            time.sleep(5)  # Wait for 5 seconds
+            if not wait_for_policy(byol_ip):
+                logger.warning("BYOL policy is not serving yet, running tests anyway")
         elif byol_instance_id:
             logger.error("Cannot proceed without a valid BYOL public IP")
             exit(1)
@@ -72,11 +77,15 @@ if __name__ == "__main__":
         # Configure PAYG instance if available
         if payg_ip and payg_instance_id:
             logger.info(f"Connecting to FortiWeb PAYG at {payg_ip}")
+            if not wait_for_ssh(payg_ip):
+                logger.error("FortiWeb PAYG SSH is not reachable")
+                exit(1)
             configure_fortiweb(payg_ip, USERNAME, PASSWORD, config_content)
             
             # Wait for configuration to be applied before testing
             logger.info("Waiting for PAYG configuration to be applied...")
-            time.sleep(5)  # Wait for 5 seconds
+            if not wait_for_policy(payg_ip):
+                logger.warning("PAYG policy is not serving yet, running tests anyway")
         elif payg_instance_id:
             logger.error("Cannot proceed without a valid PAYG public IP")
             exit(1)
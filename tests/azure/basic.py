@@ -1,4 +1,3 @@
-import time
 import urllib3
 import os
 from dotenv import load_dotenv
@@ -8,6 +7,9 @@ from tests.common.test_utils import (
     get_public_ip,
     process_template,
     configure_fortiweb,
+    ensure_instance_running,
+    wait_for_ssh,
+    wait_for_policy,
     run_tests_for_instance,
     logger
 )
@@ -31,22 +33,34 @@ if __name__ == "__main__":
         # Process template to generate config content in memory
         config_content = process_template(CONFIG_TEMPLATE_PATH, server_pool_ip)
         
-        # Get instance IDs and public IPs from Terraform output
+        # Get instance IDs from Terraform output
         byol_instance_id = get_instance_id("azure_byol_instance_hostname")
         payg_instance_id = get_instance_id("azure_payg_instance_hostname")
+        
+        # Ensure VMs are running (deallocated VMs are started)
+        if byol_instance_id and not ensure_instance_running("BYOL", byol_instance_id, cloud="azure"):
+            logger.error("Cannot proceed with BYOL instance")
+            exit(1)
+        if payg_instance_id and not ensure_instance_running("PAYG", payg_instance_id, cloud="azure"):
+            logger.warning("Cannot proceed with PAYG instance, but continuing with BYOL")
+            payg_instance_id = None
+        
+        # Get public IPs from Terraform output after any start, since dynamic IPs may change
         byol_ip = get_public_ip("fwb_azure_byol_public_ip")
         payg_ip = get_public_ip("fwb_azure_payg_public_ip")
         
-        # Note: Skipping instance startup checks for Azure as requested
-        
         # Configure BYOL instance if available
         if byol_ip:
             logger.info(f"Connecting to FortiWeb BYOL at {byol_ip}")
+            if not wait_for_ssh(byol_ip):
+                logger.error("FortiWeb BYOL SSH is not reachable")
+                exit(1)
             configure_fortiweb(byol_ip, USERNAME, PASSWORD, config_content)
             
             # Wait for configuration to be applied before testing
             logger.info("Waiting for BYOL configuration to be applied...")
-            time.sleep(5)  # Wait for 5 seconds
+            if not wait_for_policy(byol_ip):
+                logger.warning("BYOL policy is not serving yet, running tests anyway")
         else:
             logger.error("Cannot proceed without a valid BYOL public IP")
             exit(1)
@@ -54,11 +68,15 @@ if __name__ == "__main__":
         # Configure PAYG instance if available
         if payg_ip and payg_instance_id:
             logger.info(f"Connecting to FortiWeb PAYG at {payg_ip}")
+            if not wait_for_ssh(payg_ip):
+                logger.error("FortiWeb PAYG SSH is not reachable")
+                exit(1)
             configure_fortiweb(payg_ip, USERNAME, PASSWORD, config_content)
             
             # Wait for configuration to be applied before testing
             logger.info("Waiting for PAYG configuration to be applied...")
-            time.sleep(5)  # Wait for 5 seconds
+            if not wait_for_policy(payg_ip):
+                logger.warning("PAYG policy is not serving yet, running tests anyway")
         else:
             logger.warning("PAYG public IP or instance ID not available, skipping PAYG configuration")
             
@@ -0,0 +1,161 @@
+import argparse
+import json
+import queue
+import threading
+import time
+import requests
+import urllib3
+from urllib.parse import quote
+from requests.adapters import HTTPAdapter
+from scripts.fwb_trace import traced
+from tests.common.test_utils import logger
+
+DEFAULT_CORPUS_PATH = "config/attack-corpus.jsonl"
+# Corpus entries buffered ahead of the workers, bounds memory for very large corpora
+QUEUE_DEPTH = 1000
+# False negatives kept per category for the report, the rest only go to the output file
+MAX_SAMPLES = 5
+
+def read_corpus(corpus_path):
+    """Yield corpus entries one at a time from a JSON-lines file"""
+    with open(corpus_path, 'r') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError as e:
+                logger.warning(f"Skipping invalid corpus line {line_number}: {str(e)}")
+                continue
+            if "payload" not in entry:
+                logger.warning(f"Skipping corpus line {line_number} without payload")
+                continue
+            entry.setdefault("category", "uncategorized")
+            entry.setdefault("location", "query")
+            entry.setdefault("expect", "block")
+            yield entry
+
+def send_attack(session, ip, entry, timeout=5):
+    """Send one corpus entry to FortiWeb and return the response status code"""
+    url = f"https://{ip}/"
+    payload = entry["payload"]
+    location = entry["location"]
+    if location == "user_agent":
+        response = session.get(url, headers={'User-Agent': payload}, timeout=timeout, verify=False)
+    elif location == "path":
+        # requests drops dot segments from the URL it is given, which would turn a traversal into
+        # a harmless path, so the literal path is set on the prepared request instead
+        request = session.prepare_request(requests.Request('GET', url))
+        request.url = url + quote(payload.lstrip("/"), safe="/%?=&")
+        response = session.send(request, timeout=timeout, verify=False)
+    elif location == "body":
+        response = session.post(url, data={'q': payload}, timeout=timeout, verify=False)
+    else:
+        response = session.get(url, params={'q': payload}, timeout=timeout, verify=False)
+    return response.status_code
+
+def _new_category():
+    return {"sent": 0, "blocked": 0, "passed": 0, "errors": 0, "false_negatives": 0, "false_positives": 0, "samples": []}
+
+@traced
+def replay_corpus(ip, corpus_path=DEFAULT_CORPUS_PATH, concurrency=10, false_negatives_path=None):
+    """Replay an attack corpus against FortiWeb and report per-category block ratios"""
+    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+    entries = queue.Queue(maxsize=QUEUE_DEPTH)
+    categories = {}
+    lock = threading.Lock()
+    false_negatives_file = open(false_negatives_path, 'w') if false_negatives_path else None
+
+    def record(entry, status):
+        with lock:
+            stats = categories.setdefault(entry["category"], _new_category())
+            stats["sent"] += 1
+            if status is None:
+                stats["errors"] += 1
+                return
+            # Same criterion as test_blocked_user_agent: anything but 200 OK is a block
+            blocked = status != 200
+            stats["blocked" if blocked else "passed"] += 1
+            if entry["expect"] == "block" and not blocked:
+                stats["false_negatives"] += 1
+                if len(stats["samples"]) < MAX_SAMPLES:
+                    stats["samples"].append(entry["payload"])
+                if false_negatives_file:
+                    false_negatives_file.write(json.dumps(entry) + "\n")
+            elif entry["expect"] == "pass" and blocked:
+                stats["false_positives"] += 1
+
+    def run_worker():
+        session = requests.Session()
+        session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        while True:
+            entry = entries.get()
+            if entry is None:
+                break
+            try:
+                status = send_attack(session, ip, entry)
+            except Exception as e:
+                # A reset or timeout is not a verdict either way, replay_passed() fails on it
+                logger.debug(f"Attack request failed: {str(e)}")
+                status = None
+            record(entry, status)
+        session.close()
+
+    started = time.monotonic()
+    workers = [threading.Thread(target=run_worker) for _ in range(concurrency)]
+    for worker in workers:
+        worker.start()
+    try:
+        for entry in read_corpus(corpus_path):
+            entries.put(entry)
+    finally:
+        for _ in workers:
+            entries.put(None)
+        for worker in workers:
+            worker.join()
+        if false_negatives_file:
+            false_negatives_file.close()
+    elapsed = time.monotonic() - started
+
+    for stats in categories.values():
+        answered = stats["blocked"] + stats["passed"]
+        stats["block_ratio"] = stats["blocked"] / answered if answered else 0.0
+    sent = sum(stats["sent"] for stats in categories.values())
+    return {
+        "requests": sent,
+        "throughput": sent / elapsed if elapsed else 0.0,
+        "false_negatives": sum(stats["false_negatives"] for stats in categories.values()),
+        "false_positives": sum(stats["false_positives"] for stats in categories.values()),
+        "errors": sum(stats["errors"] for stats in categories.values()),
+        "categories": categories,
+    }
+
+def replay_passed(report):
+    """A replay passes only if every request got a verdict and every verdict was the expected one"""
+    return not report["false_negatives"] and not report["false_positives"] and not report["errors"]
+
+def log_replay_report(instance_name, report):
+    """Log an attack replay report with one line per category"""
+    logger.info(f"Attack replay for {instance_name}: {report['requests']} requests at {report['throughput']:.1f} req/s, "
+                f"{report['false_negatives']} false negatives, {report['false_positives']} false positives, "
+                f"{report['errors']} errors")
+    for category, stats in sorted(report["categories"].items()):
+        logger.info(f"  {category}: blocked {stats['blocked']}/{stats['sent']} ({stats['block_ratio']:.1%}), "
+                    f"false negatives {stats['false_negatives']}, false positives {stats['false_positives']}, errors {stats['errors']}")
+        for payload in stats["samples"]:
+            logger.info(f"    not blocked: {payload}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay an attack corpus against a FortiWeb server policy.")
+    parser.add_argument("ip", help="FortiWeb address, optionally with :port")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS_PATH, help="JSON-lines attack corpus")
+    parser.add_argument("--concurrency", type=int, default=10, help="Number of concurrent connections")
+    parser.add_argument("--false-negatives", help="Write every attack that was not blocked to this JSON-lines file")
+
+    args = parser.parse_args()
+
+    report = replay_corpus(args.ip, args.corpus, args.concurrency, args.false_negatives)
+    log_replay_report(args.ip, report)
+    if not replay_passed(report):
+        exit(1)
@@ -0,0 +1,107 @@
+import os
+import re
+import threading
+
+# {{name}} substitutes a variable, {{#name}}...{{/name}} repeats a block for each item of a list.
+# Section tags alone on their line are matched with the whole line so they leave no blank lines behind.
+_TAG = re.compile(r"^[ \t]*\{\{\s*([#/])\s*(\w+)\s*\}\}[ \t]*(?:\n|$)|\{\{\s*([#/]?)\s*(\w+)\s*\}\}", re.M)
+_PLACEHOLDER = re.compile(r"\{\{\s*[#/]?\s*\w+\s*\}\}")
+TEMPLATE_SUFFIX = ".template"
+
+# Compiled templates keyed by path, invalidated when the file's mtime changes
+_compiled = {}
+_compiled_lock = threading.Lock()
+
+def _parse(source, path):
+    """Turn template source into a tree of ("text", str), ("var", name) and ("section", name, children) nodes"""
+    root = []
+    stack = [(None, root)]
+    position = 0
+    for match in _TAG.finditer(source):
+        if match.start() > position:
+            stack[-1][1].append(("text", source[position:match.start()]))
+        kind, name = match.group(1, 2) if match.group(2) else match.group(3, 4)
+        if kind == "#":
+            children = []
+            stack[-1][1].append(("section", name, children))
+            stack.append((name, children))
+        elif kind == "/":
+            if stack[-1][0] != name:
+                raise ValueError(f"Unexpected {{{{/{name}}}}} in {path}")
+            stack.pop()
+        else:
+            stack[-1][1].append(("var", name))
+        position = match.end()
+    if len(stack) > 1:
+        raise ValueError(f"Unclosed {{{{#{stack[-1][0]}}}}} in {path}")
+    if position < len(source):
+        root.append(("text", source[position:]))
+    return root
+
+def compile_template(template_path):
+    """Compile a template once and reuse it until the file changes on disk"""
+    mtime = os.stat(template_path).st_mtime_ns
+    with _compiled_lock:
+        cached = _compiled.get(template_path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+    with open(template_path, 'r') as f:
+        nodes = _parse(f.read(), template_path)
+    with _compiled_lock:
+        _compiled[template_path] = (mtime, nodes)
+    return nodes
+
+def _render(nodes, variables, path, out):
+    for node in nodes:
+        if node[0] == "text":
+            out.append(node[1])
+            continue
+        name = node[1]
+        if name not in variables:
+            raise ValueError(f"Template variable '{name}' is not set for {path}")
+        if node[0] == "var":
+            out.append(str(variables[name]))
+        else:
+            # Sections repeat once per item, items see the outer variables plus their own and a 1-based index
+            for index, item in enumerate(variables[name] or [], 1):
+                _render(node[2], {**variables, "index": index, **item}, path, out)
+
+def render_template(template_path, variables):
+    """Render a template with the given variables, failing if any placeholder cannot be filled"""
+    out = []
+    _render(compile_template(template_path), variables, template_path, out)
+    rendered = "".join(out)
+    # Values that themselves contain placeholders would otherwise slip through
+    leftover = _PLACEHOLDER.search(rendered)
+    if leftover:
+        raise ValueError(f"Unresolved placeholder {leftover.group(0)} in {template_path}")
+    return rendered
+
+def list_templates(template_dir):
+    """List the config fragment templates of a directory in the order they are applied"""
+    return [
+        os.path.join(template_dir, name)
+        for name in sorted(os.listdir(template_dir))
+        if name.endswith(TEMPLATE_SUFFIX)
+    ]
+
+def render_directory(template_dir, variables, template_paths=None):
+    """Render every fragment template in a directory and join them into one config"""
+    template_paths = template_paths if template_paths is not None else list_templates(template_dir)
+    return "".join(render_template(path, variables) for path in template_paths)
+
+def render_fleet(template, defaults, overrides):
+    """Render a template file or directory for a fleet, returning {instance: config}
+
+    Each instance gets the defaults merged with its own entry in overrides.
+    """
+    if os.path.isdir(template):
+        template_paths = list_templates(template)
+        return {
+            instance: render_directory(template, {**defaults, **instance_variables}, template_paths)
+            for instance, instance_variables in overrides.items()
+        }
+    return {
+        instance: render_template(template, {**defaults, **instance_variables})
+        for instance, instance_variables in overrides.items()
+    }
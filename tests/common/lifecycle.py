@@ -0,0 +1,195 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from scripts.fwb_clients import aws_client, azure_compute_client, oci_compute_client
+from scripts.fwb_trace import traced
+from tests.common.test_utils import (
+    wait_until,
+    refresh_terraform_state,
+    INSTANCE_READY_TIMEOUT,
+    logger
+)
+
+# SDK states mapped onto one vocabulary: running, starting, stopping, stopped, terminated
+AWS_STATES = {
+    "pending": "starting",
+    "running": "running",
+    "stopping": "stopping",
+    "stopped": "stopped",
+    "shutting-down": "stopping",
+    "terminated": "terminated",
+}
+AZURE_STATES = {
+    "PowerState/starting": "starting",
+    "PowerState/running": "running",
+    "PowerState/stopping": "stopping",
+    "PowerState/stopped": "stopped",
+    "PowerState/deallocating": "stopping",
+    "PowerState/deallocated": "stopped",
+}
+OCI_STATES = {
+    "PROVISIONING": "starting",
+    "STARTING": "starting",
+    "RUNNING": "running",
+    "STOPPING": "stopping",
+    "STOPPED": "stopped",
+    "TERMINATING": "stopping",
+    "TERMINATED": "terminated",
+}
+
+def _aws_states(instance_ids):
+    """Query all AWS instances with one paginated describe_instances call"""
+    ec2 = aws_client('ec2')
+    states = {}
+    for page in ec2.get_paginator('describe_instances').paginate(InstanceIds=instance_ids):
+        for reservation in page['Reservations']:
+            for instance in reservation['Instances']:
+                states[instance['InstanceId']] = AWS_STATES.get(instance['State']['Name'], instance['State']['Name'])
+    return states
+
+def _aws_start(instance_ids):
+    """Start all AWS instances with one start_instances call"""
+    aws_client('ec2').start_instances(InstanceIds=instance_ids)
+
+def _azure_vm_parts(resource_id):
+    """Split an Azure VM resource ID into (subscription, resource group, VM name)"""
+    parts = resource_id.strip("/").split("/")
+    return parts[1], parts[3], parts[-1]
+
+def _azure_states(instance_ids):
+    """Query all Azure VMs with one status-only list per subscription"""
+    states = {}
+    wanted = {instance_id.lower(): instance_id for instance_id in instance_ids}
+    for subscription_id in {_azure_vm_parts(instance_id)[0] for instance_id in instance_ids}:
+        for vm in azure_compute_client(subscription_id).virtual_machines.list_all(status_only="true"):
+            instance_id = wanted.get(vm.id.lower())
+            if instance_id is None or vm.instance_view is None:
+                continue
+            power_states = [s.code for s in vm.instance_view.statuses or [] if s.code.startswith("PowerState/")]
+            if power_states:
+                states[instance_id] = AZURE_STATES.get(power_states[0], power_states[0])
+    return states
+
+def _azure_start(instance_ids):
+    """Issue begin_start for every Azure VM without blocking on each poller"""
+    for instance_id in instance_ids:
+        subscription_id, resource_group, vm_name = _azure_vm_parts(instance_id)
+        azure_compute_client(subscription_id).virtual_machines.begin_start(resource_group, vm_name)
+
+def _oci_states(instance_ids):
+    """Query OCI instances with one paginated list per compartment, or per instance without one"""
+    import oci
+    compute_client = oci_compute_client()
+    compartment_id = os.getenv("OCI_COMPARTMENT_ID")
+    if compartment_id:
+        wanted = set(instance_ids)
+        instances = oci.pagination.list_call_get_all_results(
+            compute_client.list_instances,
+            compartment_id=compartment_id
+        ).data
+        instances = [instance for instance in instances if instance.id in wanted]
+    else:
+        instances = [compute_client.get_instance(instance_id).data for instance_id in instance_ids]
+    return {instance.id: OCI_STATES.get(instance.lifecycle_state, instance.lifecycle_state) for instance in instances}
+
+def _oci_start(instance_ids):
+    """Send the START action to every OCI instance"""
+    compute_client = oci_compute_client()
+    for instance_id in instance_ids:
+        compute_client.instance_action(instance_id, "START")
+
+CLOUD_BACKENDS = {
+    "aws": (_aws_states, _aws_start),
+    "azure": (_azure_states, _azure_start),
+    "oci": (_oci_states, _oci_start),
+}
+
+def _group_by_cloud(instances):
+    """Group (cloud, instance_id) pairs into {cloud: [instance_id, ...]}"""
+    grouped = {}
+    for cloud, instance_id in instances:
+        grouped.setdefault(cloud, []).append(instance_id)
+    return grouped
+
+def get_instance_states(cloud, instance_ids):
+    """Get the normalized state of many instances of one cloud in a single batched query"""
+    try:
+        states = CLOUD_BACKENDS[cloud][0](list(instance_ids))
+        for instance_id in instance_ids:
+            logger.info(f"Instance {instance_id} state: {states.get(instance_id)}")
+        return states
+    except Exception as e:
+        logger.error(f"Error getting {cloud} instance states: {str(e)}")
+        return {}
+
+def get_all_instance_states(instances):
+    """Get the state of (cloud, instance_id) pairs, querying each cloud in parallel"""
+    grouped = _group_by_cloud(instances)
+    states = {}
+    with ThreadPoolExecutor(max_workers=len(grouped) or 1) as executor:
+        futures = {cloud: executor.submit(get_instance_states, cloud, ids) for cloud, ids in grouped.items()}
+        for cloud, future in futures.items():
+            for instance_id, state in future.result().items():
+                states[(cloud, instance_id)] = state
+    return states
+
+def start_instances(cloud, instance_ids):
+    """Start many instances of one cloud without waiting for them"""
+    try:
+        logger.info(f"Starting {cloud} instances: {', '.join(instance_ids)}")
+        CLOUD_BACKENDS[cloud][1](list(instance_ids))
+        return True
+    except Exception as e:
+        logger.error(f"Error starting {cloud} instances: {str(e)}")
+        return False
+
+@traced
+def ensure_instances_running(instances, timeout=INSTANCE_READY_TIMEOUT):
+    """Start every stopped instance and wait for all of them together, returning {(cloud, instance_id): bool}"""
+    instances = list(instances)
+    states = get_all_instance_states(instances)
+    stopping = [key for key in instances if states.get(key) == "stopping"]
+    if stopping:
+        # An instance asked to stop a moment ago refuses to start until it has stopped,
+        # so it joins the batched start below once it has left the stopping state
+        def none_stopping():
+            current = get_all_instance_states(stopping)
+            return current if all(current.get(key) not in ("stopping", None) for key in stopping) else None
+
+        states.update(wait_until(none_stopping, f"{len(stopping)} instance(s) to finish stopping", timeout)
+                      or get_all_instance_states(stopping))
+    results = {}
+    to_start = []
+    for key in instances:
+        state = states.get(key)
+        if state == "running":
+            results[key] = True
+        elif state in ("stopped", "starting"):
+            to_start.append(key)
+        else:
+            logger.error(f"{key[0]} instance {key[1]} is in unexpected state: {state}")
+            results[key] = False
+    if not to_start:
+        return results
+
+    for cloud, instance_ids in _group_by_cloud(key for key in to_start if states[key] == "stopped").items():
+        if not start_instances(cloud, instance_ids):
+            for instance_id in instance_ids:
+                results[(cloud, instance_id)] = False
+    pending = [key for key in to_start if key not in results]
+
+    def all_running():
+        current = get_all_instance_states(pending)
+        return all(current.get(key) == "running" for key in pending) or None
+
+    if wait_until(all_running, f"{len(pending)} instance(s) to start", timeout):
+        for key in pending:
+            results[key] = True
+    else:
+        current = get_all_instance_states(pending)
+        for key in pending:
+            results[key] = current.get(key) == "running"
+
+    # Started instances may have new public IPs
+    if not refresh_terraform_state():
+        logger.warning("Failed to refresh Terraform state, continuing anyway...")
+    return results
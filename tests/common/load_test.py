@@ -0,0 +1,170 @@
+import argparse
+import math
+import multiprocessing
+import threading
+import time
+import requests
+import urllib3
+from concurrent.futures import ProcessPoolExecutor
+from requests.adapters import HTTPAdapter
+from scripts.fwb_trace import traced
+from tests.common.test_utils import logger
+
+# Percentiles reported by run_load_test()
+PERCENTILES = (50, 90, 99, 99.9)
+
+class LatencyHistogram:
+    """Log-bucketed latency histogram (~1% precision) that can be merged across workers"""
+
+    def __init__(self, precision=0.01, min_value=1e-6):
+        self.precision = precision
+        self.min_value = min_value
+        self._log_base = math.log1p(precision)
+        self.counts = {}
+        self.total = 0
+        self.max_value = 0.0
+
+    def _bucket(self, value):
+        return int(math.log(max(value, self.min_value) / self.min_value) / self._log_base)
+
+    def record(self, value):
+        """Record a latency in seconds"""
+        bucket = self._bucket(value)
+        self.counts[bucket] = self.counts.get(bucket, 0) + 1
+        self.total += 1
+        self.max_value = max(self.max_value, value)
+
+    def merge(self, other):
+        """Add the samples of another histogram with the same precision into this one"""
+        for bucket, count in other.counts.items():
+            self.counts[bucket] = self.counts.get(bucket, 0) + count
+        self.total += other.total
+        self.max_value = max(self.max_value, other.max_value)
+        return self
+
+    def percentile(self, p):
+        """Return the latency in seconds at percentile p (0-100), or None if empty"""
+        if not self.total:
+            return None
+        rank = max(1, math.ceil(self.total * p / 100))
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                # Upper edge of the bucket, capped by the largest value seen
+                return min(self.min_value * math.exp((bucket + 1) * self._log_base), self.max_value)
+        return self.max_value
+
+def _run_worker(url, threads, duration, rate, timeout):
+    """Drive load from one process with a pool of threads and return its partial results"""
+    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+    histogram = LatencyHistogram()
+    statuses = {}
+    errors = 0
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+    # With a target rate each thread sends on a fixed schedule, otherwise as fast as it can
+    interval = threads / rate if rate else 0
+
+    def run_thread(offset):
+        nonlocal errors
+        session = requests.Session()
+        session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        next_send = time.monotonic() + offset
+        while True:
+            now = time.monotonic()
+            if interval:
+                if next_send > now:
+                    time.sleep(next_send - now)
+                # Measure from the scheduled send time so a slow server can't hide queueing delay
+                started = next_send
+                next_send += interval
+            else:
+                started = now
+            if started >= deadline:
+                break
+            try:
+                response = session.get(url, timeout=timeout, verify=False)
+                # Drain the body so the connection goes back to the pool
+                response.content
+                status = response.status_code
+            except Exception:
+                status = None
+            latency = time.monotonic() - started
+            with lock:
+                if status is None or status >= 400:
+                    errors += 1
+                if status is not None:
+                    statuses[status] = statuses.get(status, 0) + 1
+                histogram.record(latency)
+        session.close()
+
+    workers = [threading.Thread(target=run_thread, args=(i * interval / threads,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return histogram, statuses, errors
+
+@traced
+def run_load_test(ip, duration=30, concurrency=10, rate=None, processes=1, path="/", timeout=5):
+    """Drive HTTPS load against a FortiWeb policy and return throughput, error rate and latency percentiles"""
+    url = f"https://{ip}{path}"
+    processes = max(1, min(processes, concurrency))
+    threads_per_process = [concurrency // processes + (1 if i < concurrency % processes else 0) for i in range(processes)]
+    logger.info(f"Load test against {url}: {concurrency} connections over {processes} process(es) for {duration}s"
+                + (f" at {rate} req/s" if rate else ""))
+
+    histogram = LatencyHistogram()
+    statuses = {}
+    errors = 0
+    started = time.monotonic()
+    # Spawned, not forked: the orchestrator calls this from worker threads while others hold SSH transports and locks
+    with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = [
+            executor.submit(_run_worker, url, threads, duration, rate * threads / concurrency if rate else None, timeout)
+            for threads in threads_per_process
+        ]
+        for future in futures:
+            worker_histogram, worker_statuses, worker_errors = future.result()
+            histogram.merge(worker_histogram)
+            for status, count in worker_statuses.items():
+                statuses[status] = statuses.get(status, 0) + count
+            errors += worker_errors
+    elapsed = time.monotonic() - started
+
+    report = {
+        "url": url,
+        "requests": histogram.total,
+        "errors": errors,
+        "error_rate": errors / histogram.total if histogram.total else 0.0,
+        "throughput": histogram.total / elapsed if elapsed else 0.0,
+        "statuses": statuses,
+        "latency": {f"p{p:g}": histogram.percentile(p) for p in PERCENTILES},
+    }
+    return report
+
+def log_load_report(instance_name, report):
+    """Log a load test report in a single readable line"""
+    latency = " ".join(
+        f"{name}={value * 1000:.1f}ms" if value is not None else f"{name}=n/a"
+        for name, value in report["latency"].items()
+    )
+    logger.info(f"Load test for {instance_name}: {report['requests']} requests, "
+                f"{report['throughput']:.1f} req/s, error rate {report['error_rate']:.2%}, {latency}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Drive HTTPS load against a FortiWeb server policy.")
+    parser.add_argument("ip", help="FortiWeb address, optionally with :port")
+    parser.add_argument("--duration", type=float, default=30, help="Test duration in seconds")
+    parser.add_argument("--concurrency", type=int, default=10, help="Number of concurrent connections")
+    parser.add_argument("--rate", type=float, help="Target request rate in req/s (default: as fast as possible)")
+    parser.add_argument("--processes", type=int, default=1, help="Number of worker processes")
+    parser.add_argument("--path", default="/", help="Request path")
+
+    args = parser.parse_args()
+
+    report = run_load_test(args.ip, args.duration, args.concurrency, args.rate, args.processes, args.path)
+    log_load_report(args.ip, report)
+    if report["requests"] == report["errors"]:
+        exit(1)
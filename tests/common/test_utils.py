@@ -5,13 +5,47 @@ import os
 import requests
 import json
 import time
+import hashlib
+import tempfile
+import socket
+import ssl
+import threading
 import urllib3
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
+from scripts.fwb_trace import traced
+from tests.common.config_template import render_template
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Serializes terraform invocations so concurrent test workers don't contend for the state lock
+_terraform_lock = threading.Lock()
+
+# Terraform outputs loaded once per run, see load_terraform_outputs()
+_terraform_outputs = None
+
+# Readiness deadlines in seconds
+INSTANCE_READY_TIMEOUT = 300
+CONFIG_APPLY_TIMEOUT = 60
+
+# Authenticated SSH sessions per FortiWeb host, see get_ssh_client()
+SSH_PORT = int(os.getenv("FORTIWEB_SSH_PORT", "22"))
+SSH_KEEPALIVE_INTERVAL = 30
+_ssh_clients = {}
+_ssh_host_locks = {}
+_ssh_clients_lock = threading.Lock()
+
+# Hashes of the config blocks last pushed to each instance, see configure_fortiweb(incremental=True)
+CONFIG_CACHE_PATH = os.path.join(tempfile.gettempdir(), 'fwb_config_cache.json')
+_config_cache_lock = threading.Lock()
+
+# Keep-alive HTTP sessions per FortiWeb host, see get_http_session()
+HTTP_POOL_SIZE = 10
+_http_sessions = {}
+_http_sessions_lock = threading.Lock()
+
 def get_server_pool_ip(env_var_name):
     """Get server pool IP from .env file - throws error if not defined"""
     load_dotenv()
@@ -22,17 +56,77 @@ def get_server_pool_ip(env_var_name):
     logger.info(f"Server pool IP loaded from .env: {env_var_name}")
     return server_pool_ip
 
+def _terraform_state_path():
+    """Return the local state file for the selected workspace, or None if state is not local"""
+    try:
+        with open(os.path.join(".terraform", "terraform.tfstate"), 'r') as f:
+            backend = json.load(f).get("backend") or {}
+        if backend.get("type", "local") != "local":
+            return None
+    except (OSError, ValueError):
+        pass
+
+    workspace = os.getenv("TF_WORKSPACE")
+    if not workspace:
+        try:
+            with open(os.path.join(".terraform", "environment"), 'r') as f:
+                workspace = f.read().strip()
+        except OSError:
+            workspace = "default"
+    if workspace == "default":
+        state_path = "terraform.tfstate"
+    else:
+        state_path = os.path.join("terraform.tfstate.d", workspace, "terraform.tfstate")
+    return state_path if os.path.exists(state_path) else None
+
+def _read_terraform_outputs():
+    """Read every output in one pass, from the local state file if possible, else terraform output -json"""
+    state_path = _terraform_state_path()
+    if state_path:
+        try:
+            with open(state_path, 'r') as f:
+                outputs = json.load(f).get("outputs", {})
+            logger.info(f"Loaded {len(outputs)} Terraform outputs from {state_path}")
+            return {name: output.get("value") for name, output in outputs.items()}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Failed to read Terraform state file {state_path}, falling back to terraform output: {str(e)}")
+
+    result = subprocess.run(
+        ["terraform", "output", "-json"],
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    outputs = json.loads(result.stdout or "{}")
+    logger.info(f"Loaded {len(outputs)} Terraform outputs")
+    return {name: output.get("value") for name, output in outputs.items()}
+
+def load_terraform_outputs():
+    """Return all Terraform outputs, loading them once and serving later lookups from memory"""
+    global _terraform_outputs
+    with _terraform_lock:
+        if _terraform_outputs is None:
+            _terraform_outputs = _read_terraform_outputs()
+        return _terraform_outputs
+
+def invalidate_terraform_outputs():
+    """Drop the cached Terraform outputs so the next lookup reloads them"""
+    global _terraform_outputs
+    with _terraform_lock:
+        _terraform_outputs = None
+
+def get_terraform_output(output_name):
+    """Get a single Terraform output value as a string, or None if it is not set"""
+    value = load_terraform_outputs().get(output_name)
+    if value is None:
+        return None
+    return str(value).strip() or None
+
 def get_instance_id(output_name):
     """Get instance ID from terraform output"""
     try:
-        result = subprocess.run(
-            ["terraform", "output", "-raw", output_name],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        instance_id = result.stdout.strip()
-        if not instance_id or "No outputs found" in instance_id:
+        instance_id = get_terraform_output(output_name)
+        if not instance_id:
             logger.error(f"No instance ID output found in Terraform for {output_name}")
             return None
         logger.info(f"Found instance ID for {output_name}: {instance_id}")
@@ -44,54 +138,35 @@ def get_instance_id(output_name):
         logger.error(f"Error getting instance ID: {str(e)}")
         return None
 
-def get_instance_state(instance_id):
-    """Get the state of an AWS instance using AWS CLI"""
-    try:
-        result = subprocess.run(
-            ["aws", "ec2", "describe-instances", "--instance-ids", instance_id, "--query", "Reservations[0].Instances[0].State.Name", "--output", "text"],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        state = result.stdout.strip()
-        logger.info(f"Instance {instance_id} state: {state}")
-        return state
-    except subprocess.CalledProcessError as e:
-        logger.error(f"Failed to get instance state: {e.stderr}")
-        return None
-    except Exception as e:
-        logger.error(f"Error getting instance state: {str(e)}")
-        return None
+def get_instance_state(instance_id, cloud="aws"):
+    """Get the normalized state of an instance through the cloud SDK"""
+    # Imported here since the lifecycle module builds on the helpers in this one
+    from tests.common.lifecycle import get_instance_states
+    return get_instance_states(cloud, [instance_id]).get(instance_id)
 
-def start_instance(instance_id):
-    """Start an AWS instance using AWS CLI"""
-    try:
-        logger.info(f"Starting instance {instance_id}...")
-        result = subprocess.run(
-            ["aws", "ec2", "start-instances", "--instance-ids", instance_id],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        logger.info(f"Started instance {instance_id}")
-        return True
-    except subprocess.CalledProcessError as e:
-        logger.error(f"Failed to start instance: {e.stderr}")
-        return False
-    except Exception as e:
-        logger.error(f"Error starting instance: {str(e)}")
+def start_instance(instance_id, cloud="aws"):
+    """Start an instance through the cloud SDK"""
+    from tests.common.lifecycle import start_instances
+    if not start_instances(cloud, [instance_id]):
         return False
+    logger.info(f"Started instance {instance_id}")
+    return True
 
+@traced
 def refresh_terraform_state():
     """Refresh Terraform state"""
+    global _terraform_outputs
     try:
         logger.info("Refreshing Terraform state...")
-        result = subprocess.run(
-            ["terraform", "refresh"],
-            capture_output=True,
-            text=True,
-            check=True
-        )
+        with _terraform_lock:
+            # Outputs may change on refresh (e.g. a new public IP after start)
+            _terraform_outputs = None
+            result = subprocess.run(
+                ["terraform", "refresh"],
+                capture_output=True,
+                text=True,
+                check=True
+            )
         logger.info("Terraform state refreshed successfully")
         return True
     except subprocess.CalledProcessError as e:
@@ -104,14 +179,8 @@ def refresh_terraform_state():
 def get_public_ip(output_name):
     """Get FortiWeb public IP from terraform output"""
     try:
-        result = subprocess.run(
-            ["terraform", "output", "-raw", output_name],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        ip = result.stdout.strip()
-        if not ip or "No outputs found" in ip:
+        ip = get_terraform_output(output_name)
+        if not ip:
             logger.error(f"No public IP output found in Terraform for {output_name}")
             return None
         return ip
@@ -122,14 +191,18 @@ def get_public_ip(output_name):
         logger.error(f"Error getting public IP: {str(e)}")
         return None
 
-def process_template(template_path, server_pool_ip):
-    """Process template file and return the content as string"""
+def process_template(template_path, server_pool_ip, **variables):
+    """Render the config template for a server pool and return the content as string
+
+    server_pool_ip may hold several comma-separated IPs, each becomes a pserver entry.
+    """
     try:
-        with open(template_path, 'r') as f:
-            template_content = f.read()
-        
-        # Replace variables in template
-        processed_content = template_content.replace('{{server_pool_ip}}', server_pool_ip)
+        pool_ips = [ip.strip() for ip in server_pool_ip.split(",") if ip.strip()]
+        processed_content = render_template(template_path, {
+            "server_pool_ip": pool_ips[0] if pool_ips else server_pool_ip,
+            "pservers": [{"ip": ip} for ip in pool_ips],
+            **variables
+        })
         
         logger.info("Processed template in memory")
         return processed_content
@@ -137,37 +210,195 @@ def process_template(template_path, server_pool_ip):
         logger.error(f"Failed to process template: {str(e)}")
         raise
 
-def configure_fortiweb(ip, username, password, config_content):
-    """SSH to FortiWeb and apply configuration"""
+def get_ssh_client(ip, username, password, port=SSH_PORT):
+    """Get the shared authenticated SSH client for a FortiWeb host, reconnecting if it dropped"""
+    key = (ip, port, username)
+    with _ssh_clients_lock:
+        host_lock = _ssh_host_locks.setdefault(key, threading.Lock())
+
+    # Per-host lock so handshakes to different instances don't serialize each other
+    with host_lock:
+        client = _ssh_clients.get(key)
+        transport = client.get_transport() if client else None
+        if transport is None or not transport.is_active():
+            if client:
+                logger.info(f"SSH session to {ip} dropped, reconnecting")
+                client.close()
+            client = paramiko.SSHClient()
+            client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+            client.connect(ip, port=port, username=username, password=password)
+            # Keep the idle session alive between commands
+            client.get_transport().set_keepalive(SSH_KEEPALIVE_INTERVAL)
+            _ssh_clients[key] = client
+        return client
+
+def _drop_ssh_client(ip, username, port=SSH_PORT):
+    """Close and forget the shared SSH client for a host"""
+    with _ssh_clients_lock:
+        client = _ssh_clients.pop((ip, port, username), None)
+    if client:
+        client.close()
+
+def close_ssh_sessions():
+    """Close all shared SSH sessions"""
+    with _ssh_clients_lock:
+        clients = list(_ssh_clients.values())
+        _ssh_clients.clear()
+    for client in clients:
+        client.close()
+
+@traced
+def run_ssh_command(ip, username, password, command, port=SSH_PORT):
+    """Run a command on a new channel of the shared SSH session and return (stdout, stderr)"""
+    for attempt in (1, 2):
+        client = get_ssh_client(ip, username, password, port)
+        try:
+            stdin, stdout, stderr = client.exec_command(command)
+        except (paramiko.SSHException, EOFError, OSError) as e:
+            # The session went stale between commands, reconnect once
+            _drop_ssh_client(ip, username, port)
+            if attempt == 2:
+                raise
+            logger.warning(f"SSH channel to {ip} failed, reconnecting: {str(e)}")
+            continue
+        return stdout.read().decode(), stderr.read().decode()
+
+def split_config_blocks(config_content):
+    """Split FortiWeb CLI config into {header: block} for each top-level config ... end block"""
+    blocks = {}
+    header = None
+    lines = []
+    depth = 0
+    for line in config_content.splitlines():
+        stripped = line.strip()
+        if header is None:
+            # Anything outside a block (prompts, blank lines) is ignored
+            if stripped.startswith("config "):
+                header = " ".join(stripped.split())
+                lines = [line]
+                depth = 1
+            continue
+        lines.append(line)
+        if stripped.startswith("config "):
+            depth += 1
+        elif stripped == "end":
+            depth -= 1
+            if depth == 0:
+                blocks[header] = "\n".join(lines) + "\n"
+                header = None
+    return blocks
+
+def hash_config_block(block):
+    """Hash a config block ignoring indentation, blank lines and repeated spaces"""
+    normalized = "\n".join(" ".join(line.split()) for line in block.splitlines() if line.strip())
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+def get_running_config_hashes(ip, username, password, headers):
+    """Fetch the running config for the given block headers in one SSH command and hash each block"""
+    commands = "\n".join("show " + header[len("config "):] for header in headers)
+    stdout_data, stderr_data = run_ssh_command(ip, username, password, commands)
+    return {header: hash_config_block(block) for header, block in split_config_blocks(stdout_data).items()}
+
+def _load_config_cache():
     try:
-        # Connect to FortiWeb
-        client = paramiko.SSHClient()
-        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        client.connect(ip, username=username, password=password)
+        with open(CONFIG_CACHE_PATH, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _update_config_cache(ip, entries):
+    """Merge the block hashes pushed to an instance into the on-disk cache"""
+    with _config_cache_lock:
+        cache = _load_config_cache()
+        cache.setdefault(ip, {}).update(entries)
+        temp_path = f"{CONFIG_CACHE_PATH}.{os.getpid()}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(cache, f, indent=2)
+        os.replace(temp_path, CONFIG_CACHE_PATH)
 
-        # Execute config directly from memory
-        stdin, stdout, stderr = client.exec_command(config_content)
+@traced
+def get_config_changes(ip, username, password, config_content):
+    """Return the config blocks that differ from what is running on the instance
 
-        # Capture output but don't display it
-        stdout_data = stdout.read().decode()
-        stderr_data = stderr.read().decode()
+    A block is unchanged if the running block hashes the same as the desired one, or if both
+    the desired block and the running block are what they were right after our last push
+    (FortiWeb's show output omits defaults, so a pushed block rarely reads back verbatim).
+    """
+    desired = split_config_blocks(config_content)
+    running = get_running_config_hashes(ip, username, password, list(desired))
+    with _config_cache_lock:
+        cached = _load_config_cache().get(ip, {})
+
+    changed = {}
+    for header, block in desired.items():
+        desired_hash = hash_config_block(block)
+        running_hash = running.get(header)
+        previous = cached.get(header, {})
+        if running_hash == desired_hash:
+            continue
+        if running_hash and previous.get("desired") == desired_hash and previous.get("running") == running_hash:
+            continue
+        changed[header] = block
+    return changed
+
+@traced
+def configure_fortiweb(ip, username, password, config_content, incremental=False):
+    """SSH to FortiWeb and apply configuration
+
+    With incremental=True only the config blocks that differ from the running config are pushed.
+    """
+    try:
+        if incremental:
+            changed = get_config_changes(ip, username, password, config_content)
+            if not changed:
+                logger.info(f"FortiWeb {ip} already has the desired config, nothing to push")
+                return
+            logger.info(f"Pushing {len(changed)} changed config block(s) to {ip}: {', '.join(changed)}")
+            config_content = "".join(changed.values())
+
+        # Execute config directly from memory over the shared session
+        stdout_data, stderr_data = run_ssh_command(ip, username, password, config_content)
         
         # Optional: Log only if there's an error
         if stderr_data:
             logger.error(f"SSH command error: {stderr_data}")
+        elif incremental:
+            # Remember how the pushed blocks read back so the next run can skip them
+            running = get_running_config_hashes(ip, username, password, list(changed))
+            _update_config_cache(ip, {
+                header: {"desired": hash_config_block(block), "running": running.get(header)}
+                for header, block in changed.items()
+            })
 
     except Exception as e:
         logger.error(f"SSH connection failed: {str(e)}")
         raise
-    finally:
-        client.close()
 
-def test_http_healthcheck(ip):
+def get_http_session(ip, pool_size=HTTP_POOL_SIZE):
+    """Get the shared keep-alive HTTPS session for a FortiWeb host, creating it on first use"""
+    with _http_sessions_lock:
+        session = _http_sessions.get(ip)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _http_sessions[ip] = session
+        return session
+
+def close_http_sessions():
+    """Close all shared HTTP sessions and their pooled connections"""
+    with _http_sessions_lock:
+        for session in _http_sessions.values():
+            session.close()
+        _http_sessions.clear()
+
+@traced
+def test_http_healthcheck(ip, session=None):
     """Test HTTPS connectivity to FortiWeb (with self-signed cert handling)"""
     try:
-        response = requests.get(f"https://{ip}/", 
-                              timeout=5,
-                              verify=False)
+        session = session or get_http_session(ip)
+        response = session.get(f"https://{ip}/", timeout=5, verify=False)
         if response.status_code == 200:
             logger.info("HTTPS health check passed (200 OK)")
             return True
@@ -178,14 +409,13 @@ def test_http_healthcheck(ip):
         logger.error(f"HTTPS health check error: {str(e)}")
         return False
 
-def test_blocked_user_agent(ip):
+@traced
+def test_blocked_user_agent(ip, session=None):
     """Test that requests with User-Agent: ApacheBench are blocked"""
     try:
+        session = session or get_http_session(ip)
         headers = {'User-Agent': 'ApacheBench'}
-        response = requests.get(f"https://{ip}/", 
-                              headers=headers,
-                              timeout=5,
-                              verify=False)
+        response = session.get(f"https://{ip}/", headers=headers, timeout=5, verify=False)
         
         # Check if request is blocked (should not be 200 OK)
         if response.status_code != 200:
@@ -198,11 +428,80 @@ def test_blocked_user_agent(ip):
         logger.error(f"Blocked User-Agent test error: {str(e)}")
         return False
 
-def ensure_instance_running(instance_name, instance_id):
-    """Ensure an AWS instance is running, start it if needed"""
+def wait_until(check, description, timeout, initial_delay=1, max_delay=15):
+    """Poll check() with exponential backoff until it returns a truthy value or the deadline passes"""
+    started = time.monotonic()
+    deadline = started + timeout
+    delay = initial_delay
+    while True:
+        try:
+            result = check()
+        except Exception as e:
+            logger.debug(f"{description} not ready yet: {str(e)}")
+            result = None
+        if result:
+            logger.info(f"{description} ready after {time.monotonic() - started:.1f}s")
+            return result
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            logger.error(f"Timed out after {timeout}s waiting for {description}")
+            return None
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, max_delay)
+
+def check_ssh_banner(ip, port=SSH_PORT, timeout=5):
+    """Return True if the host answers on the SSH port with an SSH banner"""
+    with socket.create_connection((ip, port), timeout=timeout) as sock:
+        sock.settimeout(timeout)
+        return sock.recv(256).startswith(b"SSH-")
+
+def check_https_port(ip, port=443, timeout=5):
+    """Return True if the host completes a TLS handshake on the HTTPS port"""
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    with socket.create_connection((ip, port), timeout=timeout) as sock:
+        with context.wrap_socket(sock, server_hostname=ip):
+            return True
+
+def check_policy_serving(ip, timeout=5):
+    """Return True if the server policy answers HTTPS requests with 200 OK"""
+    response = get_http_session(ip).get(f"https://{ip}/", timeout=timeout, verify=False)
+    return response.status_code == 200
+
+@traced
+def wait_for_instance_state(instance_id, state="running", timeout=INSTANCE_READY_TIMEOUT, cloud="aws"):
+    """Wait for an instance to reach the given state"""
+    return wait_until(
+        lambda: get_instance_state(instance_id, cloud) == state,
+        f"instance {instance_id} state {state}",
+        timeout
+    ) is not None
+
+@traced
+def wait_for_ssh(ip, timeout=INSTANCE_READY_TIMEOUT):
+    """Wait for FortiWeb to accept SSH connections"""
+    return wait_until(lambda: check_ssh_banner(ip), f"SSH on {ip}", timeout) is not None
+
+@traced
+def wait_for_policy(ip, timeout=CONFIG_APPLY_TIMEOUT):
+    """Wait for the pushed server policy to answer HTTPS requests"""
+    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+    return wait_until(
+        lambda: check_https_port(ip) and check_policy_serving(ip),
+        f"server policy on {ip}",
+        timeout,
+        initial_delay=0.5,
+        max_delay=5
+    ) is not None
+
+@traced
+def ensure_instance_running(instance_name, instance_id, cloud="aws"):
+    """Ensure an instance is running, start it if needed"""
     try:
         # Check instance state
-        state = get_instance_state(instance_id)
+        state = get_instance_state(instance_id, cloud)
         if state is None:
             logger.error(f"Could not determine state for {instance_name} instance {instance_id}")
             return False
@@ -210,15 +509,17 @@ def ensure_instance_running(instance_name, instance_id):
         if state == "running":
             logger.info(f"{instance_name} instance {instance_id} is already running")
             return True
-        elif state == "stopped":
-            # Start the instance
-            if not start_instance(instance_id):
+        elif state in ("stopped", "starting"):
+            # Start the instance unless it is already on its way up
+            if state == "stopped" and not start_instance(instance_id, cloud):
                 logger.error(f"Failed to start {instance_name} instance {instance_id}")
                 return False
                 
-            # Wait for 120 seconds
-            logger.info("Waiting 120 seconds for instance to start...")
-            time.sleep(120)
+            # Wait until the instance reports running instead of a fixed delay
+            logger.info("Waiting for instance to start...")
+            if not wait_for_instance_state(instance_id, "running", cloud=cloud):
+                logger.error(f"{instance_name} instance {instance_id} did not reach running state")
+                return False
             
             # Refresh Terraform state
             if not refresh_terraform_state():
@@ -232,18 +533,22 @@ def ensure_instance_running(instance_name, instance_id):
         logger.error(f"Error ensuring {instance_name} instance is running: {str(e)}")
         return False
 
+@traced
 def run_tests_for_instance(instance_name, ip):
     """Run all tests for a specific FortiWeb instance"""
     logger.info(f"Running tests for {instance_name} at {ip}")
     
-    # Verify HTTP connectivity
+    # All checks share one keep-alive session so only the first pays the TLS handshake
     urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-    if not test_http_healthcheck(ip):
+    session = get_http_session(ip)
+
+    # Verify HTTP connectivity
+    if not test_http_healthcheck(ip, session):
         logger.error(f"Health check failed for {instance_name}")
         return False
         
     # Test that requests with blocked User-Agent are rejected
-    if not test_blocked_user_agent(ip):
+    if not test_blocked_user_agent(ip, session):
         logger.error(f"Blocked User-Agent test failed for {instance_name}")
         return False
         
@@ -1,4 +1,3 @@
-import time
 import urllib3
 import os
 from dotenv import load_dotenv
@@ -8,6 +7,9 @@ from tests.common.test_utils import (
     get_public_ip,
     process_template,
     configure_fortiweb,
+    ensure_instance_running,
+    wait_for_ssh,
+    wait_for_policy,
     run_tests_for_instance,
     logger
 )
@@ -31,8 +33,15 @@ if __name__ == "__main__":
         # Process template to generate config content in memory
         config_content = process_template(CONFIG_TEMPLATE_PATH, server_pool_ip)
         
-        # Get instance IDs and public IPs from Terraform output
+        # Get instance IDs from Terraform output
         byol_instance_id = get_instance_id("oci_byol_instance_hostname")
+        
+        # Ensure the instance is running (stopped instances are started)
+        if byol_instance_id and not ensure_instance_running("BYOL", byol_instance_id, cloud="oci"):
+            logger.error("Cannot proceed with BYOL instance")
+            exit(1)
+        
+        # Get public IP from Terraform output after any start
         byol_ip = get_public_ip("fwb_oci_byol_public_ip")
         
         # Note: Only testing BYOL as there is no PAYG for OCI
@@ -40,11 +49,15 @@ if __name__ == "__main__":
         # Configure BYOL instance if available
         if byol_ip:
             logger.info(f"Connecting to FortiWeb BYOL at {byol_ip}")
+            if not wait_for_ssh(byol_ip):
+                logger.error("FortiWeb BYOL SSH is not reachable")
+                exit(1)
             configure_fortiweb(byol_ip, USERNAME, PASSWORD, config_content)
             
             # Wait for configuration to be applied before testing
             logger.info("Waiting for BYOL configuration to be applied...")
-            time.sleep(5)  # Wait for 5 seconds
+            if not wait_for_policy(byol_ip):
+                logger.warning("BYOL policy is not serving yet, running tests anyway")
         else:
             logger.error("Cannot proceed without a valid BYOL public IP")
             exit(1)
@@ -0,0 +1,209 @@
+import argparse
+import os
+import time
+import urllib3
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dotenv import load_dotenv
+from scripts.fwb_trace import span, start_trace
+from tests.common.attack_replay import replay_corpus, replay_passed, log_replay_report
+from tests.common.lifecycle import ensure_instances_running
+from tests.common.load_test import run_load_test, log_load_report
+from tests.common.test_utils import (
+    get_server_pool_ip,
+    get_instance_id,
+    get_public_ip,
+    process_template,
+    configure_fortiweb,
+    wait_for_ssh,
+    wait_for_policy,
+    run_tests_for_instance,
+    close_ssh_sessions,
+    logger
+)
+
+# Disable warnings for self-signed certificates
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+CONFIG_TEMPLATE_PATH = "config/cloud-server-policy.conf.template"  # Path to template file
+DEFAULT_MAX_WORKERS = 8
+
+# Terraform outputs and credentials for every cloud the orchestrator knows about
+CLOUD_TARGETS = {
+    "aws": {
+        "username_env": "FORTIWEB_AWS_USERNAME",
+        "password_env": "FORTIWEB_AWS_PASSWORD",
+        "server_pool_env": "AWS_SERVER_POOL_IP",
+        "instances": {
+            "BYOL": ("aws_byol_instance_hostname", "fwb_aws_byol_public_ip"),
+            "PAYG": ("aws_payg_instance_hostname", "fwb_aws_payg_public_ip"),
+        },
+    },
+    "azure": {
+        "username_env": "FORTIWEB_AZURE_USERNAME",
+        "password_env": "FORTIWEB_AZURE_PASSWORD",
+        "server_pool_env": "AZURE_SERVER_POOL_IP",
+        "instances": {
+            "BYOL": ("azure_byol_instance_hostname", "fwb_azure_byol_public_ip"),
+            "PAYG": ("azure_payg_instance_hostname", "fwb_azure_payg_public_ip"),
+        },
+    },
+    "oci": {
+        "username_env": "FORTIWEB_OCI_USERNAME",
+        "password_env": "FORTIWEB_OCI_PASSWORD",
+        "server_pool_env": "OCI_SERVER_POOL_IP",
+        "instances": {
+            "BYOL": ("oci_byol_instance_hostname", "fwb_oci_byol_public_ip"),
+        },
+    },
+}
+
+def discover_instances(clouds):
+    """Find every provisioned instance for the given clouds from terraform output"""
+    targets = []
+    for cloud in clouds:
+        spec = CLOUD_TARGETS[cloud]
+        cloud_targets = []
+        for license_type, (id_output, ip_output) in spec["instances"].items():
+            instance_id = get_instance_id(id_output)
+            if not instance_id:
+                logger.info(f"{cloud.upper()} {license_type} instance not provisioned, skipping")
+                continue
+            cloud_targets.append({
+                "cloud": cloud,
+                "name": f"{cloud.upper()} {license_type}",
+                "instance_id": instance_id,
+                "ip_output": ip_output,
+            })
+
+        if not cloud_targets:
+            continue
+
+        # Credentials and config are only required for clouds that actually have instances
+        server_pool_ip = get_server_pool_ip(spec["server_pool_env"])
+        config_content = process_template(CONFIG_TEMPLATE_PATH, server_pool_ip)
+        for target in cloud_targets:
+            target["username"] = os.environ[spec["username_env"]]
+            target["password"] = os.environ[spec["password_env"]]
+            target["config_content"] = config_content
+        targets.extend(cloud_targets)
+    return targets
+
+def start_instances(targets):
+    """Start all stopped instances across clouds in one batch before any worker runs"""
+    running = ensure_instances_running((target["cloud"], target["instance_id"]) for target in targets)
+    for target in targets:
+        target["running"] = running.get((target["cloud"], target["instance_id"]), False)
+
+def run_instance(target, load_options=None, attack_options=None, incremental=False):
+    """Configure and test a single FortiWeb instance, returning a result record"""
+    name = target["name"]
+    started = time.monotonic()
+    result = {"name": name, "passed": False, "error": None, "duration": 0.0, "load": None, "attack": None}
+    try:
+        with span(name, cloud=target["cloud"], instance_id=target["instance_id"]):
+            if not target["running"]:
+                raise RuntimeError(f"Cannot proceed with {name} instance")
+
+            # Public IP is read after the instance is running since it may change on start
+            ip = get_public_ip(target["ip_output"])
+            if not ip:
+                raise RuntimeError(f"No valid public IP for {name}")
+
+            logger.info(f"Connecting to FortiWeb {name} at {ip}")
+            if not wait_for_ssh(ip):
+                raise RuntimeError(f"FortiWeb {name} SSH is not reachable")
+            configure_fortiweb(ip, target["username"], target["password"], target["config_content"], incremental)
+
+            # Wait for configuration to be applied before testing
+            logger.info(f"Waiting for {name} configuration to be applied...")
+            if not wait_for_policy(ip):
+                logger.warning(f"{name} policy is not serving yet, running tests anyway")
+
+            result["passed"] = run_tests_for_instance(name, ip)
+
+            # Optional attack corpus replay, any attack that gets through or gets no answer fails the instance
+            if result["passed"] and attack_options:
+                result["attack"] = replay_corpus(ip, **attack_options)
+                result["passed"] = replay_passed(result["attack"])
+
+            # Optional throughput/latency run once the functional checks pass
+            if result["passed"] and load_options:
+                result["load"] = run_load_test(ip, **load_options)
+    except Exception as e:
+        logger.error(f"{name} failed: {str(e)}")
+        result["error"] = str(e)
+    result["duration"] = time.monotonic() - started
+    return result
+
+def run_all(targets, max_workers=DEFAULT_MAX_WORKERS, load_options=None, attack_options=None, incremental=False):
+    """Run configure + tests for all targets concurrently on a bounded thread pool"""
+    results = []
+    if not targets:
+        return results
+    try:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(targets))) as executor:
+            futures = [executor.submit(run_instance, target, load_options, attack_options, incremental) for target in targets]
+            for future in as_completed(futures):
+                results.append(future.result())
+    finally:
+        close_ssh_sessions()
+    return sorted(results, key=lambda r: r["name"])
+
+def report_results(results):
+    """Log a per-instance summary and return True if every instance passed"""
+    logger.info("=== Test summary ===")
+    for result in results:
+        status = "PASSED" if result["passed"] else "FAILED"
+        detail = f" ({result['error']})" if result["error"] else ""
+        logger.info(f"{result['name']}: {status} in {result['duration']:.1f}s{detail}")
+        if result["attack"]:
+            log_replay_report(result["name"], result["attack"])
+        if result["load"]:
+            log_load_report(result["name"], result["load"])
+    return bool(results) and all(result["passed"] for result in results)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Configure and test all provisioned FortiWeb instances concurrently.")
+    parser.add_argument("--clouds", nargs="+", choices=sorted(CLOUD_TARGETS), default=list(CLOUD_TARGETS), help="Clouds to test")
+    parser.add_argument("--max-workers", type=int, default=DEFAULT_MAX_WORKERS, help="Maximum number of instances tested at once")
+    parser.add_argument("--incremental", action="store_true", help="Only push config blocks that differ from the running config")
+    parser.add_argument("--attack-corpus", help="Replay this JSON-lines attack corpus against each instance after the checks")
+    parser.add_argument("--attack-concurrency", type=int, default=10, help="Concurrent connections per instance during the attack replay")
+    parser.add_argument("--load-duration", type=float, default=0, help="Run a load test of this many seconds per instance after the checks (0 disables)")
+    parser.add_argument("--load-concurrency", type=int, default=10, help="Concurrent connections per instance during the load test")
+    parser.add_argument("--load-rate", type=float, help="Target request rate per instance in req/s (default: as fast as possible)")
+    parser.add_argument("--load-processes", type=int, default=1, help="Worker processes per instance during the load test")
+    parser.add_argument("--trace", help="Write a Chrome trace of the run's timing spans to this JSON file")
+
+    args = parser.parse_args()
+    if args.trace:
+        start_trace(args.trace)
+
+    # Load environment variables
+    load_dotenv()
+
+    try:
+        targets = discover_instances(args.clouds)
+        if not targets:
+            logger.error("No provisioned FortiWeb instances found")
+            exit(1)
+
+        logger.info(f"Testing {len(targets)} instance(s): {', '.join(t['name'] for t in targets)}")
+        start_instances(targets)
+        load_options = None
+        if args.load_duration > 0:
+            load_options = {
+                "duration": args.load_duration,
+                "concurrency": args.load_concurrency,
+                "rate": args.load_rate,
+                "processes": args.load_processes,
+            }
+        attack_options = None
+        if args.attack_corpus:
+            attack_options = {"corpus_path": args.attack_corpus, "concurrency": args.attack_concurrency}
+        results = run_all(targets, args.max_workers, load_options, attack_options, args.incremental)
+        if not report_results(results):
+            exit(1)
+    except Exception as e:
+        logger.error(f"Orchestration failed: {str(e)}")
+        exit(1)